@@ -1,25 +1,34 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, session
+from flask import Blueprint, Flask, Response, render_template, request, jsonify, redirect, url_for, flash, session
 from flask_wtf import FlaskForm
 from wtforms import StringField, SelectField, DateField, IntegerField, SubmitField, BooleanField
 from wtforms.validators import DataRequired, Length, ValidationError
 from datetime import datetime, timedelta
+from urllib.parse import quote
+import itertools
 import logging
 import os
 from database import db_manager
 from registration import registration_manager
 from sqlite_backup import sqlite_backup_manager
+from backup_scheduler import backup_scheduler
+from room_cache import room_cache
+from availability import availability_index
+from kitchen_report import kitchen_report
+from export import data_exporter, EXPORT_TABLES, EXPORT_FORMATS
+from webhook import create_webhook_blueprint
+from metrics import instrument_app
+from profiler import profiler, parse_control, instrument_app as instrument_profiler
+from config import WEBHOOK_IN_APP, ADMIN_TABLE_PAGE_SIZE, print_config_status
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Инициализация Flask приложения
-app = Flask(__name__)
-app.config['SECRET_KEY'] = 'your-secret-key-here'
-app.config['WTF_CSRF_ENABLED'] = True
+# Маршруты приложения; экземпляр Flask создает create_app()
+blueprint = Blueprint('main', __name__)
 
 # Инициализация менеджеров
 db_manager_instance = db_manager
@@ -59,7 +68,7 @@ class MealForm(FlaskForm):
     dinner_children = IntegerField('Ужин (дети)', default=0, validators=[DataRequired()])
 
 # Маршруты
-@app.route('/')
+@blueprint.route('/')
 def index():
     """Главная страница (админ)"""
     try:
@@ -71,12 +80,12 @@ def index():
         flash('Ошибка загрузки данных', 'error')
         return render_template('index.html', stats={})
 
-@app.route('/client')
+@blueprint.route('/client')
 def client_index():
     """Клиентская главная страница"""
     return render_template('client_index.html')
 
-@app.route('/register', methods=['GET', 'POST'])
+@blueprint.route('/register', methods=['GET', 'POST'])
 def register():
     """Страница регистрации"""
     form = RegistrationForm()
@@ -114,7 +123,7 @@ def register():
                     'representative_name': form.representative_name.data
                 }
                 
-                return redirect(url_for('meals'))
+                return redirect(url_for('main.meals'))
                 
             except Exception as e:
                 logger.error(f"Ошибка при регистрации: {e}")
@@ -122,7 +131,7 @@ def register():
     
     return render_template('register.html', form=form, datetime=datetime)
 
-@app.route('/client/register', methods=['GET', 'POST'])
+@blueprint.route('/client/register', methods=['GET', 'POST'])
 def client_register():
     """Клиентская страница регистрации"""
     form = RegistrationForm()
@@ -160,7 +169,7 @@ def client_register():
                     'representative_name': form.representative_name.data
                 }
                 
-                return redirect(url_for('client_meals'))
+                return redirect(url_for('main.client_meals'))
                 
             except Exception as e:
                 logger.error(f"Ошибка при регистрации: {e}")
@@ -168,12 +177,12 @@ def client_register():
     
     return render_template('client_register.html', form=form, datetime=datetime)
 
-@app.route('/meals', methods=['GET', 'POST'])
+@blueprint.route('/meals', methods=['GET', 'POST'])
 def meals():
     """Страница заполнения питания"""
     if 'registration_data' not in session:
         flash('Сначала заполните данные регистрации', 'error')
-        return redirect(url_for('register'))
+        return redirect(url_for('main.register'))
     
     reg_data = session['registration_data']
     
@@ -209,7 +218,7 @@ def meals():
                 # Очищаем сессию
                 session.pop('registration_data', None)
                 flash('Регистрация успешно завершена!', 'success')
-                return redirect(url_for('success'))
+                return redirect(url_for('main.success'))
             else:
                 flash(f'Ошибка при сохранении: {result["error"]}', 'error')
                 
@@ -221,12 +230,12 @@ def meals():
                          registration_data=reg_data, 
                          dates=dates)
 
-@app.route('/client/meals', methods=['GET', 'POST'])
+@blueprint.route('/client/meals', methods=['GET', 'POST'])
 def client_meals():
     """Клиентская страница заполнения питания"""
     if 'registration_data' not in session:
         flash('Сначала заполните данные регистрации', 'error')
-        return redirect(url_for('client_register'))
+        return redirect(url_for('main.client_register'))
     
     reg_data = session['registration_data']
     
@@ -262,7 +271,7 @@ def client_meals():
                 # Очищаем сессию
                 session.pop('registration_data', None)
                 flash('Регистрация успешно завершена!', 'success')
-                return redirect(url_for('client_success'))
+                return redirect(url_for('main.client_success'))
             else:
                 flash(f'Ошибка при сохранении: {result["error"]}', 'error')
                 
@@ -274,17 +283,17 @@ def client_meals():
                          registration_data=reg_data, 
                          dates=dates)
 
-@app.route('/success')
+@blueprint.route('/success')
 def success():
     """Страница успешной регистрации (админ)"""
     return render_template('success.html')
 
-@app.route('/client/success')
+@blueprint.route('/client/success')
 def client_success():
     """Клиентская страница успешной регистрации"""
     return render_template('client_success.html')
 
-@app.route('/admin')
+@blueprint.route('/admin')
 def admin():
     """Административная панель"""
     try:
@@ -295,7 +304,118 @@ def admin():
         flash('Ошибка загрузки данных', 'error')
         return render_template('admin.html', stats={})
 
-@app.route('/api/check_room')
+@blueprint.route('/kitchen')
+def kitchen():
+    """Отчет для кухни: количество порций по дням и корпусам"""
+    today = datetime.now().date()
+    try:
+        start_date = datetime.strptime(request.args.get('start', today.strftime('%Y-%m-%d')), '%Y-%m-%d').date()
+        end_date = datetime.strptime(
+            request.args.get('end', (today + timedelta(days=6)).strftime('%Y-%m-%d')), '%Y-%m-%d'
+        ).date()
+    except ValueError:
+        flash('Неверный формат даты', 'error')
+        start_date, end_date = today, today + timedelta(days=6)
+    if end_date < start_date:
+        flash('Дата окончания раньше даты начала', 'error')
+        end_date = start_date
+    building = request.args.get('building') or None
+    
+    try:
+        report = kitchen_report.get_forecast(start_date, end_date, building)
+    except Exception as e:
+        logger.error(f"Ошибка формирования отчета для кухни: {e}")
+        flash('Ошибка формирования отчета', 'error')
+        report = None
+    return render_template('kitchen.html', report=report, buildings=get_available_buildings(),
+                           start_date=start_date, end_date=end_date, building=building)
+
+@blueprint.route('/tables')
+def tables():
+    """Просмотр таблиц БД по страницам (keyset-пагинация) с поиском по ФИО и номеру"""
+    table_name = request.args.get('table') or None
+    search = request.args.get('q', '').strip()
+    cursor = request.args.get('cursor') or None
+    table_list, page, search_mode, row_count = [], None, None, None
+    try:
+        table_list = db_manager_instance.get_tables()
+        table_name = table_name or ('посетители' if 'посетители' in table_list else next(iter(table_list), None))
+        if table_name:
+            page = db_manager_instance.get_table_page(table_name, ADMIN_TABLE_PAGE_SIZE, cursor, search or None)
+            search_mode = page['search_mode']
+            row_count = db_manager_instance.row_counts.get(table_name)
+    except ValueError as e:
+        flash(str(e), 'error')
+    except Exception as e:
+        logger.error(f"Ошибка просмотра таблицы {table_name}: {e}")
+        flash('Ошибка загрузки данных', 'error')
+    return render_template('tables.html', tables=table_list, table_name=table_name, page=page,
+                           search=search, cursor=cursor, search_mode=search_mode, row_count=row_count)
+
+@blueprint.route('/slow_queries')
+def slow_queries():
+    """Журнал медленных запросов к БД с планами выполнения"""
+    slow_log = db_manager_instance.slow_queries
+    threshold_ms = slow_log.threshold * 1000 if slow_log.threshold is not None else None
+    return render_template('slow_queries.html', entries=slow_log.get_entries(), threshold_ms=threshold_ms,
+                           recorded_total=slow_log.recorded_total)
+
+@blueprint.route('/export/<table_name>')
+def export_data(table_name):
+    """Потоковая выгрузка таблицы в CSV или XLSX с фильтрами по датам и корпусу"""
+    export_format = request.args.get('format', 'csv')
+    if table_name not in EXPORT_TABLES or export_format not in EXPORT_FORMATS:
+        flash('Неизвестная таблица или формат экспорта', 'error')
+        return redirect(url_for('main.admin'))
+    
+    try:
+        filters = {
+            'start_date': datetime.strptime(request.args['start'], '%Y-%m-%d').date() if request.args.get('start') else None,
+            'end_date': datetime.strptime(request.args['end'], '%Y-%m-%d').date() if request.args.get('end') else None,
+            'building': request.args.get('building') or None,
+        }
+        chunks = data_exporter.iter_export(table_name, export_format, **filters)
+        # Первый блок читаем до отправки заголовков, чтобы ошибка БД вернулась как обычная страница
+        first_chunk = next(chunks, b'')
+    except Exception as e:
+        logger.error(f"Ошибка экспорта таблицы {table_name}: {e}")
+        flash('Ошибка экспорта данных', 'error')
+        return redirect(url_for('main.admin'))
+    
+    filename = data_exporter.make_filename(table_name, export_format, **filters)
+    return Response(
+        itertools.chain([first_chunk], chunks),
+        mimetype=EXPORT_FORMATS[export_format],
+        headers={'Content-Disposition': f"attachment; filename*=UTF-8''{quote(filename)}"}
+    )
+
+@blueprint.route('/api/backup_status')
+def backup_status():
+    """API состояния фонового резервного копирования"""
+    status = backup_scheduler.get_status()
+    status['metrics'] = backup_manager.get_backup_metrics()
+    return jsonify(status)
+
+@blueprint.route('/api/profiling', methods=['GET', 'POST'])
+def profiling():
+    """API выборочного профилирования: состояние (GET), включение и выключение (POST enabled=1|0, sample_rate)
+    
+    Действует только в процессе, обработавшем запрос; при нескольких воркерах используйте PROFILE_ENABLED.
+    """
+    if request.method == 'POST':
+        try:
+            enabled, sample_rate = parse_control(request.values)
+            if enabled:
+                profiler.enable(sample_rate)
+            elif sample_rate is not None:
+                profiler.set_sample_rate(sample_rate)
+            if enabled is False:
+                profiler.disable()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+    return jsonify(profiler.get_status())
+
+@blueprint.route('/api/check_room')
 def check_room():
     """API для проверки доступности номера"""
     try:
@@ -309,7 +429,7 @@ def check_room():
         logger.error(f"Ошибка проверки номера: {e}")
         return jsonify({'available': False, 'error': str(e)})
 
-@app.route('/api/get_rooms/<building>')
+@blueprint.route('/api/get_rooms/<building>')
 def get_rooms(building):
     """API для получения номеров в корпусе"""
     try:
@@ -319,13 +439,34 @@ def get_rooms(building):
         logger.error(f"Ошибка получения номеров: {e}")
         return jsonify([])
 
+@blueprint.route('/api/availability')
+def availability():
+    """API для проверки свободных номеров на период (все номера или номера корпуса)"""
+    try:
+        check_in = datetime.strptime(request.args.get('check_in'), '%Y-%m-%d').date()
+        check_out = datetime.strptime(request.args.get('check_out'), '%Y-%m-%d').date()
+        building = request.args.get('building')
+        
+        if check_out < check_in:
+            return jsonify({'error': 'Дата отъезда раньше даты заезда'}), 400
+        
+        rooms = get_rooms_in_building(building) if building else None
+        rooms_availability = availability_index.get_availability(check_in, check_out, rooms)
+        return jsonify({
+            'check_in': check_in.strftime('%Y-%m-%d'),
+            'check_out': check_out.strftime('%Y-%m-%d'),
+            'rooms': rooms_availability,
+            'free_rooms': [room for room, free in rooms_availability.items() if free]
+        })
+    except Exception as e:
+        logger.error(f"Ошибка проверки свободных номеров: {e}")
+        return jsonify({'error': str(e)}), 400
+
 # Вспомогательные функции
 def get_available_buildings():
     """Получение списка доступных корпусов"""
     try:
-        cursor = db_manager_instance.connection.cursor()
-        cursor.execute('SELECT DISTINCT SUBSTRING(номер, 1, POSITION(\'/\' IN номер)-1) as building FROM "справочник номеров" ORDER BY building')
-        buildings = [row[0] for row in cursor.fetchall()]
+        buildings = room_cache.get_buildings()
         return buildings
     except Exception as e:
         logger.error(f"Ошибка получения корпусов: {e}")
@@ -334,10 +475,7 @@ def get_available_buildings():
 def get_rooms_in_building(building):
     """Получение номеров в корпусе"""
     try:
-        cursor = db_manager_instance.connection.cursor()
-        cursor.execute('SELECT номер FROM "справочник номеров" WHERE номер LIKE %s ORDER BY номер', (f"{building}/%",))
-        rooms = [row[0] for row in cursor.fetchall()]
-        return rooms
+        return room_cache.get_rooms_in_building(building)
     except Exception as e:
         logger.error(f"Ошибка получения номеров: {e}")
         return []
@@ -345,15 +483,9 @@ def get_rooms_in_building(building):
 def check_room_availability(room, check_in, check_out):
     """Проверка доступности номера"""
     try:
-        cursor = db_manager_instance.connection.cursor()
-        cursor.execute("""
-            SELECT ФИО, дата FROM посетители 
-            WHERE номер = %s AND дата BETWEEN %s AND %s
-        """, (room, check_in.strftime('%Y-%m-%d'), check_out.strftime('%Y-%m-%d')))
-        
-        conflicts = cursor.fetchall()
+        conflicts = availability_index.get_conflicts(room, check_in, check_out)
         if conflicts:
-            conflict_dates = [f"{conflict[1]} ({conflict[0]})" for conflict in conflicts]
+            conflict_dates = [f"{conflict['дата']} ({conflict['ФИО']})" for conflict in conflicts]
             return {
                 'available': False, 
                 'conflicts': ', '.join(conflict_dates)
@@ -366,27 +498,34 @@ def check_room_availability(room, check_in, check_out):
 def save_registration(reg_data, meals_data):
     """Сохранение регистрации в базу данных"""
     try:
-        cursor = db_manager_instance.connection.cursor()
+        records = [
+            {
+                'номер': reg_data['room'],
+                'дата': date_str,
+                'ФИО': reg_data['representative_name'],
+                'зв': meals['breakfast_adults'],
+                'зд': meals['breakfast_children'],
+                'ов': meals['lunch_adults'],
+                'од': meals['lunch_children'],
+                'ув': meals['dinner_adults'],
+                'уд': meals['dinner_children']
+            }
+            for date_str, meals in meals_data.items()
+        ]
         
-        for date_str, meals in meals_data.items():
-            cursor.execute("""
-                INSERT INTO посетители (номер, дата, ФИО, зд, зв, од, ов, уд, ув)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """, (
-                reg_data['room'],
-                date_str,
-                reg_data['representative_name'],
-                meals['breakfast_adults'],
-                meals['breakfast_children'],
-                meals['lunch_adults'],
-                meals['lunch_children'],
-                meals['dinner_adults'],
-                meals['dinner_children']
-            ))
+        # Все дни сохраняются одним запросом и одной транзакцией
+        inserted_flags = db_manager_instance.insert_visitor_records(records)
+        saved_count = sum(inserted_flags)
+        skipped_count = len(records) - saved_count
         
-        db_manager_instance.connection.commit()
-        logger.info(f"Регистрация сохранена: {reg_data['representative_name']} в {reg_data['room']}")
-        return {'success': True}
+        if saved_count == 0:
+            return {'success': False, 'error': 'Регистрация на эти даты уже существует'}
+        
+        logger.info(
+            f"Регистрация сохранена: {reg_data['representative_name']} в {reg_data['room']} "
+            f"(сохранено {saved_count}, пропущено {skipped_count})"
+        )
+        return {'success': True, 'saved': saved_count, 'skipped': skipped_count}
         
     except Exception as e:
         logger.error(f"Ошибка сохранения регистрации: {e}")
@@ -394,21 +533,22 @@ def save_registration(reg_data, meals_data):
 
 def get_statistics():
     """Получение статистики"""
+    statements = db_manager_instance.statements
     try:
-        cursor = db_manager_instance.connection.cursor()
-        
-        # Общее количество записей
-        cursor.execute("SELECT COUNT(*) FROM посетители")
-        total_records = cursor.fetchone()[0]
-        
-        # Количество номеров
-        cursor.execute('SELECT COUNT(*) FROM "справочник номеров"')
-        total_rooms = cursor.fetchone()[0]
-        
-        # Записи за сегодня
-        today = datetime.now().strftime('%Y-%m-%d')
-        cursor.execute("SELECT COUNT(*) FROM посетители WHERE дата = %s", (today,))
-        today_records = cursor.fetchone()[0]
+        # Три подготовленных запроса на одном соединении из пула
+        with db_manager_instance.get_cursor() as cursor:
+            # Общее количество записей (по сводке питания, без просмотра всех посетителей)
+            statements.execute(cursor, 'stats_total_records')
+            total_records = cursor.fetchone()[0]
+            
+            # Количество номеров
+            statements.execute(cursor, 'stats_total_rooms')
+            total_rooms = cursor.fetchone()[0]
+            
+            # Записи за сегодня
+            today = datetime.now().date()
+            statements.execute(cursor, 'stats_today_records', (today,))
+            today_records = cursor.fetchone()[0]
         
         return {
             'total_records': total_records,
@@ -420,25 +560,49 @@ def get_statistics():
         return {}
 
 # Обработчики ошибок
-@app.errorhandler(404)
+@blueprint.app_errorhandler(404)
 def not_found_error(error):
     return render_template('404.html'), 404
 
-@app.errorhandler(500)
+@blueprint.app_errorhandler(500)
 def internal_error(error):
     return render_template('500.html'), 500
 
+def create_app() -> Flask:
+    """Фабрика приложения: экземпляр Flask, маршруты, показатели и резервная копия SQLite
+    
+    Используется WSGI-сервером (python serve.py app) и запуском для разработки.
+    """
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = 'your-secret-key-here'
+    app.config['WTF_CSRF_ENABLED'] = True
+    
+    # Время обработки запросов по endpoint и показатели в формате Prometheus на /metrics
+    instrument_app(app, 'app')
+    # Выборочное профилирование запросов (PROFILE_ENABLED=1 или /api/profiling)
+    instrument_profiler(app, 'app')
+    
+    app.register_blueprint(blueprint)
+    # Прием обновлений Telegram-бота этим же приложением (режим webhook)
+    if WEBHOOK_IN_APP:
+        from bot import dispatcher as bot_dispatcher
+        app.register_blueprint(create_webhook_blueprint(bot_dispatcher))
+    
+    # Создание резервной копии; к базе данных приложение подключается при первом запросе
+    backup_manager.create_backup()
+    return app
+
 if __name__ == '__main__':
+    print_config_status()
     try:
         # Инициализация базы данных
         if not db_manager_instance.is_connected():
             db_manager_instance.connect()
-        
-        # Создание резервной копии
-        backup_manager.create_backup()
+        app = create_app()
         
         print("✅ Подключение к базе данных установлено")
         print("✅ Резервная копия создана")
+        print("💡 Сервер разработки; для рабочего запуска: python serve.py app")
         
         # Запуск приложения
         app.run(host='0.0.0.0', port=5000, debug=True)
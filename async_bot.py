@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Асинхронный запуск телеграм-бота (AsyncTeleBot + asyncpg)
+
+Альтернатива bot.py: все диалоги обслуживаются одним циклом событий, без потока
+на пользователя. Регистрация идет через AsyncRegistrationManager, запросы к БД -
+через AsyncDatabaseManager. Просмотр таблиц и отчет для кухни используют
+синхронные отчеты и выполняются в пуле потоков.
+
+Запуск: python async_bot.py
+"""
+
+import asyncio
+import datetime
+import logging
+import weakref
+from contextlib import asynccontextmanager
+from telebot.async_telebot import AsyncTeleBot
+from config import BOT_TOKEN, BOT_POLL_TIMEOUT, print_config_status
+from database import db_manager
+from kitchen_report import kitchen_report
+from user_state import UserState, user_state_store
+from async_database import async_db_manager
+from async_registration import async_registration_manager
+from table_browser import table_browser
+from bot_views import (
+    WELCOME_TEXT, HELP_TEXT, UNKNOWN_COMMAND_TEXT, MESSAGE_ERROR_TEXT, TABLE_SEARCH_PROMPT_TEXT,
+    TABLE_BROWSE_EXPIRED_TEXT, main_menu_markup, tables_view, table_info_view, table_page_view,
+    kitchen_report_view
+)
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+bot = AsyncTeleBot(BOT_TOKEN)
+
+# AsyncTeleBot обрабатывает пачку обновлений параллельно: сообщения одного пользователя
+# упорядочиваются блокировкой, которая живет, пока её кто-то держит или ждет
+_user_locks: 'weakref.WeakValueDictionary[int, asyncio.Lock]' = weakref.WeakValueDictionary()
+
+
+@asynccontextmanager
+async def user_session(user_id: int):
+    """Состояние пользователя на время обработки сообщения с сохранением по выходу"""
+    lock = _user_locks.get(user_id)
+    if lock is None:
+        lock = _user_locks[user_id] = asyncio.Lock()
+    async with lock:
+        # Хранилище держит состояния в памяти; запись на диск идет в его фоновом потоке
+        user_state = user_state_store.get(user_id)
+        logger.info(f"Получено состояние пользователя {user_id}: current_state={user_state.current_state}, current_step={user_state.current_step}")
+        yield user_state
+        user_state_store.save(user_id, user_state)
+
+
+def reset_user_state(user_state: UserState) -> None:
+    """Выход из текущего диалога"""
+    user_state.current_state = None
+    user_state.current_step = None
+    user_state.registration_data.clear()
+    table_browser.close(user_state)
+
+
+@bot.message_handler(commands=['start'])
+async def start_command(message):
+    """Обработчик команды /start"""
+    async with user_session(message.from_user.id) as user_state:
+        reset_user_state(user_state)
+    
+    await bot.reply_to(message, WELCOME_TEXT, reply_markup=main_menu_markup())
+
+
+@bot.message_handler(commands=['help'])
+async def help_command(message):
+    """Обработчик команды /help"""
+    await bot.reply_to(message, HELP_TEXT, parse_mode='HTML')
+
+
+@bot.message_handler(commands=['cancel'])
+async def cancel_command(message):
+    """Обработчик команды /cancel"""
+    async with user_session(message.from_user.id) as user_state:
+        reset_user_state(user_state)
+    
+    await bot.reply_to(message, "❌ Операция отменена. Выберите действие:", reply_markup=main_menu_markup())
+
+
+@bot.message_handler(commands=['register'])
+async def register_command(message):
+    """Обработчик команды /register"""
+    await start_registration(message)
+
+
+@bot.message_handler(commands=['tables'])
+async def tables_command(message):
+    """Обработчик команды /tables"""
+    await show_tables(message)
+
+
+async def start_registration(message):
+    """Начало процесса регистрации"""
+    async with user_session(message.from_user.id) as user_state:
+        user_state.current_state = "registration"
+        user_state.current_step = "start"
+        step_result, text, markup = await async_registration_manager.process_step(message, user_state)
+    
+    if step_result == 'error':
+        await bot.reply_to(message, text, parse_mode='HTML')
+        return
+    
+    await bot.reply_to(message, text, parse_mode='HTML', reply_markup=markup)
+
+
+async def show_tables(message):
+    """Показать список таблиц базы данных"""
+    try:
+        tables = await asyncio.to_thread(db_manager.get_tables)
+        
+        if not tables:
+            await bot.reply_to(message, "📭 В базе данных нет таблиц.")
+            return
+        
+        text, markup = tables_view(tables, db_manager.demo_mode)
+        await bot.reply_to(message, text, parse_mode='HTML', reply_markup=markup)
+    
+    except Exception as e:
+        logger.error(f"Ошибка при получении таблиц: {e}")
+        await bot.reply_to(message, "❌ Ошибка при подключении к базе данных.")
+
+
+@bot.callback_query_handler(func=lambda call: call.data.startswith('table_'))
+async def handle_table_selection(call):
+    """Обработчик выбора таблицы"""
+    table_name = call.data.replace('table_', '')
+    
+    try:
+        table_info = await asyncio.to_thread(db_manager.get_table_info, table_name)
+        text, markup = table_info_view(table_name, table_info)
+        await bot.edit_message_text(
+            text, call.message.chat.id, call.message.message_id, parse_mode='HTML', reply_markup=markup
+        )
+    except Exception as e:
+        logger.error(f"Ошибка при получении информации о таблице {table_name}: {e}")
+        await bot.answer_callback_query(call.id, "❌ Ошибка при получении информации о таблице")
+
+
+@bot.callback_query_handler(func=lambda call: call.data.startswith('data_'))
+async def handle_data_view(call):
+    """Обработчик просмотра данных таблицы: первая страница"""
+    table_name = call.data.replace('data_', '')
+    
+    try:
+        async with user_session(call.from_user.id) as user_state:
+            page = await asyncio.to_thread(table_browser.open, user_state, table_name)
+        
+        if not page['rows']:
+            await bot.answer_callback_query(call.id, "📭 Таблица пуста")
+            return
+        
+        text, markup = table_page_view(page)
+        await bot.edit_message_text(
+            text, call.message.chat.id, call.message.message_id, parse_mode='HTML', reply_markup=markup
+        )
+    except Exception as e:
+        logger.error(f"Ошибка при получении данных таблицы {table_name}: {e}")
+        await bot.answer_callback_query(call.id, "❌ Ошибка при получении данных")
+
+
+@bot.callback_query_handler(func=lambda call: call.data in ('page_next', 'page_prev', 'page_reset'))
+async def handle_table_page(call):
+    """Обработчик перехода по страницам таблицы и сброса поиска"""
+    moves = {
+        'page_next': table_browser.next_page,
+        'page_prev': table_browser.previous_page,
+        'page_reset': table_browser.reset_search,
+    }
+    try:
+        async with user_session(call.from_user.id) as user_state:
+            page = await asyncio.to_thread(moves[call.data], user_state)
+        
+        if page is None:
+            await bot.answer_callback_query(call.id, TABLE_BROWSE_EXPIRED_TEXT)
+            return
+        
+        text, markup = table_page_view(page)
+        await bot.edit_message_text(
+            text, call.message.chat.id, call.message.message_id, parse_mode='HTML', reply_markup=markup
+        )
+    except Exception as e:
+        logger.error(f"Ошибка при переходе по страницам таблицы: {e}")
+        await bot.answer_callback_query(call.id, "❌ Ошибка при получении данных")
+
+
+@bot.callback_query_handler(func=lambda call: call.data == "page_search")
+async def handle_table_search(call):
+    """Обработчик кнопки поиска: следующее сообщение пользователя - строка поиска"""
+    async with user_session(call.from_user.id) as user_state:
+        browsing = bool(user_state.current_table)
+        if browsing:
+            user_state.current_state = "table_search"
+    
+    if not browsing:
+        await bot.answer_callback_query(call.id, TABLE_BROWSE_EXPIRED_TEXT)
+        return
+    await bot.answer_callback_query(call.id)
+    await bot.send_message(call.message.chat.id, TABLE_SEARCH_PROMPT_TEXT)
+
+
+@bot.callback_query_handler(func=lambda call: call.data == "kitchen_report")
+async def handle_kitchen_report(call):
+    """Обработчик отчета для кухни: порции на ближайшие 7 дней"""
+    try:
+        start_date = datetime.date.today()
+        report = await asyncio.to_thread(
+            kitchen_report.get_forecast, start_date, start_date + datetime.timedelta(days=6)
+        )
+        text, markup = kitchen_report_view(report)
+        await bot.edit_message_text(
+            text, call.message.chat.id, call.message.message_id, parse_mode='HTML', reply_markup=markup
+        )
+    except Exception as e:
+        logger.error(f"Ошибка при формировании отчета для кухни: {e}")
+        await bot.answer_callback_query(call.id, "❌ Ошибка при формировании отчета")
+
+
+@bot.callback_query_handler(func=lambda call: call.data == "back_to_tables")
+async def handle_back_to_tables(call):
+    """Обработчик возврата к списку таблиц"""
+    await show_tables(call.message)
+
+
+@bot.callback_query_handler(func=lambda call: call.data == "main_menu")
+async def handle_main_menu(call):
+    """Обработчик возврата в главное меню"""
+    await start_command(call.message)
+
+
+@bot.message_handler(func=lambda message: message.text == "📝 Регистрация")
+async def handle_registration_button(message):
+    """Обработчик кнопки регистрации"""
+    await start_registration(message)
+
+
+@bot.message_handler(func=lambda message: message.text == "📊 Таблицы БД")
+async def handle_tables_button(message):
+    """Обработчик кнопки таблиц"""
+    await show_tables(message)
+
+
+@bot.message_handler(func=lambda message: message.text == "❓ Справка")
+async def handle_help_button(message):
+    """Обработчик кнопки справки"""
+    await help_command(message)
+
+
+@bot.message_handler(func=lambda message: True)
+async def handle_unknown_message(message):
+    """Обработчик сообщений: шаги регистрации, строка поиска по таблице или неизвестная команда"""
+    try:
+        logger.info(f"Получено сообщение: '{message.text}' от пользователя {message.from_user.id}")
+        async with user_session(message.from_user.id) as user_state:
+            if user_state.current_state == "table_search" and user_state.current_table:
+                # Строка поиска по открытой таблице
+                user_state.current_state = None
+                step_result = 'table_page'
+                page = await asyncio.to_thread(
+                    table_browser.open, user_state, user_state.current_table, message.text
+                )
+                text, markup = table_page_view(page)
+            elif user_state.current_state != "registration":
+                step_result = None
+            else:
+                logger.info(f"Обрабатываем шаг регистрации: {user_state.current_step}")
+                step_result, text, markup = await async_registration_manager.process_step(message, user_state)
+                logger.info(f"Результат обработки шага: {step_result}")
+                if step_result in ('cancel', 'success'):
+                    reset_user_state(user_state)
+        
+        if step_result is None:
+            await bot.reply_to(message, UNKNOWN_COMMAND_TEXT)
+        elif step_result == 'cancel':
+            # Отмена регистрации - возврат в главное меню
+            await bot.reply_to(message, text, reply_markup=main_menu_markup())
+        elif step_result == 'error':
+            await bot.reply_to(message, text, parse_mode='HTML')
+        else:
+            # Продолжение или успешное завершение регистрации, результаты поиска по таблице
+            await bot.reply_to(message, text, parse_mode='HTML', reply_markup=markup)
+    except Exception as e:
+        logger.error(f"Ошибка обработки сообщения: {e}")
+        try:
+            await bot.reply_to(message, MESSAGE_ERROR_TEXT)
+        except Exception:
+            logger.error("Не удалось отправить сообщение об ошибке пользователю")
+
+
+async def run() -> None:
+    """Подключение к БД и long polling до остановки"""
+    await async_db_manager.connect()
+    if async_db_manager.demo_mode:
+        print("🔄 Бот запущен в демо-режиме (без подключения к БД)")
+    else:
+        print("✅ Асинхронное подключение к базе данных установлено")
+    
+    try:
+        # getUpdates не работает, пока в Telegram зарегистрирован webhook
+        await bot.delete_webhook()
+        logger.info("Асинхронный бот запущен и готов к работе!")
+        await bot.infinity_polling(timeout=BOT_POLL_TIMEOUT)
+    finally:
+        await bot.close_session()
+        await async_db_manager.disconnect()
+
+
+def main():
+    """Главная функция запуска асинхронного бота"""
+    print_config_status()
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        logger.info("Получен сигнал остановки. Завершение работы...")
+    finally:
+        db_manager.disconnect()
+        logger.info("Бот остановлен.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import json
+import logging
+from contextlib import asynccontextmanager
+from typing import List, Dict, Any, Optional, AsyncIterator
+import asyncpg
+from config import (
+    POSTGRES_HOST, POSTGRES_PORT, POSTGRES_DB, POSTGRES_USER, POSTGRES_PASSWORD,
+    POSTGRES_POOL_TIMEOUT, ASYNC_DB_POOL_MIN, ASYNC_DB_POOL_MAX, DB_CHANGE_NOTIFY
+)
+from database import (
+    db_manager, VISITOR_MEAL_COLUMNS, CHANGE_NOTIFY_CHANNEL, HOT_STATEMENTS, PoolTimeoutError, convert_placeholders,
+    to_date
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _rowcount(status: str) -> int:
+    """Число строк из статуса команды asyncpg ('INSERT 0 3', 'UPDATE 2')"""
+    count = status.rsplit(' ', 1)[-1]
+    return int(count) if count.isdigit() else 0
+
+
+class AsyncDatabaseManager:
+    """Асинхронный доступ к PostgreSQL через asyncpg с API DatabaseManager
+    
+    Методы execute_query, execute_update, insert_record, insert_visitor_records и
+    check_date_conflicts принимают те же запросы с плейсхолдерами %s и возвращают
+    то же, что и синхронные, но не занимают поток на время ожидания сервера: тысячи
+    диалогов бота обслуживаются одним циклом событий и небольшим пулом соединений.
+    Подписчики на изменения таблиц общие с синхронным db_manager, поэтому кэши
+    (индекс занятости, справочник номеров) видят вставки из обоих путей.
+    
+    Версию схемы проверяет синхронный DatabaseManager при первом подключении.
+    """
+    
+    def __init__(self, sync_manager=db_manager, min_size: int = ASYNC_DB_POOL_MIN,
+                 max_size: int = ASYNC_DB_POOL_MAX, timeout: float = POSTGRES_POOL_TIMEOUT):
+        self.sync_manager = sync_manager
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.pool: Optional[asyncpg.Pool] = None
+        self.demo_mode = False
+        self.connect_kwargs = {
+            'host': POSTGRES_HOST,
+            'port': POSTGRES_PORT,
+            'database': POSTGRES_DB,
+            'user': POSTGRES_USER,
+            'password': POSTGRES_PASSWORD
+        }
+    
+    async def connect(self) -> None:
+        """Создание пула соединений asyncpg (вызывается внутри цикла событий)"""
+        # Схему проверяет синхронный менеджер при первом подключении
+        if not self.demo_mode:
+            self.demo_mode = await asyncio.to_thread(lambda: self.sync_manager.demo_mode)
+        if self.demo_mode:
+            logger.info("Демо-режим: асинхронный пул соединений не создается")
+            return
+        if self.pool:
+            await self.pool.close()
+        try:
+            self.pool = await asyncpg.create_pool(
+                min_size=self.min_size, max_size=self.max_size, **self.connect_kwargs
+            )
+            logger.info(
+                f"Асинхронное подключение к PostgreSQL: {POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB} "
+                f"(пул {self.min_size}-{self.max_size})"
+            )
+        except Exception as e:
+            self.pool = None
+            logger.warning(f"Не удалось подключиться к PostgreSQL через asyncpg: {e}")
+            logger.info("Переключение в демо-режим")
+            self.demo_mode = True
+    
+    async def disconnect(self) -> None:
+        """Закрытие всех соединений пула"""
+        if self.pool:
+            await self.pool.close()
+            self.pool = None
+            logger.info("Асинхронные соединения с PostgreSQL закрыты")
+    
+    async def is_connected(self) -> bool:
+        """Проверка состояния соединения с базой данных"""
+        try:
+            if self.pool:
+                async with self.acquire() as conn:
+                    await conn.fetchval("SELECT 1")
+                return True
+            return False
+        except Exception:
+            return False
+    
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[asyncpg.Connection]:
+        """Соединение из пула на время запроса с ожиданием до timeout секунд"""
+        if not self.pool:
+            await self.connect()
+            if not self.pool:
+                raise ConnectionError("Нет подключения к PostgreSQL")
+        try:
+            conn = await self.pool.acquire(timeout=self.timeout)
+        except asyncio.TimeoutError:
+            raise PoolTimeoutError(
+                f"Нет свободных соединений в асинхронном пуле (max={self.max_size}) за {self.timeout} с"
+            )
+        try:
+            yield conn
+        finally:
+            await self.pool.release(conn)
+    
+    async def execute_query(self, query: str, params: tuple = None) -> List[Dict[str, Any]]:
+        """Выполнение SQL запроса с возвратом результатов
+        
+        В отличие от psycopg2, asyncpg не приводит строки к типам колонок:
+        даты передаются как datetime.date.
+        """
+        try:
+            async with self.acquire() as conn:
+                rows = await conn.fetch(convert_placeholders(query), *(params or ()))
+            return [dict(row) for row in rows]
+        except Exception as e:
+            logger.error(f"Ошибка выполнения асинхронного запроса PostgreSQL: {e}")
+            raise
+    
+    async def execute_update(self, query: str, params: tuple = None, changed_table: str = None) -> int:
+        """Выполнение SQL запроса для обновления данных
+        
+        changed_table - имя изменяемой таблицы: после фиксации транзакции
+        подписчики на её изменения получат оповещение.
+        """
+        try:
+            async with self.acquire() as conn:
+                async with conn.transaction():
+                    status = await conn.execute(convert_placeholders(query), *(params or ()))
+                    rows_affected = _rowcount(status)
+                    if changed_table and rows_affected:
+                        await self._send_change_notify(conn, changed_table)
+            
+            if changed_table and rows_affected:
+                # Подписчики (индекс занятости, кэш номеров) берут threading.Lock: не в цикле событий
+                await asyncio.to_thread(self.sync_manager._dispatch_change, changed_table)
+            return rows_affected
+        except Exception as e:
+            logger.error(f"Ошибка выполнения асинхронного обновления PostgreSQL: {e}")
+            raise
+    
+    async def insert_record(self, table_name: str, data: Dict[str, Any]) -> int:
+        """Вставка новой записи в таблицу"""
+        columns = ', '.join(data.keys())
+        placeholders = ', '.join(['%s' for _ in data])
+        # Обрабатываем имена таблиц с пробелами
+        if ' ' in table_name:
+            query = f'INSERT INTO "{table_name}" ({columns}) VALUES ({placeholders})'
+        else:
+            query = f"INSERT INTO {table_name} ({columns}) VALUES ({placeholders})"
+        
+        return await self.execute_update(query, tuple(data.values()), changed_table=table_name)
+    
+    async def insert_visitor_records(self, records: List[Dict[str, Any]]) -> List[bool]:
+        """Пакетная вставка дней проживания (как DatabaseManager.insert_visitor_records)
+        
+        Записи передаются массивами-колонками и вставляются тем же запросом из HOT_STATEMENTS
+        (asyncpg сам подготавливает запросы на каждом соединении и кэширует их).
+        """
+        if not records:
+            return []
+        
+        arrays = [
+            [record['номер'] for record in records],
+            [to_date(record['дата']) for record in records],
+            [record['ФИО'] for record in records],
+        ] + [[record.get(column, 0) for record in records] for column in VISITOR_MEAL_COLUMNS]
+        
+        try:
+            async with self.acquire() as conn:
+                async with conn.transaction():
+                    inserted = await conn.fetch(convert_placeholders(HOT_STATEMENTS['visitor_insert']), *arrays)
+                    if inserted:
+                        await self._send_change_notify(conn, 'посетители')
+        except Exception as e:
+            logger.error(f"Ошибка асинхронной пакетной вставки посетителей PostgreSQL: {e}")
+            raise
+        
+        inserted_keys = {(row['номер'], row['дата'], row['ФИО']) for row in inserted}
+        inserted_flags = [(record['номер'], to_date(record['дата']), record['ФИО']) in inserted_keys for record in records]
+        if inserted:
+            await asyncio.to_thread(
+                self.sync_manager._dispatch_change,
+                'посетители', [record for record, flag in zip(records, inserted_flags) if flag]
+            )
+        return inserted_flags
+    
+    async def check_date_conflicts(self, room: str, start_date, end_date) -> List[Dict[str, Any]]:
+        """Проверка пересечения дат с существующими записями"""
+        try:
+            if self.demo_mode:
+                # В демо-режиме возвращаем пустой список конфликтов
+                return []
+            
+            return await self.execute_query(HOT_STATEMENTS['date_conflicts'], (room, to_date(start_date), to_date(end_date)))
+        except Exception as e:
+            logger.error(f"Ошибка проверки конфликтов дат: {e}")
+            return []
+    
+    async def _send_change_notify(self, conn, table_name: str) -> None:
+        """NOTIFY для других процессов в текущей транзакции (от имени этого процесса)"""
+        if DB_CHANGE_NOTIFY:
+            payload = json.dumps({'table': table_name, 'source': self.sync_manager._process_token()})
+            await conn.execute("SELECT pg_notify($1, $2)", CHANGE_NOTIFY_CHANNEL, payload)
+
+
+# Создание глобального экземпляра асинхронного менеджера базы данных (пул создается в connect())
+async_db_manager = AsyncDatabaseManager()
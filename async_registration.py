@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import inspect
+import logging
+from typing import Dict, List, Any
+from registration import RegistrationManager
+from room_cache import room_cache
+from availability import availability_index
+from async_database import async_db_manager
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncRegistrationManager(RegistrationManager):
+    """Регистрация для асинхронного бота: шаги выполняются через await process_step()
+    
+    Шаги без ввода-вывода (ввод имени, дат, питания) те же, что у RegistrationManager.
+    Проверка конфликтов дат и сохранение регистрации обращаются к БД через asyncpg,
+    а кэши справочника номеров и индекса занятости перечитываются в пуле потоков,
+    поэтому ни один шаг не блокирует цикл событий на время запроса к серверу.
+    """
+    
+    def __init__(self, async_db=async_db_manager):
+        super().__init__()
+        self.async_db = async_db
+        self._index_reload = None
+    
+    async def process_step(self, message, user_state) -> tuple[str, str, Any]:
+        """Обработка текущего шага регистрации"""
+        current_step = user_state.current_step
+        
+        if current_step not in self.registration_steps:
+            return 'error', "❌ Неизвестный шаг регистрации.", None
+        
+        with metrics.timer('bot_step_duration_seconds', step=current_step):
+            if not room_cache.is_fresh():
+                # Корпуса и номера нужны почти каждому шагу: перечитываем справочник вне цикла событий
+                await asyncio.to_thread(room_cache.preload)
+            result = self.registration_steps[current_step](message, user_state)
+            if inspect.isawaitable(result):
+                # Асинхронный шаг или синхронный шаг, передавший управление асинхронному
+                result = await result
+        metrics.inc('bot_step_results_total', step=current_step, result=result[0])
+        return result
+    
+    async def step_confirm_dates(self, message, user_state) -> tuple[str, str, Any]:
+        """Шаг подтверждения дат с асинхронной проверкой конфликтов"""
+        if message.text != "✅ Подтвердить":
+            # Отмена и неверный ответ обрабатываются без обращения к БД
+            return super().step_confirm_dates(message, user_state)
+        
+        room = user_state.registration_data.get('room', '')
+        start_date = user_state.registration_data.get('start_date')
+        end_date = user_state.registration_data.get('end_date')
+        
+        conflicts = []
+        if room and start_date and end_date:
+            conflicts = await self.get_date_conflicts(room, start_date, end_date)
+        
+        return self._dates_checked(user_state, conflicts)
+    
+    async def step_complete(self, message, user_state) -> tuple[str, str, Any]:
+        """Завершающий шаг - асинхронное сохранение данных"""
+        if message.text != "✅ Подтвердить регистрацию":
+            return super().step_complete(message, user_state)
+        
+        logger.info("Начинаем сохранение данных регистрации")
+        try:
+            success = await self.save_registration_data(user_state.registration_data)
+            return self._saved(success)
+        except Exception as e:
+            logger.error(f"Ошибка завершения регистрации: {e}")
+            return 'error', "❌ Произошла ошибка при сохранении данных.", None
+    
+    async def save_registration_data(self, data: Dict[str, Any]) -> bool:
+        """Сохранение данных регистрации в базу и запрос резервной копии"""
+        try:
+            if self.async_db.demo_mode:
+                logger.info("Демо-режим: данные не сохраняются")
+                return True
+            
+            records = self._visitor_records(data)
+            inserted_flags = await self.async_db.insert_visitor_records(records)
+            return self._records_saved(data, records, inserted_flags)
+        
+        except Exception as e:
+            logger.error(f"Критическая ошибка сохранения данных регистрации: {e}")
+            return False
+    
+    async def get_date_conflicts(self, room: str, start_date, end_date) -> List[Dict[str, Any]]:
+        """Занятые дни номера: из индекса в памяти, а если он устарел - запросом к БД"""
+        if availability_index.is_fresh(start_date):
+            # Индекс защищен threading.Lock, поэтому чтение идет в пуле потоков, а не в цикле событий
+            return await asyncio.to_thread(availability_index.get_conflicts, room, start_date, end_date)
+        
+        # Индекс перечитывается в фоне (одна загрузка на всех), а пользователь не ждет её окончания
+        if self._index_reload is None or self._index_reload.done():
+            self._index_reload = asyncio.get_running_loop().run_in_executor(None, availability_index.preload)
+        return await self.async_db.check_date_conflicts(room, start_date, end_date)
+
+
+# Создание глобального экземпляра асинхронного менеджера регистрации
+async_registration_manager = AsyncRegistrationManager()
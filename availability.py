@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import bisect
+import datetime
+import threading
+import time
+import logging
+from typing import Dict, List, Any, Optional, Tuple, Iterable
+from config import AVAILABILITY_HISTORY_DAYS, AVAILABILITY_RELOAD_SECONDS
+from database import db_manager, to_date
+from room_cache import room_cache
+
+logger = logging.getLogger(__name__)
+
+# Верхняя граница для bisect по ключу (дата, ФИО): больше любого ФИО
+_MAX_NAME = chr(0x10FFFF)
+
+
+class OccupancyIndex:
+    """Индекс занятости номеров в памяти
+    
+    Для каждого номера хранится отсортированный список (порядковый номер даты, ФИО)
+    занятых дней, поэтому проверка номера на интервал [a, b] - два бинарных поиска.
+    Индекс загружается из таблицы посетители начиная с AVAILABILITY_HISTORY_DAYS дней
+    назад, пополняется вставками через DatabaseManager и полностью перечитывается
+    после изменений из других процессов или раз в AVAILABILITY_RELOAD_SECONDS.
+    Запросы по более ранним датам выполняются в БД.
+    """
+    
+    def __init__(self, db_manager, room_cache, history_days: int = AVAILABILITY_HISTORY_DAYS,
+                 reload_seconds: float = AVAILABILITY_RELOAD_SECONDS):
+        self.db_manager = db_manager
+        self.room_cache = room_cache
+        self.history_days = history_days
+        self.reload_seconds = reload_seconds
+        self._lock = threading.Lock()
+        # Перечитывает таблицу только один поток; остальные в это время спрашивают БД, а не ждут
+        self._load_lock = threading.Lock()
+        # Строки, вставленные во время загрузки: применяются к новому индексу при замене
+        self._loading_rows: Optional[List[Dict[str, Any]]] = None
+        self._occupied: Dict[str, List[Tuple[int, str]]] = {}
+        self._horizon: Optional[int] = None
+        self._loaded_at: Optional[float] = None
+        self._generation = 0
+        self.db_manager.add_change_listener('посетители', self._on_table_changed)
+    
+    def get_conflicts(self, room: str, start_date, end_date) -> List[Dict[str, Any]]:
+        """Занятые дни номера в интервале [start_date, end_date] (как check_date_conflicts)"""
+        start, end = to_date(start_date).toordinal(), to_date(end_date).toordinal()
+        if not self._ensure_loaded() or start < self._horizon:
+            return self.db_manager.check_date_conflicts(room, str(to_date(start_date)), str(to_date(end_date)))
+        
+        with self._lock:
+            days = self._occupied.get(room, [])
+            found = days[bisect.bisect_left(days, (start,)):bisect.bisect_right(days, (end, _MAX_NAME))]
+        return [
+            {'номер': room, 'дата': datetime.date.fromordinal(day), 'ФИО': name}
+            for day, name in found
+        ]
+    
+    def is_free(self, room: str, start_date, end_date) -> bool:
+        """Свободен ли номер на весь интервал [start_date, end_date]"""
+        return not self.get_conflicts(room, start_date, end_date)
+    
+    def get_availability(self, start_date, end_date, rooms: Optional[Iterable[str]] = None) -> Dict[str, bool]:
+        """Свободность номеров на интервал [start_date, end_date]: {номер: свободен}
+        
+        Без списка rooms проверяются все номера справочника.
+        """
+        if rooms is None:
+            rooms = self.room_cache.get_rooms()
+        start, end = to_date(start_date).toordinal(), to_date(end_date).toordinal()
+        if not self._ensure_loaded() or start < self._horizon:
+            # Один запрос на все номера, а не по запросу на номер
+            rooms = list(rooms)
+            occupied = self.db_manager.get_occupied_rooms(rooms, start_date, end_date)
+            return {room: room not in occupied for room in rooms}
+        
+        result = {}
+        with self._lock:
+            for room in rooms:
+                days = self._occupied.get(room)
+                result[room] = not days or (
+                    bisect.bisect_left(days, (start,)) == bisect.bisect_right(days, (end, _MAX_NAME))
+                )
+        return result
+    
+    def get_free_rooms(self, start_date, end_date, rooms: Optional[Iterable[str]] = None) -> List[str]:
+        """Номера, свободные на весь интервал [start_date, end_date]"""
+        availability = self.get_availability(start_date, end_date, rooms)
+        return [room for room, free in availability.items() if free]
+    
+    def is_fresh(self, start_date=None) -> bool:
+        """Индекс загружен, не устарел и покрывает даты с start_date: запрос не обратится к БД"""
+        loaded_at, horizon = self._loaded_at, self._horizon
+        if self.db_manager.demo_mode or loaded_at is None or time.monotonic() - loaded_at >= self.reload_seconds:
+            return False
+        return start_date is None or to_date(start_date).toordinal() >= horizon
+    
+    def preload(self) -> bool:
+        """Загрузка индекса заранее, если он пуст или устарел"""
+        return self._ensure_loaded()
+    
+    def invalidate(self) -> None:
+        """Сброс индекса: следующий запрос перечитает таблицу посетителей"""
+        self._generation += 1
+        self._loaded_at = None
+    
+    def _on_table_changed(self, table_name: str, rows: Optional[List[Dict[str, Any]]]) -> None:
+        """Обработчик изменений таблицы посетителей"""
+        if rows is None:
+            # Состав изменений неизвестен (другой процесс, обновление или удаление)
+            self.invalidate()
+            return
+        
+        with self._lock:
+            if self._loading_rows is not None:
+                self._loading_rows.extend(rows)
+            if self._loaded_at is None:
+                return
+            self._add_rows(self._occupied, self._horizon, rows)
+    
+    @staticmethod
+    def _add_rows(occupied: Dict[str, List[Tuple[int, str]]], horizon: int, rows: List[Dict[str, Any]]) -> None:
+        """Добавление вставленных строк в индекс occupied (дни раньше horizon не хранятся)"""
+        for row in rows:
+            day = to_date(row['дата']).toordinal()
+            if day < horizon:
+                continue
+            days = occupied.setdefault(row['номер'], [])
+            entry = (day, row['ФИО'])
+            position = bisect.bisect_left(days, entry)
+            # Строка могла попасть в индекс при загрузке, идущей одновременно со вставкой
+            if position == len(days) or days[position] != entry:
+                days.insert(position, entry)
+    
+    def _ensure_loaded(self) -> bool:
+        """Загрузка индекса при необходимости; False - индекс недоступен, нужно спросить БД"""
+        if self.db_manager.demo_mode:
+            return False
+        loaded_at = self._loaded_at
+        if loaded_at is not None and time.monotonic() - loaded_at < self.reload_seconds:
+            return True
+        
+        if not self._load_lock.acquire(blocking=False):
+            # Индекс уже перечитывает другой поток: этот запрос выполнится в БД
+            return False
+        try:
+            if self._loaded_at is not None and time.monotonic() - self._loaded_at < self.reload_seconds:
+                return True
+            with self._lock:
+                generation = self._generation
+                self._loading_rows = []
+            horizon = datetime.date.today() - datetime.timedelta(days=self.history_days)
+            started = time.monotonic()
+            try:
+                rows = self.db_manager.statements.query('occupancy_since', (horizon,))
+            except Exception as e:
+                logger.error(f"Ошибка загрузки индекса занятости: {e}")
+                with self._lock:
+                    self._loading_rows = None
+                return False
+            
+            # Запрос и построение индекса идут без self._lock: чтения и вставки не ждут загрузку
+            occupied: Dict[str, List[Tuple[int, str]]] = {}
+            for row in rows:
+                occupied.setdefault(row['номер'], []).append((row['дата'].toordinal(), row['ФИО']))
+            # bisect сравнивает строки по кодам символов, а не по правилам сортировки PostgreSQL
+            for days in occupied.values():
+                days.sort()
+            
+            with self._lock:
+                self._add_rows(occupied, horizon.toordinal(), self._loading_rows)
+                self._loading_rows = None
+                self._occupied = occupied
+                self._horizon = horizon.toordinal()
+                # Если таблица изменилась в другом процессе во время загрузки, индекс перечитается
+                # при следующем запросе
+                self._loaded_at = time.monotonic() if generation == self._generation else None
+            logger.info(
+                f"Индекс занятости загружен: {len(rows)} дней, {len(occupied)} номеров "
+                f"за {(time.monotonic() - started) * 1000:.0f} мс"
+            )
+            return True
+        finally:
+            self._load_lock.release()
+
+
+# Создание глобального экземпляра индекса занятости
+availability_index = OccupancyIndex(db_manager, room_cache)
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import atexit
+import threading
+import time
+import logging
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Tuple
+from config import BACKUP_MIN_INTERVAL, BACKUP_COALESCE_DELAY
+from sqlite_backup import sqlite_backup_manager
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class BackupScheduler:
+    """Фоновое резервное копирование с объединением запросов
+    
+    request_backup() только отмечает, что данные изменились, и сразу возвращает
+    управление. Фоновый поток ждет coalesce_delay секунд после первого запроса,
+    чтобы собрать пачку регистраций, и делает не больше одной копии за
+    min_interval секунд; все запросы, пришедшие за это время, покрываются одной копией.
+    """
+    
+    def __init__(self, backup_manager, min_interval: float = BACKUP_MIN_INTERVAL,
+                 coalesce_delay: float = BACKUP_COALESCE_DELAY):
+        self.backup_manager = backup_manager
+        self.min_interval = min_interval
+        self.coalesce_delay = coalesce_delay
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        self._force = False
+        self._running = False
+        # Время (monotonic) самого раннего запроса, еще не покрытого копией
+        self._pending_since: Optional[float] = None
+        self._pending_count = 0
+        self._last_finished: Optional[float] = None
+        self._completed = 0
+        
+        self.requests_total = 0
+        self.coalesced_total = 0
+        self.backups_total = 0
+        self.failures_total = 0
+        self.last_backup_path: Optional[str] = None
+        self.last_backup_at: Optional[str] = None
+        self.last_duration: Optional[float] = None
+        self.last_lag: Optional[float] = None
+        self.last_error: Optional[str] = None
+    
+    def request_backup(self, reason: str = '') -> None:
+        """Запрос резервной копии; не блокирует вызывающий поток"""
+        with self._condition:
+            self.requests_total += 1
+            self._pending_count += 1
+            if self._pending_since is None:
+                self._pending_since = time.monotonic()
+            self._ensure_thread()
+            self._condition.notify()
+        if reason:
+            logger.debug(f"Запрошена резервная копия: {reason}")
+    
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Немедленное выполнение ожидающей копии; True - копия сделана (или не требовалась)"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            if self._pending_since is None and not self._running:
+                return True
+            target = self._completed + 1
+            self._force = True
+            self._ensure_thread()
+            self._condition.notify_all()
+            while self._completed < target:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+            return True
+    
+    def stop(self, flush: bool = True, timeout: float = 30) -> None:
+        """Остановка потока; при flush=True ожидающая копия выполняется перед выходом"""
+        if flush:
+            self.flush(timeout)
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        if self._thread:
+            self._thread.join(timeout)
+    
+    def get_status(self) -> Dict[str, Any]:
+        """Состояние планировщика: ожидающие запросы, отставание копии и итоги"""
+        with self._condition:
+            now = time.monotonic()
+            return {
+                'pending': self._pending_since is not None,
+                'pending_requests': self._pending_count,
+                # Сколько секунд изменения ждут резервной копии
+                'lag_seconds': round(now - self._pending_since, 1) if self._pending_since is not None else 0,
+                'running': self._running,
+                'requests_total': self.requests_total,
+                'backups_total': self.backups_total,
+                'coalesced_requests': self.coalesced_total,
+                'failures_total': self.failures_total,
+                'last_backup_path': self.last_backup_path,
+                'last_backup_at': self.last_backup_at,
+                'last_duration': self.last_duration,
+                'last_lag': self.last_lag,
+                'last_error': self.last_error,
+                'min_interval': self.min_interval,
+            }
+    
+    def collect_metrics(self) -> List[Tuple[str, str, str, Dict[str, Any], Any]]:
+        """Состояние планировщика для /metrics"""
+        status = self.get_status()
+        return [
+            ('backup_pending_requests', 'gauge', 'Запросы копии, ожидающие выполнения', {}, status['pending_requests']),
+            ('backup_lag_seconds', 'gauge', 'Сколько секунд изменения ждут резервной копии', {}, status['lag_seconds']),
+            ('backup_requests_total', 'counter', 'Запросы резервной копии', {}, status['requests_total']),
+            ('backup_runs_total', 'counter', 'Сделанные резервные копии', {}, status['backups_total']),
+            ('backup_coalesced_requests_total', 'counter', 'Запросы, покрытые чужой копией', {},
+             status['coalesced_requests']),
+            ('backup_failures_total', 'counter', 'Ошибки фонового резервного копирования', {}, status['failures_total']),
+        ]
+    
+    def _ensure_thread(self) -> None:
+        """Запуск фонового потока при первом запросе (вызывается под блокировкой)"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name='backup-scheduler', daemon=True)
+            self._thread.start()
+    
+    def _next_run_at(self) -> float:
+        """Момент, не раньше которого можно делать следующую копию"""
+        run_at = self._pending_since + self.coalesce_delay
+        if self._last_finished is not None:
+            run_at = max(run_at, self._last_finished + self.min_interval)
+        return run_at
+    
+    def _run(self) -> None:
+        """Цикл фонового потока"""
+        while True:
+            with self._condition:
+                while not self._stopping:
+                    if self._pending_since is not None:
+                        if self._force:
+                            break
+                        delay = self._next_run_at() - time.monotonic()
+                        if delay <= 0:
+                            break
+                        self._condition.wait(delay)
+                    else:
+                        self._condition.wait()
+                if self._stopping:
+                    return
+                # Все накопленные запросы покрываются одной копией
+                pending_since = self._pending_since
+                self.coalesced_total += max(self._pending_count - 1, 0)
+                self._pending_since = None
+                self._pending_count = 0
+                self._force = False
+                self._running = True
+            
+            started = time.monotonic()
+            try:
+                backup_path = self.backup_manager.create_backup()
+                error = None if backup_path else 'Не удалось создать резервную копию'
+            except Exception as e:
+                backup_path, error = None, str(e)
+            
+            with self._condition:
+                self._running = False
+                self._last_finished = time.monotonic()
+                self._completed += 1
+                self.last_duration = round(self._last_finished - started, 3)
+                self.last_lag = round(self._last_finished - pending_since, 3)
+                if error:
+                    self.failures_total += 1
+                    self.last_error = error
+                    logger.error(f"Ошибка фонового резервного копирования: {error}")
+                    # Изменения остаются непокрытыми: повтор после min_interval
+                    if self._pending_since is None:
+                        self._pending_since = pending_since
+                    self._pending_count += 1
+                else:
+                    self.backups_total += 1
+                    self.last_backup_path = backup_path
+                    self.last_backup_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                    self.last_error = None
+                self._condition.notify_all()
+
+
+# Создание глобального экземпляра планировщика резервных копий
+backup_scheduler = BackupScheduler(sqlite_backup_manager)
+metrics.register_collector(backup_scheduler.collect_metrics)
+# Изменения, не успевшие попасть в копию, сохраняются при штатном завершении процесса
+atexit.register(backup_scheduler.stop)
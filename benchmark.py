@@ -0,0 +1,418 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Нагрузочный прогон веб-приложений и бота на отдельной базе PostgreSQL
+
+На сервере из настроек (DB_HOST, DB_USER...) создается временная база, к ней
+применяются миграции и она заполняется данными generate_dataset.py (одинаковыми
+при одинаковых --scale, --seed и дате запуска). Затем прогоняются:
+- сценарий регистрации в app.py и client_app.py через тестовый клиент Flask:
+  номера корпуса -> свободные номера -> проверка номера -> форма регистрации ->
+  форма питания, и главная страница со статистикой (admin_app.py);
+- прямые вызовы check_room_availability, save_registration и get_statistics;
+- выгрузка таблицы посетители в CSV (admin_app.py);
+- полные диалоги регистрации в боте (replay_updates без сети).
+Результат - пропускная способность и задержки p50/p95/p99 в JSON; с --baseline
+прогон сравнивается с сохраненным и завершается с кодом 1 при регрессии.
+После прогона временная база удаляется (--keep-db - оставить).
+
+Примеры:
+    python benchmark.py --output bench.json
+    python benchmark.py --scale 1 --flows 500 --concurrency 8 --bot-users 100 --output bench.json
+    python benchmark.py --baseline bench.json --tolerance 0.25
+"""
+
+import argparse
+import datetime
+import json
+import os
+import random
+import sys
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Any, Optional, Callable
+
+# Токен нужен только для создания объекта бота; состояния диалогов прогона не сохраняются на диск
+os.environ.setdefault('BOT_TOKEN', '0:benchmark')
+os.environ.setdefault('USER_STATE_BACKEND', 'memory')
+
+import psycopg2
+from psycopg2 import sql
+
+logger = logging.getLogger(__name__)
+
+# Через сколько дней от сегодняшнего начинаются заезды сценария веб-регистрации
+# (диалоги бота занимают ближайшие 300 дней)
+FLOW_DAYS_AHEAD = 400
+
+# Бронирования синтетических данных заканчиваются (включительно) за день до первого диалога бота (+30)
+DATASET_FUTURE_DAYS = 29
+
+
+def percentiles(samples: List[float]) -> Dict[str, Any]:
+    """Число замеров, p50/p95/p99 и среднее в миллисекундах"""
+    ordered = sorted(samples)
+    
+    def percentile(fraction: float) -> Optional[float]:
+        if not ordered:
+            return None
+        return round(ordered[min(int(len(ordered) * fraction), len(ordered) - 1)] * 1000, 2)
+    
+    return {
+        'count': len(ordered),
+        'p50': percentile(0.5),
+        'p95': percentile(0.95),
+        'p99': percentile(0.99),
+        'mean': round(sum(ordered) / len(ordered) * 1000, 2) if ordered else None,
+    }
+
+
+class LatencyRecorder:
+    """Замеры времени по именам шагов из нескольких потоков"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+    
+    def record(self, step: str, seconds: float, ok: bool = True) -> None:
+        with self._lock:
+            self.samples.setdefault(step, []).append(seconds)
+            if not ok:
+                self.errors[step] = self.errors.get(step, 0) + 1
+    
+    def measure(self, step: str, func: Callable, *args, check: Callable[[Any], bool] = None, **kwargs) -> Any:
+        """Вызов func с замером; check(результат) решает, была ли ошибка"""
+        started = time.perf_counter()
+        ok = False
+        try:
+            result = func(*args, **kwargs)
+            ok = check(result) if check else True
+            return result
+        finally:
+            self.record(step, time.perf_counter() - started, ok)
+    
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {
+                step: dict(percentiles(samples), errors=self.errors.get(step, 0))
+                for step, samples in sorted(self.samples.items())
+            }
+
+
+class TemporaryDatabase:
+    """Временная база на сервере PostgreSQL из настроек; удаляется по выходу из with"""
+    
+    def __init__(self, db_manager, name: str, keep: bool = False):
+        self.db_manager = db_manager
+        self.name = name
+        self.keep = keep
+        self._original_database = db_manager.connect_kwargs['database']
+    
+    def __enter__(self) -> 'TemporaryDatabase':
+        self._run_admin(sql.SQL("CREATE DATABASE {}").format(sql.Identifier(self.name)))
+        # Пул DatabaseManager создается при первом обращении - уже к временной базе
+        self.db_manager.connect_kwargs['database'] = self.name
+        logger.info(f"Создана временная база {self.name}")
+        return self
+    
+    def __exit__(self, *exc_info) -> None:
+        self.db_manager.disconnect()
+        self.db_manager.connect_kwargs['database'] = self._original_database
+        if self.keep:
+            print(f"База прогона сохранена: {self.name}")
+            return
+        self._run_admin(sql.SQL("DROP DATABASE IF EXISTS {}").format(sql.Identifier(self.name)))
+        logger.info(f"Временная база {self.name} удалена")
+    
+    def _run_admin(self, statement) -> None:
+        """CREATE/DROP DATABASE: вне транзакции, через соединение с основной базой"""
+        conn = psycopg2.connect(**dict(self.db_manager.connect_kwargs, database=self._original_database))
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                cursor.execute(statement)
+        finally:
+            conn.close()
+
+
+def registration_flow(client, app_name: str, stats_client, recorder: LatencyRecorder,
+                      rng: random.Random, buildings: List[str], name: str) -> bool:
+    """Сценарий регистрации через веб-форму; True - регистрация сохранена"""
+    building = rng.choice(buildings)
+    check_in = datetime.date.today() + datetime.timedelta(days=FLOW_DAYS_AHEAD + rng.randint(0, 1000))
+    check_out = check_in + datetime.timedelta(days=rng.randint(1, 6))
+    dates = {'check_in': check_in.isoformat(), 'check_out': check_out.isoformat()}
+    
+    def step(label: str, func: Callable, *args, **kwargs):
+        return recorder.measure(f"{app_name}.{label}", func, *args,
+                                check=lambda response: response.status_code < 400, **kwargs)
+    
+    step('get_rooms', client.get, f"/api/get_rooms/{building}")
+    response = step('availability', client.get, '/api/availability', query_string=dict(dates, building=building))
+    free_rooms = response.get_json().get('free_rooms') or []
+    if not free_rooms:
+        return False
+    room = rng.choice(free_rooms)
+    step('check_room', client.get, '/api/check_room', query_string=dict(dates, room=room))
+    
+    response = recorder.measure(
+        f"{app_name}.register", client.post, '/register',
+        data={'building': building, 'room': room, 'check_in_date': dates['check_in'],
+              'check_out_date': dates['check_out'], 'representative_name': name},
+        check=lambda response: response.status_code == 302
+    )
+    if response.status_code != 302:
+        return False
+    
+    meals = {}
+    day = check_in
+    while day <= check_out:
+        for field in ('breakfast_adults', 'breakfast_children', 'lunch_adults',
+                      'lunch_children', 'dinner_adults', 'dinner_children'):
+            meals[f"{field}_{day.isoformat()}"] = rng.randint(0, 3)
+        day += datetime.timedelta(days=1)
+    response = recorder.measure(f"{app_name}.meals", client.post, '/meals', data=meals,
+                                check=lambda response: response.status_code == 302)
+    
+    recorder.measure('admin.statistics', stats_client.get, '/', check=lambda response: response.status_code == 200)
+    return response.status_code == 302
+
+
+def run_http(flows: int, concurrency: int, seed: int) -> Dict[str, Any]:
+    """Сценарии регистрации в app.py и client_app.py (поочередно) из concurrency потоков"""
+    import admin_app
+    import app as main_app
+    import client_app
+    from room_cache import room_cache
+    
+    apps = [('app', main_app.create_app()), ('client', client_app.create_app()), ('admin', admin_app.create_app())]
+    for _, flask_app in apps:
+        # Формы отправляются тестовым клиентом без CSRF-токена
+        flask_app.config['WTF_CSRF_ENABLED'] = False
+    buildings = room_cache.get_buildings()
+    
+    recorder = LatencyRecorder()
+    local = threading.local()
+    
+    def run_flow(index: int) -> bool:
+        if not hasattr(local, 'clients'):
+            local.clients = {name: flask_app.test_client() for name, flask_app in apps}
+        app_name = 'app' if index % 2 == 0 else 'client'
+        rng = random.Random(seed * 1_000_003 + index)
+        return registration_flow(local.clients[app_name], app_name, local.clients['admin'], recorder,
+                                 rng, buildings, f"Нагрузка {seed} {index}")
+    
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        saved = sum(executor.map(run_flow, range(flows)))
+    elapsed = time.perf_counter() - started
+    
+    steps = recorder.summary()
+    requests_total = sum(step['count'] for step in steps.values())
+    return {
+        'flows': flows,
+        'concurrency': concurrency,
+        'registrations_saved': saved,
+        'elapsed_seconds': round(elapsed, 3),
+        'flows_per_second': round(flows / elapsed, 1) if elapsed else None,
+        'requests_per_second': round(requests_total / elapsed, 1) if elapsed else None,
+        'steps': steps,
+    }
+
+
+def run_functions(calls: int, seed: int) -> Dict[str, Any]:
+    """Прямые вызовы функций app.py без HTTP и шаблонов"""
+    import app as main_app
+    from room_cache import room_cache
+    
+    rng = random.Random(seed)
+    rooms = room_cache.get_rooms()
+    recorder = LatencyRecorder()
+    for index in range(calls):
+        room = rng.choice(rooms)
+        check_in = datetime.date.today() + datetime.timedelta(days=rng.randint(-365, FLOW_DAYS_AHEAD))
+        check_out = check_in + datetime.timedelta(days=rng.randint(1, 6))
+        recorder.measure('check_room_availability', main_app.check_room_availability, room, check_in, check_out,
+                         check=lambda result: 'error' not in result)
+        
+        # Отдельный диапазон дат, чтобы вставка не пересекалась со сценариями
+        start = datetime.date.today() + datetime.timedelta(days=FLOW_DAYS_AHEAD + 2000 + index * 7)
+        meals_data = {
+            (start + datetime.timedelta(days=offset)).isoformat(): {
+                'breakfast_adults': 1, 'breakfast_children': 0, 'lunch_adults': 1,
+                'lunch_children': 0, 'dinner_adults': 1, 'dinner_children': 0,
+            }
+            for offset in range(3)
+        }
+        reg_data = {'room': room, 'representative_name': f"Функция {seed} {index}"}
+        recorder.measure('save_registration', main_app.save_registration, reg_data, meals_data,
+                         check=lambda result: result['success'])
+        recorder.measure('get_statistics', main_app.get_statistics, check=bool)
+    return recorder.summary()
+
+
+def run_exports(count: int) -> Dict[str, Any]:
+    """Полная выгрузка таблицы посетители в CSV через admin_app.py (ответ читается целиком)"""
+    import admin_app
+    
+    client = admin_app.create_app().test_client()
+    recorder = LatencyRecorder()
+    sizes = []
+    for _ in range(count):
+        response = recorder.measure(
+            'посетители.csv', lambda: client.get('/export/посетители', query_string={'format': 'csv'}, buffered=True),
+            check=lambda response: response.status_code == 200
+        )
+        sizes.append(len(response.data))
+    return dict(recorder.summary()['посетители.csv'], bytes=max(sizes))
+
+
+def run_bot(users: int, seed: int, timeout: float) -> Dict[str, Any]:
+    """Полные диалоги регистрации в боте через webhook и локальную замену Telegram API"""
+    from telebot import apihelper
+    from replay_updates import FakeTelegramApi, generate_updates, replay_webhook, wait_idle
+    
+    api = FakeTelegramApi()
+    apihelper.CUSTOM_REQUEST_SENDER = api
+    import bot
+    from database import db_manager
+    
+    updates = generate_updates(users, seed, confirm=True)
+    dispatcher = bot.dispatcher
+    started = time.perf_counter()
+    dispatcher.start()
+    statuses = replay_webhook(dispatcher, updates)
+    completed = wait_idle(dispatcher, statuses.get('200', 0), timeout)
+    elapsed = time.perf_counter() - started
+    # Ответы еще могут ждать в очереди отправки
+    completed = bot.outbox.wait_idle(timeout) and completed
+    dispatcher.stop()
+    bot.outbox.stop(timeout=1)
+    
+    saved = db_manager.execute_query(
+        "SELECT COUNT(DISTINCT ФИО) AS saved FROM посетители WHERE ФИО LIKE %s", ('Гость Тестовый %',)
+    )[0]['saved']
+    metrics = dispatcher.get_metrics()
+    return {
+        'users': users,
+        'updates': len(updates),
+        'completed': completed,
+        'registrations_saved': saved,
+        'elapsed_seconds': round(elapsed, 3),
+        'updates_per_second': round(len(updates) / elapsed, 1) if elapsed else None,
+        'latency_ms': metrics['latency_ms'],
+        'handler_errors': sum(worker['errors'] for worker in metrics['per_worker']),
+        'rejected': metrics['rejected'],
+    }
+
+
+def find_regressions(result: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Шаги, у которых p95 вырос больше чем на tolerance относительно прошлого прогона"""
+    def steps(run: Dict[str, Any], section: str) -> Dict[str, Dict[str, Any]]:
+        data = run.get(section) or {}
+        if section == 'http':
+            return data.get('steps', {})
+        if section == 'export':
+            return {'посетители.csv': data} if data else {}
+        return data
+    
+    regressions = []
+    for section in ('http', 'functions', 'export'):
+        current, previous = steps(result, section), steps(baseline, section)
+        for step, stats in current.items():
+            before = (previous.get(step) or {}).get('p95')
+            if before and stats['p95'] is not None and stats['p95'] > before * (1 + tolerance):
+                regressions.append(f"{section}.{step}: p95 {before} -> {stats['p95']} мс")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Нагрузочный прогон на временной базе PostgreSQL')
+    parser.add_argument('--flows', type=int, default=200, help='Сценариев регистрации через веб-формы')
+    parser.add_argument('--concurrency', type=int, default=4, help='Потоков, выполняющих сценарии')
+    parser.add_argument('--function-calls', type=int, default=200, help='Прямых вызовов каждой функции app.py')
+    parser.add_argument('--bot-users', type=int, default=50, help='Диалогов регистрации в боте')
+    parser.add_argument('--exports', type=int, default=3, help='Выгрузок таблицы посетители в CSV')
+    parser.add_argument('--scale', type=float, default=0.1, help='Масштаб синтетических данных (generate_dataset.py)')
+    parser.add_argument('--years', type=int, default=3, help='Лет истории посетителей')
+    parser.add_argument('--seed', type=int, default=1, help='Начальное значение генераторов')
+    parser.add_argument('--db-name', help='Имя временной базы (по умолчанию <DB_NAME>_bench_<pid>)')
+    parser.add_argument('--keep-db', action='store_true', help='Не удалять временную базу после прогона')
+    parser.add_argument('--timeout', type=float, default=300, help='Максимальное время диалогов бота, с')
+    parser.add_argument('--output', help='Файл для результата в JSON')
+    parser.add_argument('--baseline', help='Результат прошлого прогона для сравнения')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Допустимый рост p95 относительно --baseline')
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.WARNING)
+    
+    from database import db_manager
+    from migrations import MigrationManager
+    from generate_dataset import DatasetGenerator
+    
+    db_name = args.db_name or f"{db_manager.connect_kwargs['database']}_bench_{os.getpid()}"
+    result: Dict[str, Any] = {
+        'started_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        'parameters': vars(args),
+    }
+    with TemporaryDatabase(db_manager, db_name, keep=args.keep_db):
+        db_manager.initialize(verify_schema=False)
+        if db_manager.demo_mode:
+            print("❌ Нет подключения к PostgreSQL")
+            return 1
+        MigrationManager(db_manager).migrate()
+        generator = DatasetGenerator(args.scale, args.seed, args.years, DATASET_FUTURE_DAYS)
+        result['database'] = dict(generator.load_postgres(db_manager), name=db_name)
+        print(f"База {db_name}: номеров {result['database']['rooms']}, "
+              f"посетителей {result['database']['visitor_rows']} ({result['database']['seconds']} с)")
+        
+        if args.flows:
+            result['http'] = run_http(args.flows, args.concurrency, args.seed)
+        if args.function_calls:
+            result['functions'] = run_functions(args.function_calls, args.seed)
+        if args.exports:
+            result['export'] = run_exports(args.exports)
+        if args.bot_users:
+            result['bot'] = run_bot(args.bot_users, args.seed, args.timeout)
+    
+    if 'http' in result:
+        http = result['http']
+        print(f"Веб: {http['flows']} сценариев за {http['elapsed_seconds']} с, "
+              f"{http['requests_per_second']} запросов/с, сохранено регистраций: {http['registrations_saved']}")
+    for step, stats in result.get('http', {}).get('steps', {}).items():
+        print(f"  {step}: p50={stats['p50']} p95={stats['p95']} p99={stats['p99']} мс, ошибок {stats['errors']}")
+    for step, stats in result.get('functions', {}).items():
+        print(f"  {step}(): p50={stats['p50']} p95={stats['p95']} p99={stats['p99']} мс, ошибок {stats['errors']}")
+    if 'export' in result:
+        export = result['export']
+        print(f"Выгрузка CSV ({export['bytes'] / (1024 * 1024):.1f} МБ): p50={export['p50']} "
+              f"p95={export['p95']} мс, ошибок {export['errors']}")
+    if 'bot' in result:
+        bot_result = result['bot']
+        latency = bot_result['latency_ms']
+        print(f"Бот: {bot_result['updates']} обновлений, {bot_result['updates_per_second']} обновлений/с, "
+              f"p50={latency['p50']} p95={latency['p95']} p99={latency['p99']} мс, "
+              f"сохранено регистраций: {bot_result['registrations_saved']} из {bot_result['users']}")
+    
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"Результат записан: {args.output}")
+    
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = find_regressions(result, json.load(f), args.tolerance)
+        if regressions:
+            print(f"⚠️ Регрессии (рост p95 больше {args.tolerance:.0%}):")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print("✅ Регрессий относительно прошлого прогона нет")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
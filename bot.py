@@ -1,11 +1,24 @@
 import telebot
-from telebot import types
 import logging
 import os
-from config import BOT_TOKEN
+from config import BOT_TOKEN, BOT_MODE, print_config_status
 from database import db_manager
 from registration import registration_manager
 from sqlite_backup import sqlite_backup_manager
+from kitchen_report import kitchen_report
+from user_state import UserState, user_state_store
+from dispatcher import UpdateDispatcher
+from send_queue import SendQueue
+from webhook import run_webhook_server
+from metrics import metrics
+from profiler import profiler
+from table_browser import table_browser
+from bot_views import (
+    WELCOME_TEXT, HELP_TEXT, UNKNOWN_COMMAND_TEXT, MESSAGE_ERROR_TEXT, TABLE_SEARCH_PROMPT_TEXT,
+    TABLE_BROWSE_EXPIRED_TEXT, main_menu_markup, tables_view, table_info_view, table_page_view,
+    kitchen_report_view
+)
+import datetime
 import sys
 
 # Настройка логирования
@@ -15,30 +28,24 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Инициализация бота
-bot = telebot.TeleBot(BOT_TOKEN)
-
-# Словарь для хранения состояния пользователей
-user_states = {}
-
-
-class UserState:
-    """Класс для управления состоянием пользователя"""
-    def __init__(self):
-        self.current_state = None
-        self.registration_data = {}
-        self.current_table = None
-        self.current_step = None
-
+# Инициализация бота: обработчики выполняются в потоках диспетчера, а не в пуле telebot
+bot = telebot.TeleBot(BOT_TOKEN, threaded=False)
+dispatcher = UpdateDispatcher(bot)
+# Ответы уходят через очередь с ограничением скорости, а не прямыми вызовами API из обработчиков
+outbox = SendQueue(bot)
+metrics.register_collector(dispatcher.collect_metrics)
+metrics.register_collector(outbox.collect_metrics)
 
 def get_user_state(user_id: int) -> UserState:
     """Получение состояния пользователя"""
-    if user_id not in user_states:
-        user_states[user_id] = UserState()
-        logger.info(f"Создано новое состояние для пользователя {user_id}")
-    else:
-        logger.info(f"Получено существующее состояние для пользователя {user_id}: current_state={user_states[user_id].current_state}, current_step={user_states[user_id].current_step}")
-    return user_states[user_id]
+    user_state = user_state_store.get(user_id)
+    logger.info(f"Получено состояние пользователя {user_id}: current_state={user_state.current_state}, current_step={user_state.current_step}")
+    return user_state
+
+
+def save_user_state(user_id: int, user_state: UserState) -> None:
+    """Сохранение состояния пользователя после обработки сообщения"""
+    user_state_store.save(user_id, user_state)
 
 
 @bot.message_handler(commands=['start'])
@@ -47,42 +54,18 @@ def start_command(message):
     user_id = message.from_user.id
     user_state = get_user_state(user_id)
     user_state.current_state = None
+    user_state.current_step = None
     user_state.registration_data.clear()
+    table_browser.close(user_state)
+    save_user_state(user_id, user_state)
     
-    welcome_text = (
-        "👋 Добро пожаловать в бот регистрации на питание!\n\n"
-        "Я помогу вам зарегистрироваться для постановки на питание в столовой.\n\n"
-        "Доступные команды:\n"
-        "/start - Главное меню\n"
-        "/register - Регистрация на питание\n"
-        "/tables - Просмотр таблиц базы данных\n"
-        "/help - Справка\n"
-    )
-    
-    markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
-    markup.add(types.KeyboardButton("📝 Регистрация"))
-    markup.add(types.KeyboardButton("📊 Таблицы БД"))
-    markup.add(types.KeyboardButton("❓ Справка"))
-    
-    bot.reply_to(message, welcome_text, reply_markup=markup)
+    outbox.reply_to(message, WELCOME_TEXT, reply_markup=main_menu_markup())
 
 
 @bot.message_handler(commands=['help'])
 def help_command(message):
     """Обработчик команды /help"""
-    help_text = (
-        "📋 Справка по использованию бота:\n\n"
-        "🔹 <b>Регистрация на питание</b>\n"
-        "Используйте кнопку '📝 Регистрация' или команду /register\n\n"
-        "🔹 <b>Просмотр таблиц</b>\n"
-        "Используйте кнопку '📊 Таблицы БД' или команду /tables\n\n"
-        "🔹 <b>Отмена операции</b>\n"
-        "Используйте команду /cancel для отмены текущей операции\n\n"
-        "🔹 <b>Главное меню</b>\n"
-        "Используйте команду /start для возврата в главное меню"
-    )
-    
-    bot.reply_to(message, help_text, parse_mode='HTML')
+    outbox.reply_to(message, HELP_TEXT, parse_mode='HTML')
 
 
 
@@ -94,14 +77,11 @@ def cancel_command(message):
     user_id = message.from_user.id
     user_state = get_user_state(user_id)
     user_state.current_state = None
+    user_state.current_step = None
     user_state.registration_data.clear()
+    save_user_state(user_id, user_state)
     
-    markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
-    markup.add(types.KeyboardButton("📝 Регистрация"))
-    markup.add(types.KeyboardButton("📊 Таблицы БД"))
-    markup.add(types.KeyboardButton("❓ Справка"))
-    
-    bot.reply_to(message, "❌ Операция отменена. Выберите действие:", reply_markup=markup)
+    outbox.reply_to(message, "❌ Операция отменена. Выберите действие:", reply_markup=main_menu_markup())
 
 
 @bot.message_handler(commands=['register'])
@@ -116,6 +96,7 @@ def tables_command(message):
     show_tables(message)
 
 
+@profiler.profiled
 def start_registration(message):
     """Начало процесса регистрации"""
     user_id = message.from_user.id
@@ -125,12 +106,13 @@ def start_registration(message):
     
     # Запускаем процесс регистрации
     step_result, text, markup = registration_manager.step_start(message, user_state)
+    save_user_state(user_id, user_state)
     
     if step_result == 'error':
-        bot.reply_to(message, text, parse_mode='HTML')
+        outbox.reply_to(message, text, parse_mode='HTML')
         return
     
-    bot.reply_to(message, text, parse_mode='HTML', reply_markup=markup)
+    outbox.reply_to(message, text, parse_mode='HTML', reply_markup=markup)
 
 
 def show_tables(message):
@@ -139,69 +121,28 @@ def show_tables(message):
         tables = db_manager.get_tables()
         
         if not tables:
-            bot.reply_to(message, "📭 В базе данных нет таблиц.")
+            outbox.reply_to(message, "📭 В базе данных нет таблиц.")
             return
         
-        markup = types.InlineKeyboardMarkup()
-        for table in tables:
-            markup.add(types.InlineKeyboardButton(
-                f"📋 {table}",
-                callback_data=f"table_{table}"
-            ))
-        
-        mode_text = "🔄 Демо-режим" if db_manager.demo_mode else "✅ Режим БД"
-        bot.reply_to(
-            message,
-            f"📊 <b>Таблицы в базе данных:</b>\n\n"
-            f"Режим работы: {mode_text}\n"
-            f"Найдено таблиц: {len(tables)}\n"
-            f"Выберите таблицу для просмотра:",
-            parse_mode='HTML',
-            reply_markup=markup
-        )
+        text, markup = tables_view(tables, db_manager.demo_mode)
+        outbox.reply_to(message, text, parse_mode='HTML', reply_markup=markup)
         
     except Exception as e:
         logger.error(f"Ошибка при получении таблиц: {e}")
-        bot.reply_to(message, "❌ Ошибка при подключении к базе данных.")
+        outbox.reply_to(message, "❌ Ошибка при подключении к базе данных.")
 
 
 @bot.callback_query_handler(func=lambda call: call.data.startswith('table_'))
+@profiler.profiled
 def handle_table_selection(call):
     """Обработчик выбора таблицы"""
     table_name = call.data.replace('table_', '')
     
     try:
         table_info = db_manager.get_table_info(table_name)
+        full_text, markup = table_info_view(table_name, table_info)
         
-        # Формируем информацию о структуре таблицы
-        structure_text = "📋 <b>Структура таблицы:</b>\n"
-        for column in table_info['structure']:
-            structure_text += f"• <b>{column['Field']}</b> - {column['Type']}"
-            if column['Null'] == 'NO':
-                structure_text += " (NOT NULL)"
-            if column['Key'] == 'PRI':
-                structure_text += " (PRIMARY KEY)"
-            structure_text += "\n"
-        
-        # Формируем информацию о данных
-        data_text = ""
-        if table_info['sample_data']:
-            data_text = "\n📄 <b>Пример данных:</b>\n"
-            for row in table_info['sample_data'][:3]:  # Показываем только первые 3 записи
-                data_text += f"• {', '.join([f'{k}: {v}' for k, v in row.items()])}\n"
-        
-        full_text = (
-            f"📊 <b>Таблица: {table_name}</b>\n\n"
-            f"Количество записей: {table_info['row_count']}\n\n"
-            f"{structure_text}"
-            f"{data_text}"
-        )
-        
-        markup = types.InlineKeyboardMarkup()
-        markup.add(types.InlineKeyboardButton("🔍 Показать данные", callback_data=f"data_{table_name}"))
-        markup.add(types.InlineKeyboardButton("⬅️ Назад к таблицам", callback_data="back_to_tables"))
-        
-        bot.edit_message_text(
+        outbox.edit_message_text(
             full_text,
             call.message.chat.id,
             call.message.message_id,
@@ -211,32 +152,27 @@ def handle_table_selection(call):
         
     except Exception as e:
         logger.error(f"Ошибка при получении информации о таблице {table_name}: {e}")
-        bot.answer_callback_query(call.id, "❌ Ошибка при получении информации о таблице")
+        outbox.answer_callback_query(call, "❌ Ошибка при получении информации о таблице")
 
 
 @bot.callback_query_handler(func=lambda call: call.data.startswith('data_'))
+@profiler.profiled
 def handle_data_view(call):
-    """Обработчик просмотра данных таблицы"""
+    """Обработчик просмотра данных таблицы: первая страница"""
     table_name = call.data.replace('data_', '')
     
     try:
-        data = db_manager.get_table_data(table_name, 10)
+        user_state = get_user_state(call.from_user.id)
+        page = table_browser.open(user_state, table_name)
+        save_user_state(call.from_user.id, user_state)
         
-        if not data:
-            bot.answer_callback_query(call.id, "📭 Таблица пуста")
+        if not page['rows']:
+            outbox.answer_callback_query(call, "📭 Таблица пуста")
             return
         
-        data_text = f"📄 <b>Данные таблицы {table_name}:</b>\n\n"
-        for i, row in enumerate(data, 1):
-            data_text += f"<b>{i}.</b> "
-            data_text += ", ".join([f"{k}: {v}" for k, v in row.items()])
-            data_text += "\n\n"
-        
-        markup = types.InlineKeyboardMarkup()
-        markup.add(types.InlineKeyboardButton("⬅️ Назад к структуре", callback_data=f"table_{table_name}"))
-        markup.add(types.InlineKeyboardButton("🏠 Главное меню", callback_data="main_menu"))
+        data_text, markup = table_page_view(page)
         
-        bot.edit_message_text(
+        outbox.edit_message_text(
             data_text,
             call.message.chat.id,
             call.message.message_id,
@@ -246,7 +182,76 @@ def handle_data_view(call):
         
     except Exception as e:
         logger.error(f"Ошибка при получении данных таблицы {table_name}: {e}")
-        bot.answer_callback_query(call.id, "❌ Ошибка при получении данных")
+        outbox.answer_callback_query(call, "❌ Ошибка при получении данных")
+
+
+@bot.callback_query_handler(func=lambda call: call.data in ('page_next', 'page_prev', 'page_reset'))
+@profiler.profiled
+def handle_table_page(call):
+    """Обработчик перехода по страницам таблицы и сброса поиска"""
+    try:
+        user_state = get_user_state(call.from_user.id)
+        if call.data == 'page_next':
+            page = table_browser.next_page(user_state)
+        elif call.data == 'page_prev':
+            page = table_browser.previous_page(user_state)
+        else:
+            page = table_browser.reset_search(user_state)
+        save_user_state(call.from_user.id, user_state)
+        
+        if page is None:
+            outbox.answer_callback_query(call, TABLE_BROWSE_EXPIRED_TEXT)
+            return
+        
+        data_text, markup = table_page_view(page)
+        outbox.edit_message_text(
+            data_text,
+            call.message.chat.id,
+            call.message.message_id,
+            parse_mode='HTML',
+            reply_markup=markup
+        )
+        
+    except Exception as e:
+        logger.error(f"Ошибка при переходе по страницам таблицы: {e}")
+        outbox.answer_callback_query(call, "❌ Ошибка при получении данных")
+
+
+@bot.callback_query_handler(func=lambda call: call.data == "page_search")
+def handle_table_search(call):
+    """Обработчик кнопки поиска: следующее сообщение пользователя - строка поиска"""
+    user_state = get_user_state(call.from_user.id)
+    if not user_state.current_table:
+        outbox.answer_callback_query(call, TABLE_BROWSE_EXPIRED_TEXT)
+        return
+    
+    user_state.current_state = "table_search"
+    save_user_state(call.from_user.id, user_state)
+    outbox.answer_callback_query(call)
+    outbox.send_message(call.message.chat.id, TABLE_SEARCH_PROMPT_TEXT)
+
+
+@bot.callback_query_handler(func=lambda call: call.data == "kitchen_report")
+@profiler.profiled
+def handle_kitchen_report(call):
+    """Обработчик отчета для кухни: порции на ближайшие 7 дней"""
+    try:
+        start_date = datetime.date.today()
+        report = kitchen_report.get_forecast(start_date, start_date + datetime.timedelta(days=6))
+        
+        report_text, markup = kitchen_report_view(report)
+        
+        outbox.edit_message_text(
+            report_text,
+            call.message.chat.id,
+            call.message.message_id,
+            parse_mode='HTML',
+            reply_markup=markup
+        )
+        
+    except Exception as e:
+        logger.error(f"Ошибка при формировании отчета для кухни: {e}")
+        outbox.answer_callback_query(call, "❌ Ошибка при формировании отчета")
 
 
 @bot.callback_query_handler(func=lambda call: call.data == "back_to_tables")
@@ -264,7 +269,7 @@ def handle_main_menu(call):
 @bot.callback_query_handler(func=lambda call: call.data == "registration_coming_soon")
 def handle_registration_coming_soon(call):
     """Обработчик заглушки регистрации"""
-    bot.answer_callback_query(call.id, "🔜 Функция будет доступна в ближайшее время!")
+    outbox.answer_callback_query(call, "🔜 Функция будет доступна в ближайшее время!")
 
 
 @bot.message_handler(func=lambda message: message.text == "📝 Регистрация")
@@ -286,6 +291,7 @@ def handle_help_button(message):
 
 
 @bot.message_handler(func=lambda message: True)
+@profiler.profiled
 def handle_unknown_message(message):
     """Обработчик неизвестных сообщений"""
     try:
@@ -300,51 +306,51 @@ def handle_unknown_message(message):
             step_result, text, markup = registration_manager.process_step(message, user_state)
             logger.info(f"Результат обработки шага: {step_result}")
             
-            if step_result == 'cancel':
-                # Отмена регистрации - возврат в главное меню
+            if step_result in ('cancel', 'success'):
                 user_state.current_state = None
                 user_state.current_step = None
                 user_state.registration_data.clear()
-                
-                main_markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
-                main_markup.add(types.KeyboardButton("📝 Регистрация"))
-                main_markup.add(types.KeyboardButton("📊 Таблицы БД"))
-                main_markup.add(types.KeyboardButton("❓ Справка"))
-                
-                bot.reply_to(message, text, reply_markup=main_markup)
+            save_user_state(message.from_user.id, user_state)
+            
+            if step_result == 'cancel':
+                # Отмена регистрации - возврат в главное меню
+                outbox.reply_to(message, text, reply_markup=main_menu_markup())
                 
             elif step_result == 'success':
                 # Успешное завершение регистрации
-                user_state.current_state = None
-                user_state.current_step = None
-                user_state.registration_data.clear()
-                
-                bot.reply_to(message, text, parse_mode='HTML', reply_markup=markup)
+                outbox.reply_to(message, text, parse_mode='HTML', reply_markup=markup)
                 
             elif step_result == 'error':
                 # Ошибка в процессе регистрации
-                bot.reply_to(message, text, parse_mode='HTML')
+                outbox.reply_to(message, text, parse_mode='HTML')
                 
             else:
                 # Продолжение регистрации
                 logger.info(f"Продолжение регистрации, отправляем ответ пользователю")
-                bot.reply_to(message, text, parse_mode='HTML', reply_markup=markup)
+                outbox.reply_to(message, text, parse_mode='HTML', reply_markup=markup)
                 
+        elif user_state.current_state == "table_search" and user_state.current_table:
+            # Строка поиска по открытой таблице
+            user_state.current_state = None
+            page = table_browser.open(user_state, user_state.current_table, message.text)
+            save_user_state(message.from_user.id, user_state)
+            
+            text, markup = table_page_view(page)
+            outbox.reply_to(message, text, parse_mode='HTML', reply_markup=markup)
+            
         else:
-            bot.reply_to(
-                message,
-                "❓ Неизвестная команда. Используйте /start для получения списка доступных команд."
-            )
+            outbox.reply_to(message, UNKNOWN_COMMAND_TEXT)
     except Exception as e:
         logger.error(f"Ошибка обработки сообщения: {e}")
         try:
-            bot.reply_to(message, "❌ Произошла ошибка при обработке сообщения. Попробуйте еще раз.")
+            outbox.reply_to(message, MESSAGE_ERROR_TEXT)
         except:
             logger.error("Не удалось отправить сообщение об ошибке пользователю")
 
 
 def main():
     """Главная функция запуска бота"""
+    print_config_status()
     try:
         logger.info("Запуск телеграм-бота...")
         
@@ -381,7 +387,12 @@ def main():
         while retry_count < max_retries:
             try:
                 logger.info(f"Попытка подключения к Telegram API (попытка {retry_count + 1}/{max_retries})")
-                bot.polling(none_stop=True, interval=1, timeout=60)
+                if BOT_MODE == 'webhook':
+                    run_webhook_server(bot, dispatcher)
+                else:
+                    # getUpdates не работает, пока в Telegram зарегистрирован webhook
+                    bot.remove_webhook()
+                    dispatcher.run_polling()
                 break  # Если успешно, выходим из цикла
             except Exception as e:
                 retry_count += 1
@@ -400,6 +411,10 @@ def main():
     except Exception as e:
         logger.error(f"Критическая ошибка: {e}")
     finally:
+        dispatcher.stop()
+        logger.info(f"Показатели обработки обновлений: {dispatcher.get_metrics()}")
+        outbox.stop()
+        logger.info(f"Показатели очереди отправки: {outbox.get_metrics()}")
         db_manager.disconnect()
         logger.info("Бот остановлен.")
 
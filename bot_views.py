@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тексты и клавиатуры бота, общие для потокового (bot.py) и асинхронного (async_bot.py) запуска
+"""
+
+from html import escape
+from telebot import types
+from typing import Dict, List, Any
+
+WELCOME_TEXT = (
+    "👋 Добро пожаловать в бот регистрации на питание!\n\n"
+    "Я помогу вам зарегистрироваться для постановки на питание в столовой.\n\n"
+    "Доступные команды:\n"
+    "/start - Главное меню\n"
+    "/register - Регистрация на питание\n"
+    "/tables - Просмотр таблиц базы данных\n"
+    "/help - Справка\n"
+)
+
+HELP_TEXT = (
+    "📋 Справка по использованию бота:\n\n"
+    "🔹 <b>Регистрация на питание</b>\n"
+    "Используйте кнопку '📝 Регистрация' или команду /register\n\n"
+    "🔹 <b>Просмотр таблиц</b>\n"
+    "Используйте кнопку '📊 Таблицы БД' или команду /tables\n\n"
+    "🔹 <b>Отмена операции</b>\n"
+    "Используйте команду /cancel для отмены текущей операции\n\n"
+    "🔹 <b>Главное меню</b>\n"
+    "Используйте команду /start для возврата в главное меню"
+)
+
+UNKNOWN_COMMAND_TEXT = "❓ Неизвестная команда. Используйте /start для получения списка доступных команд."
+
+MESSAGE_ERROR_TEXT = "❌ Произошла ошибка при обработке сообщения. Попробуйте еще раз."
+
+TABLE_SEARCH_PROMPT_TEXT = "🔎 Введите ФИО или номер (можно начало) для поиска:"
+
+TABLE_BROWSE_EXPIRED_TEXT = "⌛ Просмотр устарел, откройте таблицу заново"
+
+
+def main_menu_markup() -> types.ReplyKeyboardMarkup:
+    """Клавиатура главного меню"""
+    markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
+    markup.add(types.KeyboardButton("📝 Регистрация"))
+    markup.add(types.KeyboardButton("📊 Таблицы БД"))
+    markup.add(types.KeyboardButton("❓ Справка"))
+    return markup
+
+
+def tables_view(tables: List[str], demo_mode: bool) -> tuple[str, types.InlineKeyboardMarkup]:
+    """Список таблиц базы данных с кнопками просмотра"""
+    markup = types.InlineKeyboardMarkup()
+    for table in tables:
+        markup.add(types.InlineKeyboardButton(
+            f"📋 {table}",
+            callback_data=f"table_{table}"
+        ))
+    markup.add(types.InlineKeyboardButton("🍽 Питание на 7 дней", callback_data="kitchen_report"))
+    
+    mode_text = "🔄 Демо-режим" if demo_mode else "✅ Режим БД"
+    text = (
+        f"📊 <b>Таблицы в базе данных:</b>\n\n"
+        f"Режим работы: {mode_text}\n"
+        f"Найдено таблиц: {len(tables)}\n"
+        f"Выберите таблицу для просмотра:"
+    )
+    return text, markup
+
+
+def table_info_view(table_name: str, table_info: Dict[str, Any]) -> tuple[str, types.InlineKeyboardMarkup]:
+    """Структура таблицы и пример данных"""
+    # Формируем информацию о структуре таблицы
+    structure_text = "📋 <b>Структура таблицы:</b>\n"
+    for column in table_info['structure']:
+        structure_text += f"• <b>{column['Field']}</b> - {column['Type']}"
+        if column['Null'] == 'NO':
+            structure_text += " (NOT NULL)"
+        if column['Key'] == 'PRI':
+            structure_text += " (PRIMARY KEY)"
+        structure_text += "\n"
+    
+    # Формируем информацию о данных
+    data_text = ""
+    if table_info['sample_data']:
+        data_text = "\n📄 <b>Пример данных:</b>\n"
+        for row in table_info['sample_data'][:3]:  # Показываем только первые 3 записи
+            data_text += f"• {', '.join([f'{k}: {v}' for k, v in row.items()])}\n"
+    
+    full_text = (
+        f"📊 <b>Таблица: {table_name}</b>\n\n"
+        f"Количество записей: {'' if table_info.get('row_count_exact', True) else '≈'}{table_info['row_count']}\n\n"
+        f"{structure_text}"
+        f"{data_text}"
+    )
+    
+    markup = types.InlineKeyboardMarkup()
+    markup.add(types.InlineKeyboardButton("🔍 Показать данные", callback_data=f"data_{table_name}"))
+    markup.add(types.InlineKeyboardButton("⬅️ Назад к таблицам", callback_data="back_to_tables"))
+    return full_text, markup
+
+
+def table_page_view(page: Dict[str, Any]) -> tuple[str, types.InlineKeyboardMarkup]:
+    """Страница строк таблицы с переходом по страницам и поиском"""
+    table_name = page['table']
+    data_text = f"📄 <b>Данные таблицы {escape(table_name)}</b> (стр. {page['number']})\n"
+    if page['search']:
+        data_text += f"🔎 Поиск: {escape(page['search'])}"
+        if page['search_mode'] == 'prefix':
+            data_text += " (по началу ФИО или номера)"
+        data_text += "\n"
+    data_text += "\n"
+    
+    if not page['rows']:
+        data_text += "📭 Ничего не найдено"
+    for i, row in enumerate(page['rows'], page['offset'] + 1):
+        data_text += f"<b>{i}.</b> "
+        data_text += escape(", ".join([f"{k}: {v}" for k, v in row.items()]))
+        data_text += "\n\n"
+    
+    markup = types.InlineKeyboardMarkup()
+    navigation = []
+    if page['number'] > 1:
+        navigation.append(types.InlineKeyboardButton("◀️ Назад", callback_data="page_prev"))
+    if page['next_cursor']:
+        navigation.append(types.InlineKeyboardButton("Далее ▶️", callback_data="page_next"))
+    if navigation:
+        markup.row(*navigation)
+    if page['searchable']:
+        markup.add(types.InlineKeyboardButton("🔎 Поиск", callback_data="page_search"))
+    if page['search']:
+        markup.add(types.InlineKeyboardButton("✖️ Сбросить поиск", callback_data="page_reset"))
+    markup.add(types.InlineKeyboardButton("⬅️ Назад к структуре", callback_data=f"table_{table_name}"))
+    markup.add(types.InlineKeyboardButton("🏠 Главное меню", callback_data="main_menu"))
+    return data_text, markup
+
+
+def kitchen_report_view(report: Dict[str, Any]) -> tuple[str, types.InlineKeyboardMarkup]:
+    """Отчет для кухни: порции по дням и корпусам"""
+    report_text = "🍽 <b>Питание на 7 дней</b>\n(завтрак / обед / ужин, взрослые + дети)\n\n"
+    for day in report['days']:
+        report_text += (
+            f"<b>{day['date'].strftime('%d.%m')}</b>: "
+            f"{day['breakfast_adults']}+{day['breakfast_children']} / "
+            f"{day['lunch_adults']}+{day['lunch_children']} / "
+            f"{day['dinner_adults']}+{day['dinner_children']}\n"
+        )
+    report_text += f"\nВсего порций: {report['totals']['total']}"
+    if report['buildings']:
+        building_totals = ", ".join(
+            f"{name}: {sum(day['total'] for day in report['by_building'][name])}"
+            for name in report['buildings']
+        )
+        report_text += f"\nПо корпусам: {building_totals}"
+    
+    markup = types.InlineKeyboardMarkup()
+    markup.add(types.InlineKeyboardButton("⬅️ Назад к таблицам", callback_data="back_to_tables"))
+    return report_text, markup
@@ -29,10 +29,10 @@ def check_database():
         print("\n📊 Содержимое таблиц:")
         
         for table in tables:
-            row_count = db_manager.get_table_row_count(table)
-            print(f"  📋 {table}: {row_count} записей")
+            row_count = db_manager.row_counts.get(table)
+            print(f"  📋 {table}: {'' if row_count['exact'] else '≈'}{row_count['count']} записей")
             
-            if row_count > 0:
+            if row_count['count'] > 0:
                 # Показываем первые 3 записи
                 sample_data = db_manager.get_table_data(table, 3)
                 print(f"    Примеры записей:")
@@ -89,15 +89,15 @@ def initialize_database():
             }
         ]
         
-        for visitor in test_visitors:
-            try:
-                db_manager.insert_record("посетители", visitor)
-                print(f"  ✅ Добавлен посетитель: {visitor['ФИО']} - {visitor['номер']} - {visitor['дата']}")
-            except Exception as e:
-                if "duplicate key" in str(e).lower() or "unique" in str(e).lower():
-                    print(f"  ⚠️ Запись уже существует: {visitor['ФИО']} - {visitor['номер']} - {visitor['дата']}")
+        try:
+            inserted_flags = db_manager.insert_visitor_records(test_visitors)
+            for visitor, inserted in zip(test_visitors, inserted_flags):
+                if inserted:
+                    print(f"  ✅ Добавлен посетитель: {visitor['ФИО']} - {visitor['номер']} - {visitor['дата']}")
                 else:
-                    print(f"  ❌ Ошибка добавления посетителя: {e}")
+                    print(f"  ⚠️ Запись уже существует: {visitor['ФИО']} - {visitor['номер']} - {visitor['дата']}")
+        except Exception as e:
+            print(f"  ❌ Ошибка добавления посетителей: {e}")
         
         print("✅ Инициализация завершена")
         return True
@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, session
+from flask import Blueprint, Flask, render_template, request, jsonify, redirect, url_for, flash, session
 from flask_wtf import FlaskForm
 from wtforms import StringField, SelectField, DateField, IntegerField
 from wtforms.validators import DataRequired, Length, ValidationError
@@ -10,15 +10,18 @@ import logging
 import os
 from database import db_manager
 from sqlite_backup import sqlite_backup_manager
+from room_cache import room_cache
+from availability import availability_index
+from metrics import instrument_app
+from profiler import instrument_app as instrument_profiler
+from config import print_config_status
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Инициализация Flask приложения
-app = Flask(__name__)
-app.config['SECRET_KEY'] = 'client-secret-key-here'
-app.config['WTF_CSRF_ENABLED'] = True
+# Маршруты приложения; экземпляр Flask создает create_app()
+blueprint = Blueprint('main', __name__)
 
 # Инициализация менеджеров
 db_manager_instance = db_manager
@@ -56,12 +59,12 @@ class RegistrationForm(FlaskForm):
                 raise ValidationError('Дата отъезда должна быть позже даты заезда')
 
 # Маршруты
-@app.route('/')
+@blueprint.route('/')
 def index():
     """Клиентская главная страница"""
     return render_template('client_index.html')
 
-@app.route('/register', methods=['GET', 'POST'])
+@blueprint.route('/register', methods=['GET', 'POST'])
 def register():
     """Клиентская страница регистрации"""
     form = RegistrationForm()
@@ -99,7 +102,7 @@ def register():
                     'representative_name': form.representative_name.data
                 }
                 
-                return redirect(url_for('meals'))
+                return redirect(url_for('main.meals'))
                 
             except Exception as e:
                 logger.error(f"Ошибка при регистрации: {e}")
@@ -107,12 +110,12 @@ def register():
     
     return render_template('client_register.html', form=form, datetime=datetime)
 
-@app.route('/meals', methods=['GET', 'POST'])
+@blueprint.route('/meals', methods=['GET', 'POST'])
 def meals():
     """Клиентская страница заполнения питания"""
     if 'registration_data' not in session:
         flash('Сначала заполните данные регистрации', 'error')
-        return redirect(url_for('register'))
+        return redirect(url_for('main.register'))
     
     reg_data = session['registration_data']
     
@@ -148,7 +151,7 @@ def meals():
                 # Очищаем сессию
                 session.pop('registration_data', None)
                 flash('Регистрация успешно завершена!', 'success')
-                return redirect(url_for('success'))
+                return redirect(url_for('main.success'))
             else:
                 flash(f'Ошибка при сохранении: {result["error"]}', 'error')
                 
@@ -160,12 +163,12 @@ def meals():
                          registration_data=reg_data, 
                          dates=dates)
 
-@app.route('/success')
+@blueprint.route('/success')
 def success():
     """Клиентская страница успешной регистрации"""
     return render_template('client_success.html')
 
-@app.route('/api/check_room')
+@blueprint.route('/api/check_room')
 def check_room():
     """API для проверки доступности номера"""
     try:
@@ -179,7 +182,7 @@ def check_room():
         logger.error(f"Ошибка проверки номера: {e}")
         return jsonify({'available': False, 'error': str(e)})
 
-@app.route('/api/get_rooms/<building>')
+@blueprint.route('/api/get_rooms/<building>')
 def get_rooms(building):
     """API для получения номеров в корпусе"""
     try:
@@ -191,13 +194,34 @@ def get_rooms(building):
         logger.error(f"Ошибка получения номеров: {e}")
         return jsonify([])
 
+@blueprint.route('/api/availability')
+def availability():
+    """API для проверки свободных номеров на период (все номера или номера корпуса)"""
+    try:
+        check_in = datetime.strptime(request.args.get('check_in'), '%Y-%m-%d').date()
+        check_out = datetime.strptime(request.args.get('check_out'), '%Y-%m-%d').date()
+        building = request.args.get('building')
+        
+        if check_out < check_in:
+            return jsonify({'error': 'Дата отъезда раньше даты заезда'}), 400
+        
+        rooms = get_rooms_in_building(building) if building else None
+        rooms_availability = availability_index.get_availability(check_in, check_out, rooms)
+        return jsonify({
+            'check_in': check_in.strftime('%Y-%m-%d'),
+            'check_out': check_out.strftime('%Y-%m-%d'),
+            'rooms': rooms_availability,
+            'free_rooms': [room for room, free in rooms_availability.items() if free]
+        })
+    except Exception as e:
+        logger.error(f"Ошибка проверки свободных номеров: {e}")
+        return jsonify({'error': str(e)}), 400
+
 # Вспомогательные функции
 def get_available_buildings():
     """Получение списка доступных корпусов"""
     try:
-        cursor = db_manager_instance.connection.cursor()
-        cursor.execute('SELECT DISTINCT SUBSTRING(номер, 1, POSITION(\'/\' IN номер)-1) as building FROM "справочник номеров" ORDER BY building')
-        buildings = [row[0] for row in cursor.fetchall()]
+        buildings = room_cache.get_buildings()
         logger.info(f"Найдено корпусов: {len(buildings)} - {buildings}")
         return buildings
     except Exception as e:
@@ -207,10 +231,7 @@ def get_available_buildings():
 def get_rooms_in_building(building):
     """Получение номеров в корпусе"""
     try:
-        cursor = db_manager_instance.connection.cursor()
-        cursor.execute('SELECT номер FROM "справочник номеров" WHERE номер LIKE %s ORDER BY номер', (f"{building}/%",))
-        rooms = [row[0] for row in cursor.fetchall()]
-        return rooms
+        return room_cache.get_rooms_in_building(building)
     except Exception as e:
         logger.error(f"Ошибка получения номеров: {e}")
         return []
@@ -218,15 +239,9 @@ def get_rooms_in_building(building):
 def check_room_availability(room, check_in, check_out):
     """Проверка доступности номера"""
     try:
-        cursor = db_manager_instance.connection.cursor()
-        cursor.execute("""
-            SELECT ФИО, дата FROM посетители 
-            WHERE номер = %s AND дата BETWEEN %s AND %s
-        """, (room, check_in.strftime('%Y-%m-%d'), check_out.strftime('%Y-%m-%d')))
-        
-        conflicts = cursor.fetchall()
+        conflicts = availability_index.get_conflicts(room, check_in, check_out)
         if conflicts:
-            conflict_dates = [f"{conflict[1]} ({conflict[0]})" for conflict in conflicts]
+            conflict_dates = [f"{conflict['дата']} ({conflict['ФИО']})" for conflict in conflicts]
             return {
                 'available': False, 
                 'conflicts': ', '.join(conflict_dates)
@@ -239,54 +254,81 @@ def check_room_availability(room, check_in, check_out):
 def save_registration(reg_data, meals_data):
     """Сохранение регистрации в базу данных"""
     try:
-        cursor = db_manager_instance.connection.cursor()
+        records = [
+            {
+                'номер': reg_data['room'],
+                'дата': date_str,
+                'ФИО': reg_data['representative_name'],
+                'зв': meals['breakfast_adults'],
+                'зд': meals['breakfast_children'],
+                'ов': meals['lunch_adults'],
+                'од': meals['lunch_children'],
+                'ув': meals['dinner_adults'],
+                'уд': meals['dinner_children']
+            }
+            for date_str, meals in meals_data.items()
+        ]
+        
+        # Все дни сохраняются одним запросом и одной транзакцией
+        inserted_flags = db_manager_instance.insert_visitor_records(records)
+        saved_count = sum(inserted_flags)
+        skipped_count = len(records) - saved_count
         
-        for date_str, meals in meals_data.items():
-            cursor.execute("""
-                INSERT INTO посетители (номер, дата, ФИО, зд, зв, од, ов, уд, ув)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """, (
-                reg_data['room'],
-                date_str,
-                reg_data['representative_name'],
-                meals['breakfast_adults'],
-                meals['breakfast_children'],
-                meals['lunch_adults'],
-                meals['lunch_children'],
-                meals['dinner_adults'],
-                meals['dinner_children']
-            ))
+        if saved_count == 0:
+            return {'success': False, 'error': 'Регистрация на эти даты уже существует'}
         
-        db_manager_instance.connection.commit()
-        logger.info(f"Регистрация сохранена: {reg_data['representative_name']} в {reg_data['room']}")
-        return {'success': True}
+        logger.info(
+            f"Регистрация сохранена: {reg_data['representative_name']} в {reg_data['room']} "
+            f"(сохранено {saved_count}, пропущено {skipped_count})"
+        )
+        return {'success': True, 'saved': saved_count, 'skipped': skipped_count}
         
     except Exception as e:
         logger.error(f"Ошибка сохранения регистрации: {e}")
         return {'success': False, 'error': str(e)}
 
 # Обработчики ошибок
-@app.errorhandler(404)
+@blueprint.app_errorhandler(404)
 def not_found_error(error):
     return render_template('404.html'), 404
 
-@app.errorhandler(500)
+@blueprint.app_errorhandler(500)
 def internal_error(error):
     return render_template('500.html'), 500
 
+def create_app() -> Flask:
+    """Фабрика клиентского приложения: экземпляр Flask, маршруты, показатели и резервная копия SQLite
+    
+    Используется WSGI-сервером (python serve.py client) и запуском для разработки.
+    """
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = 'client-secret-key-here'
+    app.config['WTF_CSRF_ENABLED'] = True
+    
+    # Время обработки запросов по endpoint и показатели в формате Prometheus на /metrics
+    instrument_app(app, 'client')
+    # Выборочное профилирование запросов (PROFILE_ENABLED=1)
+    instrument_profiler(app, 'client')
+    
+    app.register_blueprint(blueprint)
+    
+    # Создание резервной копии; к базе данных приложение подключается при первом запросе
+    backup_manager.create_backup()
+    return app
+
 if __name__ == '__main__':
+    print_config_status()
     try:
         # Инициализация базы данных
         if not db_manager_instance.is_connected():
             db_manager_instance.connect()
-        
-        # Создание резервной копии
-        backup_manager.create_backup()
+        app = create_app()
         
         print("✅ Клиентское приложение запущено")
         print("✅ Подключение к базе данных установлено")
         print("✅ Резервная копия создана")
         print("🌐 Клиентский интерфейс доступен по адресу: http://localhost:8080")
+        print("💡 Сервер разработки; для рабочего запуска: python serve.py client")
         
         # Запуск клиентского приложения на порту 8080
         app.run(host='0.0.0.0', port=8080, debug=False)
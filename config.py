@@ -14,23 +14,140 @@ POSTGRES_DB = os.getenv('DB_NAME', 'visitors')
 POSTGRES_USER = os.getenv('DB_USER', 'postgres')
 POSTGRES_PASSWORD = os.getenv('DB_PASSWORD', '')
 
-# Проверка обязательных переменных
-if not BOT_TOKEN or BOT_TOKEN == 'your_telegram_bot_token_here':
-    print("⚠️  ВНИМАНИЕ: BOT_TOKEN не установлен или установлен по умолчанию")
-    print("📝 Для работы бота создайте файл .env с вашим токеном:")
-    print("   BOT_TOKEN=ваш_токен_от_botfather")
-    print("🔄 Бот будет работать в демо-режиме")
-
-if not POSTGRES_PASSWORD:
-    print("⚠️  ВНИМАНИЕ: DB_PASSWORD не установлен")
-    print("📝 Для работы с PostgreSQL добавьте в .env файл:")
-    print("   DB_HOST=ваш_хост")
-    print("   DB_PORT=5432")
-    print("   DB_NAME=имя_базы")
-    print("   DB_USER=пользователь")
-    print("   DB_PASSWORD=пароль")
-else:
-    print(f"✅ Подключение к PostgreSQL: {POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}")
-
-print("✅ Конфигурация загружена успешно")
+# Настройки пула соединений PostgreSQL
+POSTGRES_POOL_MIN = int(os.getenv('DB_POOL_MIN', '1'))
+POSTGRES_POOL_MAX = int(os.getenv('DB_POOL_MAX', '10'))
+POSTGRES_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '10'))
+POSTGRES_POOL_PING_INTERVAL = float(os.getenv('DB_POOL_PING_INTERVAL', '30'))
 
+# Частые запросы подготавливаются на сервере (PREPARE) один раз на соединение пула;
+# 0 - выполнять их обычным текстом (pgbouncer в режиме transaction pooling)
+DB_PREPARED_STATEMENTS = os.getenv('DB_PREPARED_STATEMENTS', '1') == '1'
+
+# Оповещения об изменениях таблиц между процессами через PostgreSQL LISTEN/NOTIFY
+DB_CHANGE_NOTIFY = os.getenv('DB_CHANGE_NOTIFY', '0') == '1'
+
+# Время жизни кэша справочника номеров (секунды)
+ROOM_CACHE_TTL = float(os.getenv('ROOM_CACHE_TTL', '300'))
+
+# Индекс занятости номеров: сколько дней истории держать в памяти и как часто перечитывать
+AVAILABILITY_HISTORY_DAYS = int(os.getenv('AVAILABILITY_HISTORY_DAYS', '31'))
+AVAILABILITY_RELOAD_SECONDS = float(os.getenv('AVAILABILITY_RELOAD_SECONDS', '600'))
+
+# Резервное копирование SQLite: страниц за шаг онлайн-копирования и пауза между шагами (секунды)
+SQLITE_BACKUP_PAGES = int(os.getenv('SQLITE_BACKUP_PAGES', '256'))
+SQLITE_BACKUP_STEP_PAUSE = float(os.getenv('SQLITE_BACKUP_STEP_PAUSE', '0.005'))
+
+# Планировщик резервных копий: не чаще одной копии за BACKUP_MIN_INTERVAL секунд,
+# запросы, пришедшие в течение BACKUP_COALESCE_DELAY секунд, объединяются
+BACKUP_MIN_INTERVAL = float(os.getenv('BACKUP_MIN_INTERVAL', '60'))
+BACKUP_COALESCE_DELAY = float(os.getenv('BACKUP_COALESCE_DELAY', '2'))
+
+# Обработка обновлений бота: число потоков-обработчиков, размер очереди каждого потока
+# и время ожидания long polling (секунды)
+BOT_WORKERS = int(os.getenv('BOT_WORKERS', '4'))
+BOT_QUEUE_SIZE = int(os.getenv('BOT_QUEUE_SIZE', '100'))
+BOT_POLL_TIMEOUT = int(os.getenv('BOT_POLL_TIMEOUT', '30'))
+
+# Очередь исходящих сообщений бота: лимиты Telegram (сообщений в секунду на бота и на личный
+# чат, в минуту на группу), число потоков отправки и повторов после 429 или ошибки сети
+SEND_GLOBAL_RATE = float(os.getenv('SEND_GLOBAL_RATE', '30'))
+SEND_CHAT_RATE = float(os.getenv('SEND_CHAT_RATE', '1'))
+SEND_CHAT_BURST = int(os.getenv('SEND_CHAT_BURST', '3'))
+SEND_GROUP_PER_MINUTE = float(os.getenv('SEND_GROUP_PER_MINUTE', '20'))
+SEND_WORKERS = int(os.getenv('SEND_WORKERS', '4'))
+SEND_MAX_RETRIES = int(os.getenv('SEND_MAX_RETRIES', '5'))
+# Сколько сообщений может ждать отправки, прежде чем массовые уведомления начнут отклоняться
+SEND_QUEUE_SIZE = int(os.getenv('SEND_QUEUE_SIZE', '10000'))
+
+# Режим получения обновлений бота: polling (long polling) или webhook (HTTP-запросы от Telegram)
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram/webhook')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', '40'))
+# Сколько секунд запрос Telegram ждет места в очереди, прежде чем получить 503
+WEBHOOK_SUBMIT_TIMEOUT = float(os.getenv('WEBHOOK_SUBMIT_TIMEOUT', '1'))
+# Прием обновлений бота внутри основного Flask-приложения (app.py) вместо отдельного сервера
+WEBHOOK_IN_APP = os.getenv('WEBHOOK_IN_APP', '0') == '1'
+# Файл для записи полученных обновлений (JSON lines) для последующего воспроизведения
+WEBHOOK_RECORD_PATH = os.getenv('WEBHOOK_RECORD_PATH', '')
+
+# Асинхронный бот (async_bot.py): размер пула соединений asyncpg
+ASYNC_DB_POOL_MIN = int(os.getenv('ASYNC_DB_POOL_MIN', '1'))
+ASYNC_DB_POOL_MAX = int(os.getenv('ASYNC_DB_POOL_MAX', '10'))
+
+# Хранилище состояний диалогов бота: memory (только в памяти) или sqlite (переживает перезапуск)
+USER_STATE_BACKEND = os.getenv('USER_STATE_BACKEND', 'sqlite')
+USER_STATE_DB_PATH = os.getenv('USER_STATE_DB_PATH', 'user_states.db')
+USER_STATE_MAX_USERS = int(os.getenv('USER_STATE_MAX_USERS', '10000'))
+USER_STATE_TTL = float(os.getenv('USER_STATE_TTL', '86400'))
+USER_STATE_FLUSH_INTERVAL = float(os.getenv('USER_STATE_FLUSH_INTERVAL', '1'))
+
+# Экспорт данных: сколько строк читать с сервера за один запрос курсора
+EXPORT_FETCH_SIZE = int(os.getenv('EXPORT_FETCH_SIZE', '2000'))
+
+# Количество строк на экранах информации о таблице: таблицы больше ROW_COUNT_EXACT_LIMIT строк
+# показываются с оценкой из статистики PostgreSQL, результат кэшируется на ROW_COUNT_CACHE_TTL секунд
+ROW_COUNT_EXACT_LIMIT = int(os.getenv('ROW_COUNT_EXACT_LIMIT', '10000'))
+ROW_COUNT_CACHE_TTL = float(os.getenv('ROW_COUNT_CACHE_TTL', '30'))
+
+# Журнал медленных запросов: порог (мс, 0 - журнал выключен) и размер буфера; план EXPLAIN ANALYZE
+# снимается для одного запроса не чаще раза в SLOW_QUERY_EXPLAIN_INTERVAL секунд и не дольше таймаута
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', '200'))
+SLOW_QUERY_LOG_SIZE = int(os.getenv('SLOW_QUERY_LOG_SIZE', '100'))
+SLOW_QUERY_EXPLAIN_INTERVAL = float(os.getenv('SLOW_QUERY_EXPLAIN_INTERVAL', '300'))
+SLOW_QUERY_EXPLAIN_TIMEOUT = os.getenv('SLOW_QUERY_EXPLAIN_TIMEOUT', '10s')
+
+# Выборочное профилирование запросов Flask и обработчиков бота: доля профилируемых запросов,
+# период снимков стека (мс), каталог файлов свернутых стеков и период их перезаписи (секунды)
+PROFILE_ENABLED = os.getenv('PROFILE_ENABLED', '0') == '1'
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0.05'))
+PROFILE_INTERVAL_MS = float(os.getenv('PROFILE_INTERVAL_MS', '5'))
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+PROFILE_FLUSH_INTERVAL = float(os.getenv('PROFILE_FLUSH_INTERVAL', '60'))
+
+# Просмотр таблиц: строк на странице в боте и в административном приложении
+BOT_TABLE_PAGE_SIZE = int(os.getenv('BOT_TABLE_PAGE_SIZE', '10'))
+ADMIN_TABLE_PAGE_SIZE = int(os.getenv('ADMIN_TABLE_PAGE_SIZE', '50'))
+
+# Рабочий запуск Flask-приложений (serve.py): WSGI-сервер gunicorn или waitress, адрес,
+# число процессов и потоков в каждом, таймаут запроса и загрузка приложения до fork
+WSGI_SERVER = os.getenv('WSGI_SERVER', 'waitress' if os.name == 'nt' else 'gunicorn')
+WSGI_BIND = os.getenv('WSGI_BIND', '')
+WSGI_WORKERS = int(os.getenv('WSGI_WORKERS', '0'))  # 0 - по числу ядер (2 * CPU + 1)
+WSGI_THREADS = int(os.getenv('WSGI_THREADS', '4'))
+WSGI_TIMEOUT = int(os.getenv('WSGI_TIMEOUT', '60'))
+WSGI_PRELOAD = os.getenv('WSGI_PRELOAD', '1') == '1'
+
+# Настройки миграций схемы: по умолчанию схема создается и обновляется только командой
+# python migrations.py migrate, приложения при подключении лишь проверяют её версию
+DB_AUTO_MIGRATE = os.getenv('DB_AUTO_MIGRATE', '0') == '1'
+DB_MIGRATION_BATCH_SIZE = int(os.getenv('DB_MIGRATION_BATCH_SIZE', '5000'))
+DB_MIGRATION_BATCH_PAUSE = float(os.getenv('DB_MIGRATION_BATCH_PAUSE', '0.05'))
+DB_MIGRATION_LOCK_TIMEOUT = os.getenv('DB_MIGRATION_LOCK_TIMEOUT', '5s')
+DB_MIGRATION_SWAP_ATTEMPTS = int(os.getenv('DB_MIGRATION_SWAP_ATTEMPTS', '5'))
+
+
+def print_config_status() -> None:
+    """Проверка обязательных переменных и вывод сводки конфигурации (при запуске приложений)"""
+    if not BOT_TOKEN or BOT_TOKEN == 'your_telegram_bot_token_here':
+        print("⚠️  ВНИМАНИЕ: BOT_TOKEN не установлен или установлен по умолчанию")
+        print("📝 Для работы бота создайте файл .env с вашим токеном:")
+        print("   BOT_TOKEN=ваш_токен_от_botfather")
+        print("🔄 Бот будет работать в демо-режиме")
+    
+    if not POSTGRES_PASSWORD:
+        print("⚠️  ВНИМАНИЕ: DB_PASSWORD не установлен")
+        print("📝 Для работы с PostgreSQL добавьте в .env файл:")
+        print("   DB_HOST=ваш_хост")
+        print("   DB_PORT=5432")
+        print("   DB_NAME=имя_базы")
+        print("   DB_USER=пользователь")
+        print("   DB_PASSWORD=пароль")
+    else:
+        print(f"✅ Подключение к PostgreSQL: {POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}")
+    
+    print("✅ Конфигурация загружена успешно")
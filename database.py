@@ -1,100 +1,800 @@
 import psycopg2
+import psycopg2.errors
+from psycopg2 import pool as pg_pool
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_UNKNOWN
 from psycopg2.extras import RealDictCursor
-from typing import List, Dict, Any, Optional, Tuple
+from contextlib import contextmanager
+from typing import List, Dict, Any, Optional, Tuple, Iterator, Callable
 import logging
+import base64
+import collections
+import datetime
+import json
 import os
-from config import POSTGRES_HOST, POSTGRES_PORT, POSTGRES_DB, POSTGRES_USER, POSTGRES_PASSWORD
+import queue
+import re
+import select
+import uuid
+import threading
+import time
+import weakref
+from functools import lru_cache
+from config import (
+    POSTGRES_HOST, POSTGRES_PORT, POSTGRES_DB, POSTGRES_USER, POSTGRES_PASSWORD,
+    POSTGRES_POOL_MIN, POSTGRES_POOL_MAX, POSTGRES_POOL_TIMEOUT, POSTGRES_POOL_PING_INTERVAL,
+    DB_CHANGE_NOTIFY, DB_PREPARED_STATEMENTS, ROW_COUNT_CACHE_TTL, ROW_COUNT_EXACT_LIMIT,
+    SLOW_QUERY_MS, SLOW_QUERY_LOG_SIZE, SLOW_QUERY_EXPLAIN_INTERVAL, SLOW_QUERY_EXPLAIN_TIMEOUT
+)
+from migrations import MigrationManager, SchemaVersionError
+from metrics import metrics, statement_fingerprint
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Колонки таблицы посетителей с количеством порций
+VISITOR_MEAL_COLUMNS = ('зд', 'зв', 'од', 'ов', 'уд', 'ув')
 
-class DatabaseManager:
-    """Менеджер для работы с PostgreSQL базой данных"""
+# Канал PostgreSQL NOTIFY для оповещения других процессов об изменении таблиц
+CHANGE_NOTIFY_CHANNEL = 'tornado_table_changed'
+
+# Колонки, по которым работает поиск при просмотре таблиц (индексы создает миграция 4)
+SEARCH_COLUMNS = {
+    'посетители': ('ФИО', 'номер'),
+    'справочник номеров': ('номер',),
+}
+
+# Частые запросы приложений и бота (плейсхолдеры %s), выполняются через StatementRegistry
+HOT_STATEMENTS = {
+    # Справочник номеров (загрузка кэша room_cache)
+    'room_directory': 'SELECT номер FROM "справочник номеров" ORDER BY номер',
+    # Проверка занятости номера на интервал дат
+    'date_conflicts': """
+        SELECT номер, дата, ФИО
+        FROM посетители
+        WHERE номер = %s
+        AND дата BETWEEN %s AND %s
+        ORDER BY дата
+    """,
+    # Занятые на интервал дат номера из списка (свободность всех номеров одним запросом)
+    'occupied_rooms': """
+        SELECT DISTINCT номер
+        FROM посетители
+        WHERE дата BETWEEN %s AND %s
+        AND номер = ANY(%s::varchar[])
+    """,
+    # Загрузка индекса занятости в память
+    'occupancy_since': """
+        SELECT номер, дата, ФИО FROM посетители
+        WHERE дата >= %s
+    """,
+    # Пакетная вставка дней проживания: записи передаются массивами-колонками
+    'visitor_insert': f"""
+        INSERT INTO посетители (номер, дата, ФИО, {', '.join(VISITOR_MEAL_COLUMNS)})
+        SELECT * FROM unnest(%s::varchar[], %s::date[], %s::varchar[],
+                             %s::int[], %s::int[], %s::int[], %s::int[], %s::int[], %s::int[])
+        ON CONFLICT (номер, дата, ФИО) DO NOTHING
+        RETURNING номер, дата, ФИО
+    """,
+    # Статистика главной страницы
+    'stats_total_records': "SELECT COALESCE(SUM(записей), 0) FROM питание_по_дням",
+    'stats_total_rooms': 'SELECT COUNT(*) FROM "справочник номеров"',
+    'stats_today_records': "SELECT COALESCE(SUM(записей), 0) FROM питание_по_дням WHERE дата = %s",
+}
+
+# Плейсхолдеры psycopg2 (%s) и экранированный процент (%%)
+_PLACEHOLDER_RE = re.compile(r'%%|%s')
+
+
+@lru_cache(maxsize=256)
+def convert_placeholders(query: str) -> str:
+    """Перевод запроса из стиля psycopg2 (%s) в нумерованные параметры сервера ($1, $2, ...)"""
+    counter = 0
     
-    def __init__(self):
-        self.connection = None
-        self.demo_mode = False
+    def replace(match):
+        nonlocal counter
+        if match.group(0) == '%%':
+            return '%'
+        counter += 1
+        return f'${counter}'
+    
+    return _PLACEHOLDER_RE.sub(replace, query)
+
+
+# Запросы, план которых снимается через EXPLAIN ANALYZE в откатываемой транзакции
+_EXPLAINABLE_RE = re.compile(r'^\s*(SELECT|WITH|INSERT|UPDATE|DELETE)\b', re.IGNORECASE)
+
+# Строковые параметры запросов с ФИО, которые не скрываются в журнале: номера (к1/1) и даты
+_PUBLIC_PARAM_RE = re.compile(r'^(\S+/\S+|\d{4}-\d{2}-\d{2})$')
+
+# Строковые литералы в тексте плана
+_SQL_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+
+# Замена скрытых значений в журнале медленных запросов
+REDACTED = '***'
+
+# Сколько медленных запросов может ждать снятия плана
+EXPLAIN_QUEUE_SIZE = 10
+
+
+def redact_params(query: str, params) -> Tuple[Any, List[str]]:
+    """Параметры запроса для журнала и список скрытых значений
+    
+    В запросах, обращающихся к колонке ФИО, строковые параметры (и элементы
+    массивов) заменяются на ***, кроме номеров и дат. Остальные запросы
+    персональных данных в параметрах не содержат и записываются как есть.
+    """
+    if not params or 'ФИО' not in query:
+        return params, []
+    hidden: List[str] = []
+    
+    def redact(value):
+        if isinstance(value, (list, tuple)):
+            return [redact(item) for item in value]
+        if isinstance(value, str) and not _PUBLIC_PARAM_RE.match(value):
+            hidden.append(value)
+            return REDACTED
+        return value
+    
+    return [redact(value) for value in params], hidden
+
+
+def _redact_plan(plan: str, hidden: List[str]) -> str:
+    """Скрытие значений в плане: литерал, содержащий скрытый параметр, заменяется целиком"""
+    lowered = {value.lower().replace("'", "''") for value in hidden if value}
+    if not lowered:
+        return plan
+    
+    def replace(match):
+        literal = match.group(0).lower()
+        return f"'{REDACTED}'" if any(value in literal for value in lowered) else match.group(0)
+    
+    return _SQL_STRING_RE.sub(replace, plan)
+
+
+def to_date(value) -> datetime.date:
+    """Дата из datetime.date, datetime или строки ГГГГ-ММ-ДД (параметры-массивы не приводятся сервером)"""
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    return datetime.date.fromisoformat(str(value))
+
+
+def encode_page_cursor(table_name: str, key: List[Any]) -> str:
+    """Непрозрачный курсор страницы: таблица и ключ последней показанной строки"""
+    payload = json.dumps([table_name, key], default=str, ensure_ascii=False, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_page_cursor(cursor: str, table_name: str) -> List[Any]:
+    """Ключ строки из курсора; ValueError, если курсор поврежден или выдан для другой таблицы"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        cursor_table, key = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+    except (ValueError, TypeError, UnicodeError):
+        raise ValueError("Неверный курсор страницы")
+    if cursor_table != table_name or not isinstance(key, list):
+        raise ValueError("Курсор страницы выдан для другой таблицы")
+    return key
+
+
+def _quote_identifier(name: str) -> str:
+    """Имя таблицы или колонки в кавычках (имена берутся из каталога, но могут содержать пробелы)"""
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _escape_like(value: str) -> str:
+    """Экранирование спецсимволов LIKE во введенной строке поиска"""
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+class PoolTimeoutError(Exception):
+    """Не удалось получить соединение из пула за отведенное время"""
+
+
+class ConnectionPool:
+    """Потокобезопасный пул соединений PostgreSQL
+    
+    Обертка над ThreadedConnectionPool: вместо немедленной ошибки при исчерпании
+    пула ждет освобождения соединения до таймаута и проверяет соединение при выдаче.
+    """
+    
+    def __init__(self, minconn: int, maxconn: int, timeout: float, ping_interval: float, **connect_kwargs):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.ping_interval = ping_interval
+        self._pool = pg_pool.ThreadedConnectionPool(minconn, maxconn, **connect_kwargs)
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._last_used: Dict[int, float] = {}
+        self._lock = threading.Lock()
+        self._in_use = 0
+    
+    def getconn(self):
+        """Выдача соединения из пула с ожиданием и проверкой работоспособности"""
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolTimeoutError(
+                f"Нет свободных соединений в пуле (max={self.maxconn}) за {self.timeout} с"
+            )
         try:
-            self.connect()
-            self.create_tables()
+            conn = self._pool.getconn()
+            if not self._is_healthy(conn):
+                logger.warning("Соединение из пула неработоспособно, открываем новое")
+                self._discard(conn)
+                conn = self._pool.getconn()
+            with self._lock:
+                self._in_use += 1
+            return conn
+        except Exception:
+            self._slots.release()
+            raise
+    
+    def putconn(self, conn, close: bool = False) -> None:
+        """Возврат соединения в пул"""
+        try:
+            if close or conn.closed:
+                self._discard(conn)
+            else:
+                self._last_used[id(conn)] = time.monotonic()
+                self._pool.putconn(conn)
+        finally:
+            with self._lock:
+                self._in_use -= 1
+            self._slots.release()
+    
+    def closeall(self) -> None:
+        """Закрытие всех соединений пула"""
+        self._last_used.clear()
+        if not self._pool.closed:
+            self._pool.closeall()
+    
+    def get_status(self) -> Dict[str, Any]:
+        """Текущее состояние пула"""
+        return {
+            'min': self.minconn,
+            'max': self.maxconn,
+            'in_use': self._in_use,
+            'idle': len(self._pool._pool),
+        }
+    
+    def _discard(self, conn) -> None:
+        """Закрытие соединения и удаление его из пула"""
+        self._last_used.pop(id(conn), None)
+        self._pool.putconn(conn, close=True)
+    
+    def _is_healthy(self, conn) -> bool:
+        """Проверка соединения при выдаче
+        
+        Закрытые соединения и соединения в неизвестном состоянии отбраковываются сразу,
+        а долго простаивавшие дополнительно проверяются запросом SELECT 1.
+        """
+        if conn.closed:
+            return False
+        status = conn.info.transaction_status
+        if status == TRANSACTION_STATUS_UNKNOWN:
+            return False
+        if status != TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except Exception:
+                return False
+        
+        last_used = self._last_used.get(id(conn))
+        if last_used is not None and time.monotonic() - last_used < self.ping_interval:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+
+class RowCountProvider:
+    """Количество строк таблиц для экранов информации о таблице
+    
+    Сначала берется оценка из статистики (pg_class.reltuples с поправкой на текущий
+    размер таблицы, как у планировщика, или pg_stat_user_tables.n_live_tup для таблиц
+    без ANALYZE). Таблицы меньше exact_limit строк считаются точно через COUNT(*),
+    большие - показываются с оценкой. Результат кэшируется на ttl секунд и сбрасывается
+    при изменении таблицы через DatabaseManager.
+    """
+    
+    def __init__(self, db_manager, ttl: float = ROW_COUNT_CACHE_TTL, exact_limit: int = ROW_COUNT_EXACT_LIMIT):
+        self.db_manager = db_manager
+        self.ttl = ttl
+        self.exact_limit = exact_limit
+        self._lock = threading.Lock()
+        self._cache: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+    
+    def get(self, table_name: str) -> Dict[str, Any]:
+        """{'count': число строк, 'exact': True для COUNT(*), False для оценки}"""
+        with self._lock:
+            cached = self._cache.get(table_name)
+            if cached and cached[0] > time.monotonic():
+                return cached[1]
+        
+        estimate = self.estimate(table_name)
+        if estimate is None or estimate < self.exact_limit:
+            result = {'count': self.db_manager.get_table_row_count(table_name), 'exact': True}
+        else:
+            result = {'count': estimate, 'exact': False}
+        
+        with self._lock:
+            self._cache[table_name] = (time.monotonic() + self.ttl, result)
+        return result
+    
+    def estimate(self, table_name: str) -> Optional[int]:
+        """Оценка числа строк по статистике без чтения таблицы (None, если статистики нет)"""
+        result = self.db_manager.execute_query("""
+            SELECT c.reltuples, c.relpages,
+                   pg_relation_size(c.oid) / current_setting('block_size')::int AS pages,
+                   s.n_live_tup
+            FROM pg_class c
+            LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid
+            WHERE c.oid = to_regclass(quote_ident(%s))
+        """, (table_name,))
+        if not result:
+            return None
+        stats = result[0]
+        if stats['reltuples'] >= 0 and stats['relpages'] > 0:
+            # Плотность строк на страницу из последнего ANALYZE на текущее число страниц
+            return int(stats['reltuples'] / stats['relpages'] * stats['pages'])
+        if stats['n_live_tup']:
+            return int(stats['n_live_tup'])
+        return None
+    
+    def invalidate(self, table_name: Optional[str] = None) -> None:
+        """Сброс кэша таблицы (или всех таблиц)"""
+        with self._lock:
+            if table_name is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(table_name, None)
+
+
+class SlowQueryLog:
+    """Кольцевой буфер медленных запросов с планами EXPLAIN (ANALYZE, BUFFERS)
+    
+    Запросы дольше threshold_ms попадают в буфер на size записей: текст, параметры
+    (ФИО скрыты, см. redact_params), время выполнения. План снимается в фоновом потоке:
+    запрос выполняется заново под EXPLAIN (ANALYZE, BUFFERS) в транзакции, которая затем
+    откатывается (изменения не сохраняются, но последовательности сдвигаются). Для одного
+    запроса план снимается не чаще раза в explain_interval секунд, а время повторного
+    выполнения ограничено statement_timeout = explain_timeout.
+    """
+    
+    def __init__(self, db_manager, threshold_ms: float = SLOW_QUERY_MS, size: int = SLOW_QUERY_LOG_SIZE,
+                 explain_interval: float = SLOW_QUERY_EXPLAIN_INTERVAL,
+                 explain_timeout: str = SLOW_QUERY_EXPLAIN_TIMEOUT):
+        self.db_manager = db_manager
+        # threshold_ms <= 0 - журнал выключен
+        self.threshold = threshold_ms / 1000 if threshold_ms > 0 else None
+        self.explain_interval = explain_interval
+        self.explain_timeout = explain_timeout
+        self._lock = threading.Lock()
+        self._entries: 'collections.deque[Dict[str, Any]]' = collections.deque(maxlen=size)
+        self._explained_at: Dict[str, float] = {}
+        self._queue: 'queue.Queue' = queue.Queue(maxsize=EXPLAIN_QUEUE_SIZE)
+        self._thread: Optional[threading.Thread] = None
+        self.recorded_total = 0
+    
+    def is_slow(self, seconds: float) -> bool:
+        """Превышает ли время выполнения порог журнала"""
+        return self.threshold is not None and seconds >= self.threshold
+    
+    def record(self, statement: str, query: str, params, seconds: float) -> None:
+        """Запись медленного запроса; statement - имя запроса реестра или отпечаток текста"""
+        redacted, hidden = redact_params(query, params)
+        text = ' '.join(query.split())
+        if 'ФИО' in query:
+            # Значения, записанные прямо в тексте запроса, скрываются так же, как параметры
+            literals = [literal[1:-1].replace("''", "'") for literal in _SQL_STRING_RE.findall(text)]
+            hidden += [value for value in literals if not _PUBLIC_PARAM_RE.match(value)]
+            text = _redact_plan(text, hidden)
+        entry = {
+            'time': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'statement': statement,
+            'query': text,
+            'params': redacted,
+            'duration_ms': round(seconds * 1000, 1),
+            'plan': None,
+            'plan_status': 'not_sampled',
+        }
+        now = time.monotonic()
+        with self._lock:
+            self._entries.append(entry)
+            self.recorded_total += 1
+            last_explained = self._explained_at.get(statement)
+            explain = bool(_EXPLAINABLE_RE.match(query)) and (
+                last_explained is None or now - last_explained >= self.explain_interval
+            )
+            if explain:
+                self._explained_at[statement] = now
+                entry['plan_status'] = 'pending'
+        metrics.inc('db_slow_queries_total', statement=statement)
+        logger.warning(f"Медленный запрос ({entry['duration_ms']} мс): {statement[:120]}")
+        
+        if explain:
+            try:
+                self._queue.put_nowait((entry, query, params, hidden))
+            except queue.Full:
+                entry['plan_status'] = 'skipped'
+                return
+            self._ensure_thread()
+    
+    def get_entries(self) -> List[Dict[str, Any]]:
+        """Записи буфера, новые первыми"""
+        with self._lock:
+            return [dict(entry) for entry in reversed(self._entries)]
+    
+    def clear(self) -> None:
+        """Очистка буфера"""
+        with self._lock:
+            self._entries.clear()
+    
+    def _ensure_thread(self) -> None:
+        """Запуск потока снятия планов при первом медленном запросе"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='slow-query-explain', daemon=True)
+                self._thread.start()
+    
+    def _run(self) -> None:
+        """Цикл фонового потока: план для каждого запроса из очереди"""
+        while True:
+            entry, query, params, hidden = self._queue.get()
+            try:
+                plan = self._explain(query, params)
+                entry['plan'] = _redact_plan(plan, hidden)
+                entry['plan_status'] = 'done'
+            except Exception as e:
+                # Текст ошибки может содержать значения строки - в журнал идет только её тип
+                entry['plan'] = type(e).__name__
+                entry['plan_status'] = 'error'
+                logger.error(f"Не удалось получить план медленного запроса {entry['statement'][:120]}: {type(e).__name__}")
+    
+    def _explain(self, query: str, params) -> str:
+        """EXPLAIN (ANALYZE, BUFFERS) в транзакции с откатом"""
+        with self.db_manager.get_connection() as conn:
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute("SET LOCAL statement_timeout = %s", (self.explain_timeout,))
+                    if params:
+                        cursor.execute("EXPLAIN (ANALYZE, BUFFERS) " + query, params)
+                    else:
+                        cursor.execute("EXPLAIN (ANALYZE, BUFFERS) " + query)
+                    return '\n'.join(row[0] for row in cursor.fetchall())
+            finally:
+                conn.rollback()
+
+
+class StatementRegistry:
+    """Именованные частые запросы, подготовленные на сервере для каждого соединения пула
+    
+    При первом выполнении на соединении запрос подготавливается (PREPARE), дальше
+    выполняется по имени (EXECUTE): сервер не разбирает и не планирует его заново.
+    Подготовленные запросы живут до закрытия соединения, поэтому учет ведется по
+    объектам соединений. Время выполнения учитывается в metrics по имени запроса.
+    При DB_PREPARED_STATEMENTS=0 запросы выполняются обычным текстом (например, за
+    pgbouncer в режиме transaction pooling, где серверное соединение не закреплено).
+    """
+    
+    def __init__(self, db_manager, statements: Dict[str, str] = HOT_STATEMENTS,
+                 prepare: bool = DB_PREPARED_STATEMENTS):
+        self.db_manager = db_manager
+        self.prepare = prepare
+        self._statements: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        # Имена запросов, подготовленных на каждом соединении (закрытые соединения удаляются сами)
+        self._prepared: 'weakref.WeakKeyDictionary[Any, set]' = weakref.WeakKeyDictionary()
+        for name, query in statements.items():
+            self.register(name, query)
+    
+    def register(self, name: str, query: str) -> None:
+        """Добавление запроса в реестр (имя - идентификатор SQL, он же имя подготовленного запроса)"""
+        if not name.isidentifier() or not name.isascii():
+            raise ValueError(f"Недопустимое имя запроса: {name}")
+        with self._lock:
+            if name in self._statements and self._statements[name] != query:
+                raise ValueError(f"Запрос {name} уже зарегистрирован с другим текстом")
+            self._statements[name] = query
+    
+    def execute(self, cursor, name: str, params: tuple = ()) -> None:
+        """Выполнение запроса по имени на курсоре; результат читается из курсора"""
+        try:
+            query = self._statements[name]
+        except KeyError:
+            raise ValueError(f"Запрос {name} не зарегистрирован")
+        params = tuple(params)
+        started = time.perf_counter()
+        try:
+            if self.prepare:
+                self._execute_prepared(cursor, name, query, params)
+            else:
+                cursor.execute(query, params or None)
+        except Exception:
+            metrics.inc('db_statement_errors_total', statement=name)
+            raise
+        finally:
+            self.db_manager._statement_finished(name, query, params, started)
+    
+    def query(self, name: str, params: tuple = ()) -> List[Dict[str, Any]]:
+        """Выполнение запроса по имени на соединении из пула с возвратом строк"""
+        try:
+            with self.db_manager.get_cursor(cursor_factory=RealDictCursor) as cursor:
+                self.execute(cursor, name, params)
+                return [dict(row) for row in cursor.fetchall()]
         except Exception as e:
-            logger.warning(f"Не удалось подключиться к PostgreSQL БД: {e}")
-            logger.info("Переключение в демо-режим")
-            self.demo_mode = True
+            logger.error(f"Ошибка выполнения запроса {name} PostgreSQL: {e}")
+            raise
+    
+    def get_metrics(self) -> Dict[str, Dict[str, Any]]:
+        """Гистограммы времени выполнения по именам запросов"""
+        return {
+            name: metrics.histogram('db_statement_duration_seconds', statement=name).snapshot()
+            for name in list(self._statements)
+        }
+    
+    def reset(self) -> None:
+        """Сброс учета подготовленных запросов (в дочернем процессе после fork)"""
+        with self._lock:
+            self._prepared = weakref.WeakKeyDictionary()
+    
+    def _execute_prepared(self, cursor, name: str, query: str, params: tuple) -> None:
+        """PREPARE при первом выполнении на соединении, затем EXECUTE по имени"""
+        conn = cursor.connection
+        with self._lock:
+            prepared = self._prepared.setdefault(conn, set())
+        if name not in prepared:
+            # PREPARE не отменяется откатом транзакции: запрос подготовлен до закрытия соединения
+            cursor.execute(f"PREPARE {name} AS {convert_placeholders(query)}")
+            prepared.add(name)
+        try:
+            if params:
+                cursor.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
+            else:
+                cursor.execute(f"EXECUTE {name}")
+        except psycopg2.errors.InvalidSqlStatementName:
+            # Сеанс сброшен на сервере (DISCARD ALL): запрос подготовится заново при следующем выполнении
+            prepared.discard(name)
+            raise
+
+
+class DatabaseManager:
+    """Менеджер для работы с PostgreSQL базой данных
+    
+    Подключение и проверка версии схемы выполняются не при создании, а при первом
+    обращении к базе (запрос, is_connected(), demo_mode), поэтому импорт модуля
+    не зависит от доступности PostgreSQL. Создание и обновление схемы - отдельный
+    шаг: python migrations.py migrate (или DB_AUTO_MIGRATE=1).
+    """
+    
+    def __init__(self):
+        self.pool = None
+        self._demo_mode = False
+        self._initialized = False
+        self._init_lock = threading.RLock()
+        self._init_thread: Optional[int] = None
+        # Несовпадение версии схемы запоминается: пул не пересоздается при каждом обращении
+        self._init_error: Optional[SchemaVersionError] = None
+        self.change_listeners: Dict[str, List[Callable[[str, Optional[List[Dict[str, Any]]]], None]]] = {}
+        self.notify_thread = None
+        # Пулы, унаследованные от родительского процесса при fork (см. reinit_after_fork)
+        self._inherited_pools: List[ConnectionPool] = []
+        # Первичные ключи таблиц и наличие pg_trgm (схема меняется только миграциями)
+        self._primary_keys: Dict[str, List[str]] = {}
+        self._trigram_search: Optional[bool] = None
+        self.row_counts = RowCountProvider(self)
+        self.statements = StatementRegistry(self)
+        self.slow_queries = SlowQueryLog(self)
+        self._token_pid = None
+        self._token = None
+        self.connect_kwargs = {
+            'host': POSTGRES_HOST,
+            'port': POSTGRES_PORT,
+            'database': POSTGRES_DB,
+            'user': POSTGRES_USER,
+            'password': POSTGRES_PASSWORD
+        }
+    
+    @property
+    def demo_mode(self) -> bool:
+        """Работа без PostgreSQL (сервер недоступен при первом подключении)"""
+        self.initialize()
+        return self._demo_mode
+    
+    @demo_mode.setter
+    def demo_mode(self, value: bool) -> None:
+        self._demo_mode = value
+    
+    def initialize(self, verify_schema: bool = True) -> None:
+        """Подключение и проверка версии схемы; повторные вызовы ничего не делают
+        
+        verify_schema=False - только подключение (для самих миграций).
+        """
+        if self._init_error is not None:
+            raise self._init_error
+        if self._initialized or self._init_thread == threading.get_ident():
+            # Уже готово или это запрос самой проверки схемы
+            return
+        with self._init_lock:
+            if self._init_error is not None:
+                raise self._init_error
+            if self._initialized:
+                return
+            self._init_thread = threading.get_ident()
+            try:
+                self.connect()
+                if verify_schema:
+                    MigrationManager(self).ensure_schema()
+            except SchemaVersionError as e:
+                # Несовпадение версии схемы - ошибка развертывания, демо-режим её бы скрыл;
+                # до перезапуска процесса все обращения к базе получают эту же ошибку
+                logger.error(f"Схема БД не подходит приложению: {e}")
+                self._init_error = e
+                self.disconnect()
+                raise
+            except Exception as e:
+                logger.warning(f"Не удалось подключиться к PostgreSQL БД: {e}")
+                logger.info("Переключение в демо-режим")
+                self._demo_mode = True
+            finally:
+                self._init_thread = None
+            self._initialized = True
+        
+        if DB_CHANGE_NOTIFY and self.change_listeners and not self._demo_mode:
+            self.start_change_listener()
     
     def connect(self) -> None:
-        """Установка соединения с PostgreSQL базой данных"""
+        """Создание пула соединений с PostgreSQL базой данных"""
         try:
-            self.connection = psycopg2.connect(
-                host=POSTGRES_HOST,
-                port=POSTGRES_PORT,
-                database=POSTGRES_DB,
-                user=POSTGRES_USER,
-                password=POSTGRES_PASSWORD
+            if self.pool:
+                self.pool.closeall()
+            self.pool = ConnectionPool(
+                POSTGRES_POOL_MIN,
+                POSTGRES_POOL_MAX,
+                POSTGRES_POOL_TIMEOUT,
+                POSTGRES_POOL_PING_INTERVAL,
+                **self.connect_kwargs
+            )
+            logger.info(
+                f"Успешное подключение к PostgreSQL: {POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB} "
+                f"(пул {POSTGRES_POOL_MIN}-{POSTGRES_POOL_MAX})"
             )
-            logger.info(f"Успешное подключение к PostgreSQL: {POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}")
         except Exception as e:
+            self.pool = None
             logger.error(f"Ошибка подключения к PostgreSQL: {e}")
             raise
     
+    def reinit_after_fork(self) -> None:
+        """Сброс пула соединений в дочернем процессе (воркер gunicorn после fork)
+        
+        Унаследованные соединения не закрываются: закрытие отправило бы серверу завершение
+        сеанса по общему с родителем сокету. Они остаются в памяти воркера неиспользуемыми.
+        Поток LISTEN не переживает fork, поэтому запускается заново.
+        """
+        if self.pool:
+            self._inherited_pools.append(self.pool)
+            self.pool = None
+        self.notify_thread = None
+        self.statements.reset()
+        # Пул создается при первом запросе воркера (get_connection), загрузка воркера его не ждет
+        if DB_CHANGE_NOTIFY and self.change_listeners and self._initialized and not self._demo_mode:
+            self.start_change_listener()
+    
+    def collect_metrics(self) -> List[Tuple[str, str, str, Dict[str, Any], Any]]:
+        """Состояние пула соединений для /metrics (до первого подключения - пусто)"""
+        if not self.pool:
+            return []
+        status = self.pool.get_status()
+        return [
+            ('db_pool_connections_in_use', 'gauge', 'Соединения пула, выданные запросам', {}, status['in_use']),
+            ('db_pool_connections_idle', 'gauge', 'Свободные открытые соединения пула', {}, status['idle']),
+            ('db_pool_connections_max', 'gauge', 'Размер пула соединений', {}, status['max']),
+            ('db_demo_mode', 'gauge', 'Работа без PostgreSQL (демо-режим)', {}, self._demo_mode),
+        ]
+    
+    def open_dedicated_connection(self):
+        """Открытие отдельного соединения вне пула (для блокировок и долгих служебных операций)"""
+        return psycopg2.connect(**self.connect_kwargs)
+    
     def disconnect(self) -> None:
-        """Закрытие соединения с базой данных"""
-        if self.connection:
-            self.connection.close()
-            logger.info("Соединение с PostgreSQL закрыто")
+        """Закрытие всех соединений с базой данных"""
+        if self.pool:
+            self.pool.closeall()
+            self.pool = None
+            logger.info("Соединения с PostgreSQL закрыты")
     
     def is_connected(self) -> bool:
-        """Проверка состояния соединения с базой данных"""
+        """Проверка состояния соединения с базой данных (SchemaVersionError не скрывается)"""
+        self.initialize()
         try:
-            if self.connection:
+            if self.pool:
                 # Проверяем соединение простым запросом
-                cursor = self.connection.cursor()
-                cursor.execute("SELECT 1")
+                with self.get_cursor() as cursor:
+                    cursor.execute("SELECT 1")
                 return True
             return False
         except Exception:
             return False
     
+    @contextmanager
+    def get_connection(self) -> Iterator[Any]:
+        """Получение соединения из пула на время запроса
+        
+        При исключении транзакция откатывается, а соединение, потерявшее связь
+        с сервером, закрывается вместо возврата в пул.
+        """
+        self.initialize()
+        if not self.pool:
+            self.connect()
+        
+        pool = self.pool
+        conn = pool.getconn()
+        broken = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        except Exception:
+            if not conn.closed:
+                conn.rollback()
+            raise
+        finally:
+            pool.putconn(conn, close=broken)
+    
+    @contextmanager
+    def get_cursor(self, cursor_factory=None, commit: bool = False) -> Iterator[Any]:
+        """Курсор на соединении из пула; при commit=True фиксирует транзакцию по выходу"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor(cursor_factory=cursor_factory)
+            try:
+                yield cursor
+                if commit:
+                    conn.commit()
+            finally:
+                cursor.close()
+    
     def create_tables(self) -> None:
-        """Создание таблиц в PostgreSQL базе данных"""
+        """Создание таблиц базовой схемы (миграция 1) в PostgreSQL базе данных"""
         try:
-            cursor = self.connection.cursor()
-            
-            # Создание таблицы справочника номеров
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS "справочник номеров" (
-                    номер VARCHAR(50) PRIMARY KEY
-                )
-            """)
-            
-            # Создание таблицы посетителей
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS посетители (
-                    id SERIAL PRIMARY KEY,
-                    номер VARCHAR(50) NOT NULL,
-                    дата VARCHAR(20) NOT NULL,
-                    ФИО VARCHAR(200) NOT NULL,
-                    зд INTEGER DEFAULT 0,
-                    зв INTEGER DEFAULT 0,
-                    од INTEGER DEFAULT 0,
-                    ов INTEGER DEFAULT 0,
-                    уд INTEGER DEFAULT 0,
-                    ув INTEGER DEFAULT 0,
-                    UNIQUE(номер, дата, ФИО)
-                )
-            """)
+            with self.get_cursor(commit=True) as cursor:
+                # Создание таблицы справочника номеров
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS "справочник номеров" (
+                        номер VARCHAR(50) PRIMARY KEY
+                    )
+                """)
+                
+                # Создание таблицы посетителей
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS посетители (
+                        id SERIAL PRIMARY KEY,
+                        номер VARCHAR(50) NOT NULL,
+                        дата VARCHAR(20) NOT NULL,
+                        ФИО VARCHAR(200) NOT NULL,
+                        зд INTEGER DEFAULT 0,
+                        зв INTEGER DEFAULT 0,
+                        од INTEGER DEFAULT 0,
+                        ов INTEGER DEFAULT 0,
+                        уд INTEGER DEFAULT 0,
+                        ув INTEGER DEFAULT 0,
+                        UNIQUE(номер, дата, ФИО)
+                    )
+                """)
+                
+                # Добавляем базовые номера в справочник, если таблица пуста
+                cursor.execute('SELECT COUNT(*) FROM "справочник номеров"')
+                if cursor.fetchone()[0] == 0:
+                    base_rooms = ["к1/1", "к1/2", "к2/1", "Б1/1", "Б1/2"]
+                    for room in base_rooms:
+                        cursor.execute('INSERT INTO "справочник номеров" (номер) VALUES (%s)', (room,))
+                    logger.info("Добавлены базовые номера в справочник")
             
-            # Добавляем базовые номера в справочник, если таблица пуста
-            cursor.execute('SELECT COUNT(*) FROM "справочник номеров"')
-            if cursor.fetchone()[0] == 0:
-                base_rooms = ["к1/1", "к1/2", "к2/1", "Б1/1", "Б1/2"]
-                for room in base_rooms:
-                    cursor.execute('INSERT INTO "справочник номеров" (номер) VALUES (%s)', (room,))
-                logger.info("Добавлены базовые номера в справочник")
-            
-            self.connection.commit()
             logger.info("Таблицы PostgreSQL созданы/проверены успешно")
             
         except Exception as e:
@@ -103,40 +803,132 @@ class DatabaseManager:
     
     def execute_query(self, query: str, params: tuple = None) -> List[Dict[str, Any]]:
         """Выполнение SQL запроса с возвратом результатов"""
+        fingerprint = statement_fingerprint(query)
+        started = time.perf_counter()
         try:
-            if not self.connection:
-                self.connect()
-            
-            cursor = self.connection.cursor(cursor_factory=RealDictCursor)
-            if params:
-                cursor.execute(query, params)
-            else:
-                cursor.execute(query)
-            
-            result = cursor.fetchall()
-            return [dict(row) for row in result]
+            with self.get_cursor(cursor_factory=RealDictCursor) as cursor:
+                if params:
+                    cursor.execute(query, params)
+                else:
+                    cursor.execute(query)
+                
+                result = cursor.fetchall()
+                return [dict(row) for row in result]
         except Exception as e:
+            metrics.inc('db_statement_errors_total', statement=fingerprint)
             logger.error(f"Ошибка выполнения запроса PostgreSQL: {e}")
             raise
+        finally:
+            # Время с ожиданием соединения из пула: его и видит вызывающий код
+            self._statement_finished(fingerprint, query, params, started)
     
-    def execute_update(self, query: str, params: tuple = None) -> int:
-        """Выполнение SQL запроса для обновления данных"""
+    def execute_update(self, query: str, params: tuple = None, changed_table: str = None) -> int:
+        """Выполнение SQL запроса для обновления данных
+        
+        changed_table - имя изменяемой таблицы: после фиксации транзакции
+        подписчики на её изменения получат оповещение.
+        """
+        fingerprint = statement_fingerprint(query)
+        started = time.perf_counter()
         try:
-            if not self.connection:
-                self.connect()
-            
-            cursor = self.connection.cursor()
-            if params:
-                cursor.execute(query, params)
-            else:
-                cursor.execute(query)
+            with self.get_cursor(commit=True) as cursor:
+                if params:
+                    cursor.execute(query, params)
+                else:
+                    cursor.execute(query)
+                
+                rows_affected = cursor.rowcount
+                if changed_table and rows_affected:
+                    self._send_change_notify(cursor, changed_table)
             
-            self.connection.commit()
-            rows_affected = cursor.rowcount
+            if changed_table and rows_affected:
+                self._dispatch_change(changed_table)
             return rows_affected
         except Exception as e:
+            metrics.inc('db_statement_errors_total', statement=fingerprint)
             logger.error(f"Ошибка выполнения обновления PostgreSQL: {e}")
             raise
+        finally:
+            self._statement_finished(fingerprint, query, params, started)
+    
+    def _statement_finished(self, statement: str, query: str, params, started: float) -> None:
+        """Учет выполненного запроса: гистограмма в metrics и журнал медленных запросов"""
+        duration = time.perf_counter() - started
+        metrics.observe('db_statement_duration_seconds', duration, statement=statement)
+        if self.slow_queries.is_slow(duration):
+            self.slow_queries.record(statement, query, params, duration)
+    
+    def add_change_listener(self, table_name: str,
+                            callback: Callable[[str, Optional[List[Dict[str, Any]]]], None]) -> None:
+        """Подписка на изменения таблицы, сделанные через DatabaseManager
+        
+        callback(table_name, rows) вызывается после фиксации изменений; rows - вставленные
+        строки, если они известны, или None (например, для оповещений из других процессов).
+        При DB_CHANGE_NOTIFY=1 оповещения доставляются и между процессами через LISTEN/NOTIFY.
+        """
+        self.change_listeners.setdefault(table_name, []).append(callback)
+        # До первого подключения поток LISTEN не нужен: его запустит initialize()
+        if DB_CHANGE_NOTIFY and self._initialized and not self._demo_mode:
+            self.start_change_listener()
+    
+    def _process_token(self) -> str:
+        """Идентификатор процесса-отправителя NOTIFY (обновляется после fork)"""
+        if self._token_pid != os.getpid():
+            self._token_pid = os.getpid()
+            self._token = uuid.uuid4().hex
+        return self._token
+    
+    def _send_change_notify(self, cursor, table_name: str) -> None:
+        """Отправка NOTIFY в текущей транзакции (доставляется другим процессам при фиксации)"""
+        if DB_CHANGE_NOTIFY:
+            payload = json.dumps({'table': table_name, 'source': self._process_token()})
+            cursor.execute("SELECT pg_notify(%s, %s)", (CHANGE_NOTIFY_CHANNEL, payload))
+    
+    def _dispatch_change(self, table_name: str, rows: Optional[List[Dict[str, Any]]] = None) -> None:
+        """Вызов локальных подписчиков на изменения таблицы"""
+        self.row_counts.invalidate(table_name)
+        for callback in self.change_listeners.get(table_name, []):
+            try:
+                callback(table_name, rows)
+            except Exception as e:
+                logger.error(f"Ошибка обработчика изменений таблицы {table_name}: {e}")
+    
+    def start_change_listener(self) -> None:
+        """Запуск фонового потока LISTEN для оповещений об изменениях из других процессов"""
+        if self.notify_thread and self.notify_thread.is_alive():
+            return
+        self.notify_thread = threading.Thread(target=self._listen_changes, name='db-change-listener', daemon=True)
+        self.notify_thread.start()
+    
+    def _listen_changes(self) -> None:
+        """Цикл получения NOTIFY на отдельном соединении с переподключением при обрыве"""
+        while True:
+            conn = None
+            try:
+                conn = self.open_dedicated_connection()
+                conn.autocommit = True
+                with conn.cursor() as cursor:
+                    cursor.execute(f"LISTEN {CHANGE_NOTIFY_CHANNEL}")
+                logger.info(f"Подписка на оповещения об изменениях таблиц ({CHANGE_NOTIFY_CHANNEL})")
+                
+                while True:
+                    if select.select([conn], [], [], 60) == ([], [], []):
+                        continue
+                    conn.poll()
+                    changed_tables = set()
+                    while conn.notifies:
+                        payload = json.loads(conn.notifies.pop(0).payload)
+                        # Свои изменения уже разосланы локальным подписчикам вместе со строками
+                        if payload['source'] != self._process_token():
+                            changed_tables.add(payload['table'])
+                    for table_name in changed_tables:
+                        self._dispatch_change(table_name)
+            except Exception as e:
+                logger.warning(f"Потеряно соединение для оповещений об изменениях: {e}")
+                time.sleep(5)
+            finally:
+                if conn is not None and not conn.closed:
+                    conn.close()
     
     def get_tables(self) -> List[str]:
         """Получение списка всех таблиц в базе данных"""
@@ -227,7 +1019,8 @@ class DatabaseManager:
                     ],
                     'columns': ['id', 'имя', 'дата'],
                     'sample_data': [{'id': 1, 'имя': 'Иванов И.И.', 'дата': '2024-01-15'}],
-                    'row_count': 5
+                    'row_count': 5,
+                    'row_count_exact': True
                 },
                 "справочник номеров": {
                     'name': 'справочник номеров',
@@ -236,7 +1029,8 @@ class DatabaseManager:
                     ],
                     'columns': ['номер'],
                     'sample_data': [{'номер': 'к1/1'}, {'номер': 'к1/2'}, {'номер': 'к2/1'}],
-                    'row_count': 6
+                    'row_count': 6,
+                    'row_count_exact': True
                 }
             }
             return demo_data.get(table_name, demo_data["демо_таблица_1"])
@@ -244,20 +1038,23 @@ class DatabaseManager:
         try:
             structure = self.get_table_structure(table_name)
             sample_data = self.get_table_data(table_name, 1)
+            # Для больших таблиц - оценка из статистики вместо полного COUNT(*)
+            row_count = self.row_counts.get(table_name)
             
             return {
                 'name': table_name,
                 'structure': structure,
                 'columns': [col['Field'] for col in structure],
                 'sample_data': sample_data,
-                'row_count': self.get_table_row_count(table_name)
+                'row_count': row_count['count'],
+                'row_count_exact': row_count['exact']
             }
         except Exception as e:
             logger.error(f"Ошибка получения информации о таблице {table_name}: {e}")
             raise
     
     def get_table_row_count(self, table_name: str) -> int:
-        """Получение количества строк в таблице"""
+        """Точное количество строк в таблице (COUNT(*); для экранов - row_counts.get())"""
         # Обрабатываем имена таблиц с пробелами
         if ' ' in table_name:
             query = f'SELECT COUNT(*) as count FROM "{table_name}"'
@@ -266,14 +1063,106 @@ class DatabaseManager:
         result = self.execute_query(query)
         return result[0]['count'] if result else 0
     
-    def search_in_table(self, table_name: str, search_column: str, search_value: str) -> List[Dict[str, Any]]:
-        """Поиск данных в таблице"""
-        # Обрабатываем имена таблиц с пробелами
-        if ' ' in table_name:
-            query = f'SELECT * FROM "{table_name}" WHERE {search_column} ILIKE %s'
+    def get_primary_key(self, table_name: str) -> List[str]:
+        """Колонки первичного ключа таблицы в порядке индекса (пустой список, если ключа нет)"""
+        if table_name not in self._primary_keys:
+            result = self.execute_query("""
+                SELECT a.attname AS column_name
+                FROM pg_index i
+                JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey)
+                WHERE i.indrelid = to_regclass(quote_ident(%s)) AND i.indisprimary
+                ORDER BY array_position(i.indkey::int2[], a.attnum)
+            """, (table_name,))
+            self._primary_keys[table_name] = [row['column_name'] for row in result]
+        return self._primary_keys[table_name]
+    
+    def has_trigram_search(self, refresh: bool = False) -> bool:
+        """Установлено ли расширение pg_trgm (поиск подстроки по триграммным индексам)"""
+        if self._trigram_search is None or refresh:
+            result = self.execute_query("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            self._trigram_search = bool(result)
+        return self._trigram_search
+    
+    def _search_condition(self, columns: Tuple[str, ...], search_value: str) -> Tuple[str, List[str]]:
+        """Условие WHERE для поиска по колонкам и его параметры
+        
+        С pg_trgm ищется подстрока (ILIKE '%...%' по триграммным индексам), без него -
+        начало значения без учета регистра (индексы lower(колонка) text_pattern_ops).
+        """
+        escaped = _escape_like(search_value.strip())
+        if self.has_trigram_search():
+            conditions = [f"{_quote_identifier(column)} ILIKE %s" for column in columns]
+            params = [f"%{escaped}%"] * len(columns)
         else:
-            query = f"SELECT * FROM {table_name} WHERE {search_column} ILIKE %s"
-        return self.execute_query(query, (f"%{search_value}%",))
+            conditions = [f"lower({_quote_identifier(column)}) LIKE lower(%s)" for column in columns]
+            params = [f"{escaped}%"] * len(columns)
+        return '(' + ' OR '.join(conditions) + ')', params
+    
+    def get_table_page(self, table_name: str, limit: int = 10, cursor: Optional[str] = None,
+                       search: Optional[str] = None) -> Dict[str, Any]:
+        """Страница строк таблицы по порядку первичного ключа (keyset-пагинация)
+        
+        Следующая страница начинается после ключа из cursor, поэтому её чтение - поиск
+        по индексу первичного ключа, а не пропуск OFFSET строк. search ищет по колонкам
+        SEARCH_COLUMNS таблицы. Возвращает строки и next_cursor (None на последней странице).
+        """
+        if self.demo_mode:
+            rows = self.get_table_data(table_name, limit)
+            return {'table': table_name, 'rows': rows, 'next_cursor': None, 'search': search, 'search_mode': None}
+        
+        if table_name not in self.get_tables():
+            raise ValueError(f"Таблица {table_name} не найдена")
+        
+        key_columns = self.get_primary_key(table_name)
+        # Без первичного ключа страницы идут по физическому адресу строки
+        select_list = '*' if key_columns else '*, ctid'
+        key_columns = key_columns or ['ctid']
+        key_sql = ', '.join(_quote_identifier(column) for column in key_columns)
+        
+        conditions, params = [], []
+        search_mode = None
+        if search and search.strip():
+            columns = SEARCH_COLUMNS.get(table_name)
+            if not columns:
+                raise ValueError(f"Поиск по таблице {table_name} не поддерживается")
+            condition, search_params = self._search_condition(columns, search)
+            conditions.append(condition)
+            params.extend(search_params)
+            search_mode = 'trigram' if self.has_trigram_search() else 'prefix'
+        if cursor:
+            key = decode_page_cursor(cursor, table_name)
+            if len(key) != len(key_columns):
+                raise ValueError("Курсор страницы не соответствует ключу таблицы")
+            conditions.append(f"({key_sql}) > ({', '.join(['%s'] * len(key))})")
+            params.extend(key)
+        
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        # Лишняя строка показывает, есть ли следующая страница
+        query = f"SELECT {select_list} FROM {_quote_identifier(table_name)} {where} ORDER BY {key_sql} LIMIT %s"
+        rows = self.execute_query(query, tuple(params) + (limit + 1,))
+        
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_page_cursor(table_name, [rows[-1][column] for column in key_columns])
+        if select_list != '*':
+            for row in rows:
+                row.pop('ctid', None)
+        return {
+            'table': table_name,
+            'rows': rows,
+            'next_cursor': next_cursor,
+            'search': search,
+            'search_mode': search_mode,
+        }
+    
+    def search_in_table(self, table_name: str, search_column: str, search_value: str) -> List[Dict[str, Any]]:
+        """Поиск данных в таблице по одной колонке (те же правила, что у get_table_page)"""
+        if search_column not in self.get_table_columns(table_name):
+            raise ValueError(f"Колонка {search_column} не найдена в таблице {table_name}")
+        condition, params = self._search_condition((search_column,), search_value)
+        query = f"SELECT * FROM {_quote_identifier(table_name)} WHERE {condition}"
+        return self.execute_query(query, tuple(params))
     
     def insert_record(self, table_name: str, data: Dict[str, Any]) -> int:
         """Вставка новой записи в таблицу"""
@@ -285,7 +1174,7 @@ class DatabaseManager:
         else:
             query = f"INSERT INTO {table_name} ({columns}) VALUES ({placeholders})"
         
-        return self.execute_update(query, tuple(data.values()))
+        return self.execute_update(query, tuple(data.values()), changed_table=table_name)
     
     def update_record(self, table_name: str, data: Dict[str, Any], condition: Dict[str, Any]) -> int:
         """Обновление записи в таблице"""
@@ -298,8 +1187,42 @@ class DatabaseManager:
             query = f"UPDATE {table_name} SET {set_clause} WHERE {where_clause}"
         
         params = tuple(data.values()) + tuple(condition.values())
-        return self.execute_update(query, params)
+        return self.execute_update(query, params, changed_table=table_name)
 
+    def insert_visitor_records(self, records: List[Dict[str, Any]]) -> List[bool]:
+        """Пакетная вставка дней проживания в таблицу посетителей
+        
+        Все записи вставляются одним запросом в одной транзакции. Возвращает список
+        флагов в порядке записей: True - запись вставлена, False - такая
+        (номер, дата, ФИО) уже существовала и была пропущена.
+        """
+        if not records:
+            return []
+        
+        # Дни передаются массивами-колонками: один подготовленный запрос на любое число записей
+        arrays = (
+            [record['номер'] for record in records],
+            [to_date(record['дата']) for record in records],
+            [record['ФИО'] for record in records],
+        ) + tuple([record.get(column, 0) for record in records] for column in VISITOR_MEAL_COLUMNS)
+        
+        try:
+            with self.get_cursor(commit=True) as cursor:
+                self.statements.execute(cursor, 'visitor_insert', arrays)
+                inserted = cursor.fetchall()
+                if inserted:
+                    self._send_change_notify(cursor, 'посетители')
+        except Exception as e:
+            logger.error(f"Ошибка пакетной вставки посетителей PostgreSQL: {e}")
+            raise
+        
+        # Дата возвращается как date, а во входных записях может быть строкой или datetime
+        inserted_keys = {(room, date, name) for room, date, name in inserted}
+        inserted_flags = [(record['номер'], to_date(record['дата']), record['ФИО']) in inserted_keys for record in records]
+        if inserted:
+            self._dispatch_change('посетители', [record for record, flag in zip(records, inserted_flags) if flag])
+        return inserted_flags
+    
     def check_date_conflicts(self, room: str, start_date: str, end_date: str) -> List[Dict[str, Any]]:
         """Проверка пересечения дат с существующими записями"""
         try:
@@ -307,21 +1230,24 @@ class DatabaseManager:
                 # В демо-режиме возвращаем пустой список конфликтов
                 return []
             
-            query = """
-                SELECT номер, дата, ФИО
-                FROM посетители
-                WHERE номер = %s 
-                AND дата BETWEEN %s AND %s
-                ORDER BY дата
-            """
-            
-            result = self.execute_query(query, (room, start_date, end_date))
-            return result
+            return self.statements.query('date_conflicts', (room, start_date, end_date))
         except Exception as e:
             logger.error(f"Ошибка проверки конфликтов дат: {e}")
             return []
+    
+    def get_occupied_rooms(self, rooms: List[str], start_date, end_date) -> set:
+        """Номера из списка rooms, занятые хотя бы один день интервала [start_date, end_date]
+        
+        Ошибка БД не скрывается: пустой результат означал бы, что свободны все номера.
+        """
+        if self.demo_mode or not rooms:
+            return set()
+        
+        rows = self.statements.query('occupied_rooms', (to_date(start_date), to_date(end_date), list(rooms)))
+        return {row['номер'] for row in rows}
 
 
-# Создание глобального экземпляра менеджера базы данных
+# Создание глобального экземпляра менеджера базы данных (подключение - при первом обращении)
 db_manager = DatabaseManager()
+metrics.register_collector(db_manager.collect_metrics)
 
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import collections
+import queue
+import threading
+import time
+import logging
+from typing import Dict, List, Any, Optional, Tuple
+from config import BOT_WORKERS, BOT_QUEUE_SIZE, BOT_POLL_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+# Поля обновления Telegram, из которых берется отправитель
+UPDATE_FIELDS = (
+    'message', 'edited_message', 'callback_query', 'inline_query', 'chosen_inline_result',
+    'shipping_query', 'pre_checkout_query', 'poll_answer', 'my_chat_member', 'chat_member',
+    'chat_join_request', 'channel_post', 'edited_channel_post',
+)
+
+# Сколько последних задержек обработки хранить для перцентилей
+LATENCY_WINDOW = 1000
+
+
+def update_key(update) -> int:
+    """Ключ упорядочивания обновления: id пользователя, иначе id чата, иначе номер обновления"""
+    for field in UPDATE_FIELDS:
+        payload = getattr(update, field, None)
+        if payload is None:
+            continue
+        user = getattr(payload, 'from_user', None) or getattr(payload, 'user', None)
+        if user is not None:
+            return user.id
+        chat = getattr(payload, 'chat', None) or getattr(getattr(payload, 'message', None), 'chat', None)
+        if chat is not None:
+            return chat.id
+    return update.update_id
+
+
+class _Worker:
+    """Поток-обработчик со своей очередью и счетчиками"""
+    
+    def __init__(self, index: int, queue_size: int):
+        self.index = index
+        self.queue: 'queue.Queue' = queue.Queue(maxsize=queue_size)
+        self.thread: Optional[threading.Thread] = None
+        self.processed = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+
+
+class UpdateDispatcher:
+    """Параллельная обработка обновлений с сохранением порядка для каждого пользователя
+    
+    Обновление попадает в очередь потока с номером key % workers, где key - id
+    пользователя (update_key), поэтому сообщения одного пользователя обрабатываются
+    строго по очереди одним потоком (шаги RegistrationManager.process_step не
+    перемешиваются), а медленное сохранение одного пользователя не задерживает
+    пользователей других потоков. Бот должен быть создан с threaded=False, чтобы
+    обработчики выполнялись в потоке диспетчера.
+    """
+    
+    def __init__(self, bot, workers: int = BOT_WORKERS, queue_size: int = BOT_QUEUE_SIZE):
+        self.bot = bot
+        self.workers = [_Worker(index, queue_size) for index in range(workers)]
+        self._lock = threading.Lock()
+        self._latencies: 'collections.deque[float]' = collections.deque(maxlen=LATENCY_WINDOW)
+        self._started_at: Optional[float] = None
+        self._stopped_at: Optional[float] = None
+        self._running = False
+        self._stopping = threading.Event()
+        self.submitted = 0
+        self.rejected = 0
+    
+    def start(self) -> None:
+        """Запуск потоков-обработчиков (повторный вызов ничего не делает)"""
+        # Проверка и установка флага под блокировкой: два потока не запустят обработчики дважды
+        with self._lock:
+            if self._running:
+                if self._stopping.is_set():
+                    # Второй набор потоков нарушил бы порядок обновлений каждого пользователя
+                    raise RuntimeError("Диспетчер еще останавливается: не все потоки-обработчики завершились")
+                return
+            self._running = True
+            self._started_at = time.monotonic()
+            self._stopped_at = None
+            self._stopping.clear()
+            for worker in self.workers:
+                worker.thread = threading.Thread(
+                    target=self._run_worker, args=(worker,), name=f'bot-worker-{worker.index}', daemon=True
+                )
+                worker.thread.start()
+        logger.info(f"Диспетчер обновлений запущен: {len(self.workers)} потоков")
+    
+    def stop(self, timeout: float = 10) -> bool:
+        """Остановка после обработки уже принятых обновлений
+        
+        False - не все потоки завершились за timeout: диспетчер остается в состоянии
+        остановки и не запускается заново, повторный stop() дожидается оставшихся потоков.
+        """
+        with self._lock:
+            if not self._running:
+                return True
+            first_call = not self._stopping.is_set()
+            self._stopping.set()
+        if first_call:
+            for worker in self.workers:
+                worker.queue.put(None)
+        # Потоки дожидаются без блокировки: она нужна обработчикам для учета задержек
+        for worker in self.workers:
+            worker.thread.join(timeout)
+        alive = [worker.index for worker in self.workers if worker.thread.is_alive()]
+        if alive:
+            logger.warning(f"Потоки-обработчики {alive} не завершились за {timeout} с, диспетчер не остановлен")
+            return False
+        with self._lock:
+            self._running = False
+            self._stopped_at = time.monotonic()
+        logger.info("Диспетчер обновлений остановлен")
+        return True
+    
+    def submit(self, update, timeout: Optional[float] = None) -> bool:
+        """Постановка обновления в очередь его пользователя
+        
+        Если очередь заполнена, вызывающий поток ждет до timeout секунд (None - без
+        ограничения); False означает, что обновление не принято.
+        """
+        worker = self.workers[update_key(update) % len(self.workers)]
+        try:
+            worker.queue.put((update, time.monotonic()), timeout=timeout)
+        except queue.Full:
+            with self._lock:
+                self.rejected += 1
+            return False
+        with self._lock:
+            self.submitted += 1
+        return True
+    
+    def queue_depth(self) -> int:
+        """Общее число обновлений, ожидающих обработки"""
+        return sum(worker.queue.qsize() for worker in self.workers)
+    
+    def run_polling(self, poll_timeout: int = BOT_POLL_TIMEOUT) -> None:
+        """Цикл long polling: обновления сразу передаются в очереди потоков
+        
+        В отличие от bot.polling(interval=1) между запросами нет паузы: Telegram
+        держит запрос до poll_timeout секунд и отвечает, как только есть сообщения.
+        После ошибки сети запрос повторяется с нарастающей паузой (до 30 секунд).
+        """
+        self.start()
+        offset = None
+        error_pause = 1
+        while not self._stopping.is_set():
+            try:
+                updates = self.bot.get_updates(
+                    offset=offset, timeout=poll_timeout + 10, long_polling_timeout=poll_timeout
+                )
+            except Exception as e:
+                logger.error(f"Ошибка получения обновлений: {e}. Повтор через {error_pause} с")
+                self._stopping.wait(error_pause)
+                error_pause = min(error_pause * 2, 30)
+                continue
+            error_pause = 1
+            for update in updates:
+                # Ожидание места в очереди замедляет чтение новых обновлений (обратное давление)
+                self.submit(update)
+                offset = update.update_id + 1
+    
+    def get_metrics(self) -> Dict[str, Any]:
+        """Показатели диспетчера: очереди, задержка обработки, загрузка потоков"""
+        uptime = 0.0
+        if self._started_at is not None:
+            uptime = (self._stopped_at or time.monotonic()) - self._started_at
+        with self._lock:
+            latencies = sorted(self._latencies)
+            submitted, rejected = self.submitted, self.rejected
+        
+        def percentile(fraction: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return round(latencies[min(int(len(latencies) * fraction), len(latencies) - 1)] * 1000, 1)
+        
+        return {
+            'workers': len(self.workers),
+            'submitted': submitted,
+            'rejected': rejected,
+            'queue_depth': self.queue_depth(),
+            'latency_ms': {'p50': percentile(0.5), 'p95': percentile(0.95), 'p99': percentile(0.99)},
+            'per_worker': [
+                {
+                    'worker': worker.index,
+                    'queue_depth': worker.queue.qsize(),
+                    'processed': worker.processed,
+                    'errors': worker.errors,
+                    'utilization': round(worker.busy_seconds / uptime, 3) if uptime else 0.0,
+                }
+                for worker in self.workers
+            ],
+        }
+    
+    def collect_metrics(self) -> List[Tuple[str, str, str, Dict[str, Any], Any]]:
+        """Очереди и счетчики потоков-обработчиков для /metrics"""
+        with self._lock:
+            submitted, rejected = self.submitted, self.rejected
+        samples = [
+            ('bot_updates_submitted_total', 'counter', 'Обновления, принятые в очереди диспетчера', {}, submitted),
+            ('bot_updates_rejected_total', 'counter', 'Обновления, не поместившиеся в очередь', {}, rejected),
+        ]
+        for worker in self.workers:
+            labels = {'worker': worker.index}
+            samples += [
+                ('bot_worker_queue_depth', 'gauge', 'Обновления в очереди потока-обработчика', labels,
+                 worker.queue.qsize()),
+                ('bot_worker_processed_total', 'counter', 'Обработанные потоком обновления', labels, worker.processed),
+                ('bot_worker_errors_total', 'counter', 'Ошибки обработки обновлений', labels, worker.errors),
+                ('bot_worker_busy_seconds_total', 'counter', 'Время потока за обработкой обновлений', labels,
+                 worker.busy_seconds),
+            ]
+        return samples
+    
+    def _run_worker(self, worker: _Worker) -> None:
+        """Цикл потока-обработчика"""
+        while True:
+            item = worker.queue.get()
+            if item is None:
+                return
+            update, enqueued_at = item
+            started = time.monotonic()
+            try:
+                self.bot.process_new_updates([update])
+            except Exception as e:
+                worker.errors += 1
+                logger.error(f"Ошибка обработки обновления {update.update_id}: {e}")
+            finished = time.monotonic()
+            worker.processed += 1
+            worker.busy_seconds += finished - started
+            with self._lock:
+                # Задержка от получения обновления до конца обработки, включая ожидание в очереди
+                self._latencies.append(finished - enqueued_at)
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import csv
+import io
+import os
+import tempfile
+import datetime
+import logging
+from typing import Dict, List, Any, Optional, Iterator, Tuple
+from openpyxl import Workbook
+from config import EXPORT_FETCH_SIZE
+from database import db_manager
+
+logger = logging.getLogger(__name__)
+
+# Таблицы, доступные для экспорта: порядок строк и колонки для фильтров по дате и корпусу
+EXPORT_TABLES: Dict[str, Dict[str, Optional[str]]] = {
+    'посетители': {'order_by': 'дата, номер, ФИО', 'date_column': 'дата', 'room_column': 'номер'},
+    'справочник номеров': {'order_by': 'номер', 'date_column': None, 'room_column': 'номер'},
+    'питание_по_дням': {'order_by': 'дата, корпус', 'date_column': 'дата', 'building_column': 'корпус'},
+}
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+# Размер блока при отдаче файла клиенту
+CHUNK_SIZE = 64 * 1024
+
+
+class DataExporter:
+    """Потоковый экспорт таблиц PostgreSQL в CSV и XLSX
+    
+    Строки читаются именованным (серверным) курсором порциями по fetch_size,
+    поэтому расход памяти не зависит от размера таблицы. Фильтры по датам и
+    корпусу выполняются в SQL.
+    """
+    
+    def __init__(self, db_manager, fetch_size: int = EXPORT_FETCH_SIZE):
+        self.db_manager = db_manager
+        self.fetch_size = fetch_size
+    
+    def build_query(self, table_name: str, start_date: Optional[datetime.date] = None,
+                    end_date: Optional[datetime.date] = None,
+                    building: Optional[str] = None) -> Tuple[str, Tuple[Any, ...]]:
+        """Запрос выборки таблицы с фильтрами"""
+        if table_name not in EXPORT_TABLES:
+            raise ValueError(f"Таблица {table_name} недоступна для экспорта")
+        table = EXPORT_TABLES[table_name]
+        
+        conditions, params = [], []
+        if table['date_column']:
+            if start_date:
+                conditions.append(f"{table['date_column']} >= %s")
+                params.append(start_date)
+            if end_date:
+                conditions.append(f"{table['date_column']} <= %s")
+                params.append(end_date)
+        if building:
+            if table.get('building_column'):
+                conditions.append(f"{table['building_column']} = %s")
+                params.append(building)
+            elif table.get('room_column'):
+                conditions.append(f"{table['room_column']} LIKE %s")
+                params.append(f"{building}/%")
+        
+        query = f'SELECT * FROM "{table_name}"'
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += f" ORDER BY {table['order_by']}"
+        return query, tuple(params)
+    
+    def iter_rows(self, table_name: str, **filters) -> Iterator[Tuple[Any, ...]]:
+        """Строки таблицы; первым элементом выдаются названия колонок
+        
+        Соединение занято пулом, пока генератор не исчерпан или не закрыт.
+        """
+        query, params = self.build_query(table_name, **filters)
+        with self.db_manager.get_connection() as conn:
+            try:
+                with conn.cursor(name='export_cursor') as cursor:
+                    cursor.itersize = self.fetch_size
+                    cursor.execute(query, params)
+                    # Для серверного курсора описание колонок доступно после первой выборки
+                    rows = cursor.fetchmany(self.fetch_size)
+                    yield tuple(column[0] for column in cursor.description)
+                    while rows:
+                        yield from rows
+                        rows = cursor.fetchmany(self.fetch_size)
+            finally:
+                # Курсор только читал данные, транзакцию фиксировать не нужно
+                if not conn.closed:
+                    conn.rollback()
+    
+    def iter_csv(self, table_name: str, **filters) -> Iterator[bytes]:
+        """CSV по RFC 4180 (разделитель запятая, кавычки по необходимости, строки CRLF) блоками байт"""
+        buffer = io.StringIO()
+        # BOM, чтобы Excel открывал кириллицу в UTF-8 без мастера импорта
+        buffer.write('\ufeff')
+        writer = csv.writer(buffer)
+        for row in self.iter_rows(table_name, **filters):
+            writer.writerow(row)
+            if buffer.tell() >= CHUNK_SIZE:
+                yield buffer.getvalue().encode('utf-8')
+                buffer.seek(0)
+                buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode('utf-8')
+    
+    def iter_xlsx(self, table_name: str, **filters) -> Iterator[bytes]:
+        """XLSX блоками байт
+        
+        Книга в режиме write_only сбрасывает строки во временные файлы по мере записи,
+        готовый архив отдается с диска и удаляется.
+        """
+        with tempfile.TemporaryFile(suffix='.xlsx') as output:
+            self.write_xlsx(table_name, output, **filters)
+            output.seek(0)
+            while True:
+                chunk = output.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+    
+    def write_xlsx(self, table_name: str, output, **filters) -> int:
+        """Запись таблицы в XLSX (путь или файловый объект); возвращает количество строк данных"""
+        workbook = Workbook(write_only=True)
+        # Имя листа Excel ограничено 31 символом
+        sheet = workbook.create_sheet(title=table_name[:31])
+        count = -1
+        for row in self.iter_rows(table_name, **filters):
+            sheet.append(row)
+            count += 1
+        workbook.save(output)
+        return count
+    
+    def iter_export(self, table_name: str, export_format: str, **filters) -> Iterator[bytes]:
+        """Файл экспорта в формате csv или xlsx блоками байт"""
+        if export_format == 'csv':
+            return self.iter_csv(table_name, **filters)
+        if export_format == 'xlsx':
+            return self.iter_xlsx(table_name, **filters)
+        raise ValueError(f"Неизвестный формат экспорта: {export_format}")
+    
+    def export_to_file(self, table_name: str, path: str, **filters) -> str:
+        """Экспорт таблицы в файл; формат определяется расширением (.csv или .xlsx)"""
+        export_format = os.path.splitext(path)[1].lstrip('.').lower()
+        with open(path, 'wb') as f:
+            for chunk in self.iter_export(table_name, export_format, **filters):
+                f.write(chunk)
+        logger.info(f"Таблица {table_name} экспортирована в {path}")
+        return path
+    
+    @staticmethod
+    def make_filename(table_name: str, export_format: str, start_date: Optional[datetime.date] = None,
+                      end_date: Optional[datetime.date] = None, building: Optional[str] = None) -> str:
+        """Имя файла экспорта с указанием фильтров"""
+        parts: List[str] = [table_name.replace(' ', '_')]
+        if building:
+            parts.append(building)
+        if start_date or end_date:
+            parts.append(f"{start_date or ''}_{end_date or ''}")
+        parts.append(datetime.datetime.now().strftime('%Y%m%d_%H%M%S'))
+        return '_'.join(parts) + f'.{export_format}'
+
+
+# Создание глобального экземпляра экспорта данных
+data_exporter = DataExporter(db_manager)
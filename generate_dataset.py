@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Генерация синтетических данных для проверки работы под нагрузкой
+
+Номера корпусов к1, Б1, к2, Б2... (по 50 номеров в корпусе, 20 корпусов при
+--scale 1) и проживания в них за несколько лет: заезды встык, совместное
+проживание двух семей в одном номере, питание по дням. История каждого номера
+определяется только seed, номером и --anchor-date, поэтому одинаковые параметры
+дают одинаковые данные, а меньший масштаб - часть тех же номеров.
+
+Загрузка в PostgreSQL из настроек (DB_*) идет через COPY; схема должна быть создана
+(python migrations.py migrate). Файл SQLite создается в формате visitors.db.
+
+Примеры:
+    python generate_dataset.py --scale 1 --seed 1 --postgres --truncate
+    python generate_dataset.py --scale 0.2 --sqlite visitors_scale.db
+    python generate_dataset.py --scale 5 --anchor-date 2025-01-01 --postgres --sqlite scale5.db
+"""
+
+import argparse
+import csv
+import datetime
+import io
+import os
+import random
+import sqlite3
+import sys
+import time
+import logging
+from typing import Dict, List, Any, Iterator, Optional, Tuple
+from database import VISITOR_MEAL_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+# Корпусов и номеров в корпусе при масштабе 1
+BUILDINGS_PER_SCALE = 20
+ROOMS_PER_BUILDING = 50
+
+# Доля заездов сразу после выезда предыдущих гостей и доля проживаний, к которым
+# на часть срока подселяется вторая семья
+BACK_TO_BACK_SHARE = 0.35
+SHARED_STAY_SHARE = 0.1
+
+# Строк в одном операторе COPY (сводка питания обновляется триггером на каждый оператор)
+COPY_BATCH_ROWS = 50000
+
+_SURNAMES = ('Иванов', 'Петров', 'Сидоров', 'Смирнов', 'Кузнецов', 'Попов', 'Васильев', 'Соколов',
+             'Михайлов', 'Новиков', 'Федоров', 'Морозов', 'Волков', 'Алексеев', 'Лебедев', 'Семенов')
+_FIRST_NAMES = ('Иван', 'Петр', 'Сергей', 'Алексей', 'Андрей', 'Дмитрий', 'Михаил', 'Николай',
+                'Павел', 'Владимир', 'Олег', 'Юрий')
+_PATRONYMICS = ('Иванович', 'Петрович', 'Сергеевич', 'Алексеевич', 'Андреевич', 'Дмитриевич',
+                'Михайлович', 'Николаевич')
+
+# Строка таблицы посетители: номер, дата, ФИО и порции в порядке VISITOR_MEAL_COLUMNS
+VisitorRow = Tuple[Any, ...]
+
+
+class DatasetGenerator:
+    """Детерминированный генератор номеров и истории проживания"""
+    
+    def __init__(self, scale: float = 1.0, seed: int = 1, years: int = 3, future_days: int = 60,
+                 anchor_date: Optional[datetime.date] = None):
+        if scale <= 0:
+            raise ValueError("Масштаб должен быть больше 0")
+        self.scale = scale
+        self.seed = seed
+        self.years = years
+        self.future_days = future_days
+        self.anchor_date = anchor_date or datetime.date.today()
+        self.first_date = self.anchor_date - datetime.timedelta(days=365 * years)
+        self.last_date = self.anchor_date + datetime.timedelta(days=future_days)
+    
+    def buildings(self) -> List[str]:
+        """Корпуса к1, Б1, к2, Б2..."""
+        count = max(1, round(BUILDINGS_PER_SCALE * self.scale))
+        return [f"{'к' if index % 2 == 0 else 'Б'}{index // 2 + 1}" for index in range(count)]
+    
+    def rooms(self) -> List[str]:
+        """Номера всех корпусов"""
+        return [f"{building}/{number}" for building in self.buildings()
+                for number in range(1, ROOMS_PER_BUILDING + 1)]
+    
+    def visitor_rows(self) -> Iterator[VisitorRow]:
+        """Строки посетителей номер за номером, по датам"""
+        for room in self.rooms():
+            yield from self.room_history(room)
+    
+    def room_history(self, room: str) -> Iterator[VisitorRow]:
+        """Проживания в номере с first_date по last_date"""
+        rng = random.Random(f"{self.seed}:{room}")
+        day = self.first_date + datetime.timedelta(days=rng.randint(0, 14))
+        while day <= self.last_date:
+            length = min(rng.choice((1, 2, 2, 3, 3, 4, 5, 7, 7, 10, 14)), (self.last_date - day).days + 1)
+            name = self._person(rng)
+            rows = list(self._stay_rows(rng, room, name, day, length))
+            if length > 1 and rng.random() < SHARED_STAY_SHARE:
+                # Вторая семья в том же номере на часть срока
+                other = self._person(rng)
+                while other == name:
+                    other = self._person(rng)
+                start = rng.randint(0, length - 1)
+                shared_day = day + datetime.timedelta(days=start)
+                rows += self._stay_rows(rng, room, other, shared_day, rng.randint(1, length - start))
+                rows.sort(key=lambda row: row[1])
+            yield from rows
+            gap = 0 if rng.random() < BACK_TO_BACK_SHARE else rng.randint(1, 10)
+            day += datetime.timedelta(days=length + gap)
+    
+    def _stay_rows(self, rng: random.Random, room: str, name: str,
+                   start: datetime.date, length: int) -> Iterator[VisitorRow]:
+        """Дни одного проживания: состав семьи постоянен, порции по дням немного меняются"""
+        adults, children = rng.randint(1, 4), rng.choice((0, 0, 1, 2, 3))
+        for offset in range(length):
+            counts = {}
+            for adult_column, child_column in (('зв', 'зд'), ('ов', 'од'), ('ув', 'уд')):
+                # Прием пищи пропускается в 10% случаев (день заезда, экскурсия)
+                eats = rng.random() >= 0.1
+                counts[adult_column] = adults if eats else 0
+                counts[child_column] = children if eats else 0
+            yield (room, start + datetime.timedelta(days=offset), name,
+                   *(counts[column] for column in VISITOR_MEAL_COLUMNS))
+    
+    @staticmethod
+    def _person(rng: random.Random) -> str:
+        return f"{rng.choice(_SURNAMES)} {rng.choice(_FIRST_NAMES)} {rng.choice(_PATRONYMICS)}"
+    
+    def describe(self) -> Dict[str, Any]:
+        """Параметры набора данных для отчетов"""
+        return {
+            'scale': self.scale,
+            'seed': self.seed,
+            'buildings': len(self.buildings()),
+            'rooms': len(self.buildings()) * ROOMS_PER_BUILDING,
+            'first_date': self.first_date.isoformat(),
+            'last_date': self.last_date.isoformat(),
+        }
+    
+    def load_postgres(self, db_manager, truncate: bool = False) -> Dict[str, Any]:
+        """Загрузка в PostgreSQL через COPY (посетители - пакетами) в одной транзакции
+        
+        В непустую таблицу посетители данные загружаются только с truncate=True
+        (посетители, справочник номеров и сводка питания очищаются).
+        """
+        started = time.perf_counter()
+        visitor_rows = 0
+        columns = ', '.join(('номер', 'дата', 'ФИО') + VISITOR_MEAL_COLUMNS)
+        with db_manager.get_cursor(commit=True) as cursor:
+            if truncate:
+                # TRUNCATE не вызывает триггеры сводки, поэтому она очищается вместе с посетителями
+                cursor.execute('TRUNCATE посетители, "справочник номеров", питание_по_дням RESTART IDENTITY')
+            else:
+                cursor.execute("SELECT EXISTS (SELECT 1 FROM посетители)")
+                if cursor.fetchone()[0]:
+                    raise ValueError("Таблица посетители не пуста: используйте --truncate")
+            
+            cursor.execute('CREATE TEMP TABLE новые_номера (номер VARCHAR(50)) ON COMMIT DROP')
+            rooms = io.StringIO(''.join(f"{room}\n" for room in self.rooms()))
+            cursor.copy_expert("COPY новые_номера FROM STDIN", rooms)
+            cursor.execute('INSERT INTO "справочник номеров" (номер) SELECT номер FROM новые_номера ON CONFLICT DO NOTHING')
+            
+            for batch in self._batches(self.visitor_rows(), COPY_BATCH_ROWS):
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows(batch)
+                buffer.seek(0)
+                cursor.copy_expert(f"COPY посетители ({columns}) FROM STDIN WITH (FORMAT csv)", buffer)
+                visitor_rows += len(batch)
+            cursor.execute('ANALYZE посетители')
+            cursor.execute('ANALYZE "справочник номеров"')
+            cursor.execute('ANALYZE питание_по_дням')
+        
+        db_manager.row_counts.invalidate()
+        return dict(self.describe(), visitor_rows=visitor_rows, seconds=round(time.perf_counter() - started, 2))
+    
+    def write_sqlite(self, path: str) -> Dict[str, Any]:
+        """Новый файл SQLite со схемой visitors.db"""
+        if os.path.exists(path):
+            raise FileExistsError(f"Файл уже существует: {path}")
+        started = time.perf_counter()
+        columns = ('номер', 'дата', 'ФИО') + VISITOR_MEAL_COLUMNS
+        conn = sqlite3.connect(path)
+        try:
+            with conn:
+                conn.execute("CREATE TABLE справочник_номеров (номер TEXT PRIMARY KEY)")
+                conn.execute(f"""
+                    CREATE TABLE посетители (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        номер TEXT NOT NULL,
+                        дата TEXT NOT NULL,
+                        ФИО TEXT NOT NULL,
+                        {', '.join(f'{column} INTEGER DEFAULT 0' for column in VISITOR_MEAL_COLUMNS)},
+                        UNIQUE(номер, дата, ФИО)
+                    )
+                """)
+                conn.executemany("INSERT INTO справочник_номеров (номер) VALUES (?)",
+                                 ((room,) for room in self.rooms()))
+                cursor = conn.executemany(
+                    f"INSERT INTO посетители ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                    ((row[0], row[1].isoformat()) + row[2:] for row in self.visitor_rows())
+                )
+                visitor_rows = cursor.rowcount
+        finally:
+            conn.close()
+        return dict(self.describe(), visitor_rows=visitor_rows, path=path,
+                    bytes=os.path.getsize(path), seconds=round(time.perf_counter() - started, 2))
+    
+    @staticmethod
+    def _batches(rows: Iterator[VisitorRow], size: int) -> Iterator[List[VisitorRow]]:
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='Генерация синтетических номеров и посетителей')
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help=f'Масштаб: {BUILDINGS_PER_SCALE} корпусов по {ROOMS_PER_BUILDING} номеров при 1')
+    parser.add_argument('--seed', type=int, default=1, help='Начальное значение генератора')
+    parser.add_argument('--years', type=int, default=3, help='Лет истории до --anchor-date')
+    parser.add_argument('--future-days', type=int, default=60, help='Дней бронирований после --anchor-date')
+    parser.add_argument('--anchor-date', type=datetime.date.fromisoformat,
+                        help='Опорная дата ГГГГ-ММ-ДД (по умолчанию сегодня)')
+    parser.add_argument('--postgres', action='store_true', help='Загрузить в PostgreSQL из настроек (DB_*)')
+    parser.add_argument('--truncate', action='store_true', help='Очистить таблицы PostgreSQL перед загрузкой')
+    parser.add_argument('--sqlite', metavar='PATH', help='Создать файл SQLite (не должен существовать)')
+    args = parser.parse_args(argv)
+    
+    if not args.postgres and not args.sqlite:
+        parser.error('Укажите --postgres и/или --sqlite PATH')
+    
+    logging.basicConfig(level=logging.WARNING)
+    generator = DatasetGenerator(args.scale, args.seed, args.years, args.future_days, args.anchor_date)
+    description = generator.describe()
+    print(f"📋 Корпусов: {description['buildings']}, номеров: {description['rooms']}, "
+          f"даты {description['first_date']} - {description['last_date']}")
+    
+    if args.postgres:
+        from database import db_manager
+        if db_manager.demo_mode:
+            print("❌ Нет подключения к PostgreSQL")
+            return 1
+        try:
+            result = generator.load_postgres(db_manager, truncate=args.truncate)
+        except ValueError as e:
+            print(f"❌ {e}")
+            return 1
+        print(f"✅ PostgreSQL: посетителей {result['visitor_rows']} за {result['seconds']} с")
+    
+    if args.sqlite:
+        try:
+            result = generator.write_sqlite(args.sqlite)
+        except FileExistsError as e:
+            print(f"❌ {e}")
+            return 1
+        print(f"✅ SQLite {result['path']}: посетителей {result['visitor_rows']}, "
+              f"{result['bytes'] / (1024 * 1024):.1f} МБ за {result['seconds']} с")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
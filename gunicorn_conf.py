@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Настройки gunicorn для Flask-приложений
+
+Запуск: python serve.py app|admin|client
+(или напрямую: gunicorn -c gunicorn_conf.py 'app:create_app()')
+
+Каждый воркер - отдельный процесс с потоками gthread. При WSGI_PRELOAD=1 приложение
+загружается в мастер-процессе один раз (импорт модулей, резервная копия), а воркеры
+получают его через fork; соединения с PostgreSQL каждый воркер открывает сам.
+"""
+
+import multiprocessing
+import os
+import sys
+from config import WSGI_BIND, WSGI_WORKERS, WSGI_THREADS, WSGI_TIMEOUT, WSGI_PRELOAD, WEBHOOK_IN_APP
+
+bind = WSGI_BIND or '0.0.0.0:5000'
+worker_class = 'gthread'
+workers = WSGI_WORKERS or multiprocessing.cpu_count() * 2 + 1
+threads = WSGI_THREADS
+timeout = WSGI_TIMEOUT
+graceful_timeout = WSGI_TIMEOUT
+preload_app = WSGI_PRELOAD
+accesslog = '-'
+errorlog = '-'
+
+# Файлы контроля воркеров - в памяти: /tmp в контейнере может быть на медленном диске
+if os.path.isdir('/dev/shm'):
+    worker_tmp_dir = '/dev/shm'
+
+if WEBHOOK_IN_APP and os.getenv('WSGI_APP', 'app') == 'app':
+    # Очереди обновлений бота и состояния диалогов живут в памяти процесса: все обновления
+    # пользователя должен обрабатывать один процесс, а потоки бота - запускаться в нем, а не в мастере
+    workers = 1
+    preload_app = False
+
+
+def when_ready(server):
+    """Мастер-процесс: соединения, открытые при загрузке приложения, закрываются до fork"""
+    database = sys.modules.get('database')
+    if database is not None:
+        database.db_manager.disconnect()
+
+
+def post_fork(server, worker):
+    """Воркер: собственный пул соединений и поток LISTEN вместо унаследованных"""
+    database = sys.modules.get('database')
+    if database is not None:
+        database.db_manager.reinit_after_fork()
+    # Показатели /metrics считаются с запуска воркера, а не загрузки приложения в мастере
+    metrics = sys.modules.get('metrics')
+    if metrics is not None:
+        metrics.metrics.reset()
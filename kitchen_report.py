@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import datetime
+import logging
+from typing import Dict, List, Any, Optional
+import pandas as pd
+from database import db_manager
+
+logger = logging.getLogger(__name__)
+
+# Колонки посетителей -> показатели отчета (взрослые/дети на каждый прием пищи)
+MEAL_FIELDS = {
+    'зв': 'breakfast_adults',
+    'зд': 'breakfast_children',
+    'ов': 'lunch_adults',
+    'од': 'lunch_children',
+    'ув': 'dinner_adults',
+    'уд': 'dinner_children',
+}
+MEAL_COLUMNS = list(MEAL_FIELDS.values())
+
+
+class KitchenReport:
+    """Прогноз для кухни: количество завтраков, обедов и ужинов по дням и корпусам
+    
+    Суммы по дням и корпусам читаются из сводки питание_по_дням, которую триггеры
+    поддерживают при каждом изменении посетителей, поэтому стоимость отчета зависит
+    от числа дней, а не от числа регистраций. Результат (дни x корпуса)
+    разворачивается и дополняется скользящими суммами в pandas.
+    """
+    
+    def __init__(self, db_manager, rolling_days: int = 7):
+        self.db_manager = db_manager
+        self.rolling_days = rolling_days
+    
+    def get_daily_totals(self, start_date: datetime.date, end_date: datetime.date,
+                         building: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Суммы порций по дням и корпусам за период [start_date, end_date]"""
+        if self.db_manager.demo_mode:
+            return []
+        
+        fields = ', '.join(f"{column} AS {field}" for column, field in MEAL_FIELDS.items())
+        query = f"""
+            SELECT дата AS date, корпус AS building, {fields}
+            FROM питание_по_дням
+            WHERE дата BETWEEN %s AND %s
+        """
+        params = [start_date, end_date]
+        if building:
+            query += " AND корпус = %s"
+            params.append(building)
+        query += " ORDER BY дата, корпус"
+        return self.db_manager.execute_query(query, tuple(params))
+    
+    def get_forecast(self, start_date: datetime.date, end_date: datetime.date,
+                     building: Optional[str] = None) -> Dict[str, Any]:
+        """Отчет для кухни за период
+        
+        days - итоги по каждому дню периода (дни без регистраций - нули) со скользящей
+        суммой порций за rolling_days дней, by_building - те же показатели по корпусам,
+        totals - итоги за весь период.
+        """
+        # Для скользящей суммы первых дней периода нужны и предшествующие дни
+        history_start = start_date - datetime.timedelta(days=self.rolling_days - 1)
+        rows = self.get_daily_totals(history_start, end_date, building)
+        history_dates = pd.date_range(history_start, end_date, freq='D')
+        dates = pd.date_range(start_date, end_date, freq='D')
+        
+        if rows:
+            frame = pd.DataFrame(rows)
+            frame['date'] = pd.to_datetime(frame['date'])
+            frame[MEAL_COLUMNS] = frame[MEAL_COLUMNS].fillna(0).astype('int64')
+        else:
+            frame = pd.DataFrame(columns=['date', 'building'] + MEAL_COLUMNS)
+        
+        # Итоги по дням: все корпуса вместе, пропущенные дни заполняются нулями
+        daily = frame.groupby('date')[MEAL_COLUMNS].sum().reindex(history_dates, fill_value=0).astype('int64')
+        daily['total'] = daily[MEAL_COLUMNS].sum(axis=1)
+        daily['rolling_total'] = daily['total'].rolling(self.rolling_days, min_periods=1).sum().astype('int64')
+        daily = daily.loc[dates]
+        
+        # Разворот по корпусам: для каждого корпуса полный ряд дней
+        by_building = {}
+        frame = frame[frame['date'] >= pd.Timestamp(start_date)]
+        buildings = sorted(frame['building'].unique()) if not frame.empty else []
+        if buildings:
+            pivot = frame.pivot_table(index='date', columns='building', values=MEAL_COLUMNS,
+                                      aggfunc='sum', fill_value=0)
+            pivot = pivot.reindex(dates, fill_value=0)
+            for name in buildings:
+                building_frame = pivot.xs(name, axis=1, level='building')[MEAL_COLUMNS].astype('int64')
+                building_frame['total'] = building_frame.sum(axis=1)
+                by_building[name] = self._frame_to_records(building_frame)
+        
+        totals = {column: int(daily[column].sum()) for column in MEAL_COLUMNS + ['total']}
+        return {
+            'start_date': start_date,
+            'end_date': end_date,
+            'building': building,
+            'rolling_days': self.rolling_days,
+            'buildings': buildings,
+            'days': self._frame_to_records(daily),
+            'by_building': by_building,
+            'totals': totals,
+        }
+    
+    @staticmethod
+    def _frame_to_records(frame: pd.DataFrame) -> List[Dict[str, Any]]:
+        """Преобразование таблицы с индексом по датам в список словарей"""
+        records = []
+        for timestamp, values in zip(frame.index, frame.to_dict('records')):
+            record = {'date': timestamp.date()}
+            record.update({key: int(value) for key, value in values.items()})
+            records.append(record)
+        return records
+
+
+# Создание глобального экземпляра отчета для кухни
+kitchen_report = KitchenReport(db_manager)
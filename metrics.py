@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Показатели работы приложений и бота в текстовом формате Prometheus (маршрут /metrics)
+
+Гистограммы времени выполнения собираются в памяти процесса: HTTP-запросы Flask (по
+endpoint), SQL-запросы (по имени подготовленного запроса или отпечатку текста), шаги
+регистрации бота и операции резервного копирования. Состояние пула соединений, очередей
+бота, хранилища состояний и планировщика копий читается в момент запроса /metrics
+функциями-сборщиками. Учет события - поиск корзины и сложение под блокировкой, поэтому
+сбор не выключается. Каждый процесс (воркер gunicorn) отдает собственные показатели.
+"""
+
+import bisect
+import functools
+import itertools
+import re
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Dict, List, Any, Tuple, Callable, Iterable, Iterator
+
+logger = logging.getLogger(__name__)
+
+# Тип содержимого текстового формата Prometheus
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Границы корзин гистограмм времени выполнения (секунды)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Описания собираемых показателей: имя -> (тип, описание)
+METRIC_HELP = {
+    'http_request_duration_seconds': ('histogram', 'Время обработки HTTP-запроса Flask'),
+    'db_statement_duration_seconds': ('histogram', 'Время выполнения SQL-запроса'),
+    'db_statement_errors_total': ('counter', 'Ошибки выполнения SQL-запросов'),
+    'db_slow_queries_total': ('counter', 'Запросы дольше порога журнала медленных запросов'),
+    'bot_step_duration_seconds': ('histogram', 'Время обработки шага регистрации в боте'),
+    'bot_step_results_total': ('counter', 'Результаты шагов регистрации в боте'),
+    'backup_operation_duration_seconds': ('histogram', 'Время операций резервного копирования'),
+}
+
+# Строковые и числовые литералы в тексте SQL (заменяются в отпечатке запроса)
+_SQL_LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+# Длина отпечатка SQL-запроса в метке
+FINGERPRINT_LENGTH = 160
+
+
+@lru_cache(maxsize=1024)
+def statement_fingerprint(query: str) -> str:
+    """Отпечаток SQL-запроса для метки: пробелы схлопнуты, литералы заменены на ?"""
+    text = _SQL_LITERAL_RE.sub('?', ' '.join(query.split()))
+    return text[:FINGERPRINT_LENGTH]
+
+
+def _escape_label(value: Any) -> str:
+    """Экранирование значения метки по правилам текстового формата"""
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels: Tuple[Tuple[str, Any], ...]) -> str:
+    """{имя="значение",...} или пустая строка"""
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape_label(value)}"' for name, value in labels) + '}'
+
+
+def _format_value(value: float) -> str:
+    """Число в текстовом формате (+Inf для бесконечности)"""
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class LatencyHistogram:
+    """Гистограмма времени выполнения с накопительными корзинами (le, как в Prometheus)"""
+    
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+    
+    def observe(self, seconds: float) -> None:
+        """Учет одного выполнения"""
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += seconds
+    
+    def snapshot(self) -> Dict[str, Any]:
+        """{'buckets': [(граница, выполнений не дольше неё), ..., (inf, всего)], 'count', 'sum'}"""
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+        cumulative = list(itertools.accumulate(counts))
+        return {
+            'buckets': list(zip(self.buckets + (float('inf'),), cumulative)),
+            'count': cumulative[-1],
+            'sum': total,
+        }
+
+
+class MetricsRegistry:
+    """Гистограммы, счетчики и функции-сборщики процесса с выводом в формате Prometheus
+    
+    Сборщик - функция без аргументов, возвращающая кортежи (имя, тип, описание, метки, значение)
+    с текущим состоянием компонента; вызывается при каждом запросе /metrics.
+    """
+    
+    def __init__(self, help_texts: Dict[str, Tuple[str, str]] = METRIC_HELP):
+        self.help_texts = dict(help_texts)
+        self._lock = threading.Lock()
+        self._histograms: Dict[Tuple[str, Tuple[Tuple[str, Any], ...]], LatencyHistogram] = {}
+        self._counters: Dict[Tuple[str, Tuple[Tuple[str, Any], ...]], float] = {}
+        self._collectors: List[Callable[[], Iterable[Tuple[str, str, str, Dict[str, Any], float]]]] = []
+    
+    def histogram(self, name: str, **labels) -> LatencyHistogram:
+        """Гистограмма показателя с данными метками (создается при первом обращении)"""
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, LatencyHistogram())
+        return histogram
+    
+    def observe(self, name: str, seconds: float, **labels) -> None:
+        """Учет длительности в гистограмме"""
+        self.histogram(name, **labels).observe(seconds)
+    
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        """Увеличение счетчика"""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+    
+    @contextmanager
+    def timer(self, name: str, **labels) -> Iterator[None]:
+        """Учет длительности блока with (в том числе завершившегося исключением)"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+    
+    def timed(self, name: str, **labels) -> Callable:
+        """Декоратор: длительность вызова с меткой outcome
+        
+        outcome="error", если функция выбросила исключение или вернула None/False
+        (так сообщают об ошибке методы SQLiteBackupManager), иначе "ok".
+        """
+        def decorator(func: Callable) -> Callable:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                outcome = 'error'
+                try:
+                    result = func(*args, **kwargs)
+                    if result is not None and result is not False:
+                        outcome = 'ok'
+                    return result
+                finally:
+                    self.observe(name, time.perf_counter() - started, outcome=outcome, **labels)
+            return wrapper
+        return decorator
+    
+    def register_collector(self, collector: Callable[[], Iterable[Tuple[str, str, str, Dict[str, Any], float]]]) -> None:
+        """Подключение функции-сборщика текущего состояния"""
+        with self._lock:
+            self._collectors.append(collector)
+    
+    def reset(self) -> None:
+        """Обнуление гистограмм и счетчиков (в воркере после fork: показатели мастера не в счет)"""
+        with self._lock:
+            self._histograms = {}
+            self._counters = {}
+    
+    def render(self) -> str:
+        """Все показатели в текстовом формате Prometheus 0.0.4"""
+        families: Dict[str, Tuple[str, str, List[str]]] = {}
+        
+        def family(name: str, metric_type: str, help_text: str) -> List[str]:
+            if name not in families:
+                known_type, known_help = self.help_texts.get(name, (metric_type, help_text))
+                families[name] = (known_type, known_help, [])
+            return families[name][2]
+        
+        with self._lock:
+            histograms = sorted(self._histograms.items(), key=lambda item: item[0])
+            counters = sorted(self._counters.items(), key=lambda item: item[0])
+            collectors = list(self._collectors)
+        
+        for (name, labels), histogram in histograms:
+            lines = family(name, 'histogram', '')
+            snapshot = histogram.snapshot()
+            for bound, count in snapshot['buckets']:
+                bucket_labels = labels + (('le', _format_value(bound)),)
+                lines.append(f"{name}_bucket{_format_labels(bucket_labels)} {count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(snapshot['sum'])}")
+            lines.append(f"{name}_count{_format_labels(labels)} {snapshot['count']}")
+        
+        for (name, labels), value in counters:
+            family(name, 'counter', '').append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        
+        for collector in collectors:
+            try:
+                samples = list(collector())
+            except Exception as e:
+                logger.error(f"Ошибка сборщика показателей {getattr(collector, '__qualname__', collector)}: {e}")
+                continue
+            for name, metric_type, help_text, labels, value in samples:
+                if value is None:
+                    continue
+                family(name, metric_type, help_text).append(
+                    f"{name}{_format_labels(tuple(sorted(labels.items())))} {_format_value(value)}"
+                )
+        
+        output = []
+        for name, (metric_type, help_text, lines) in families.items():
+            if help_text:
+                output.append(f"# HELP {name} {help_text}")
+            output.append(f"# TYPE {name} {metric_type}")
+            output.extend(lines)
+        return '\n'.join(output) + '\n'
+
+
+def instrument_app(app, app_name: str) -> None:
+    """Время обработки запросов Flask-приложения по endpoint и маршрут /metrics
+    
+    Для потоковых ответов (экспорт) учитывается время до начала передачи.
+    """
+    from flask import Response, g, request
+    
+    @app.before_request
+    def _metrics_start_timer():
+        g.metrics_started = time.perf_counter()
+    
+    @app.after_request
+    def _metrics_observe_request(response):
+        started = g.pop('metrics_started', None)
+        if started is not None:
+            # Запросы к несуществующим адресам не плодят метки: endpoint у них один
+            metrics.observe(
+                'http_request_duration_seconds', time.perf_counter() - started,
+                app=app_name, endpoint=request.endpoint or 'not_found',
+                method=request.method, status=response.status_code
+            )
+        return response
+    
+    @app.route('/metrics')
+    def metrics_endpoint():
+        """Показатели процесса в текстовом формате Prometheus"""
+        return Response(metrics.render(), content_type=CONTENT_TYPE)
+
+
+# Создание глобального реестра показателей
+metrics = MetricsRegistry()
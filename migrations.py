@@ -0,0 +1,443 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import sys
+import time
+import logging
+import psycopg2
+import psycopg2.errors
+from typing import List, Tuple, Callable, Any
+from config import (
+    DB_AUTO_MIGRATE, DB_MIGRATION_BATCH_SIZE, DB_MIGRATION_BATCH_PAUSE, DB_MIGRATION_LOCK_TIMEOUT,
+    DB_MIGRATION_SWAP_ATTEMPTS
+)
+
+logger = logging.getLogger(__name__)
+
+# Версия схемы, которую ожидает текущий код приложений
+SCHEMA_VERSION = 5
+
+# Ключ advisory-блокировки, чтобы миграции не выполнялись одновременно из нескольких процессов
+MIGRATION_LOCK_KEY = 7315001
+
+
+class SchemaVersionError(Exception):
+    """Версия схемы базы данных не совпадает с версией, ожидаемой приложением"""
+
+
+class MigrationManager:
+    """Менеджер версионирования и миграций схемы PostgreSQL"""
+    
+    def __init__(self, db_manager, batch_size: int = DB_MIGRATION_BATCH_SIZE):
+        self.db_manager = db_manager
+        self.batch_size = batch_size
+        self.migrations: List[Tuple[int, str, Callable[[], None]]] = [
+            (1, 'базовая схема', self.migration_1_base_schema),
+            (2, 'дата как DATE и индексы по дате', self.migration_2_native_date),
+            (3, 'сводка питания по дням и корпусам', self.migration_3_meal_summary),
+            (4, 'индексы поиска по ФИО и номеру', self.migration_4_search_indexes),
+            (5, 'порядок блокировок сводки питания', self.migration_5_summary_lock_order),
+        ]
+    
+    def ensure_version_table(self) -> None:
+        """Создание таблицы версий схемы"""
+        self.db_manager.execute_update("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                description VARCHAR(200) NOT NULL,
+                applied_at TIMESTAMP NOT NULL DEFAULT now()
+            )
+        """)
+    
+    def get_current_version(self) -> int:
+        """Получение текущей версии схемы базы данных"""
+        result = self.db_manager.execute_query("""
+            SELECT to_regclass('public.schema_version') IS NOT NULL AS has_versions,
+                   to_regclass('public.посетители') IS NOT NULL AS has_visitors
+        """)[0]
+        if result['has_versions']:
+            version = self.db_manager.execute_query("SELECT MAX(version) AS version FROM schema_version")[0]['version']
+            if version:
+                return version
+        # База создана до появления миграций: таблица посетителей означает базовую схему
+        return 1 if result['has_visitors'] else 0
+    
+    def get_status(self) -> dict:
+        """Состояние схемы: текущая и ожидаемая версии, список неприменённых миграций"""
+        current = self.get_current_version()
+        return {
+            'current_version': current,
+            'expected_version': SCHEMA_VERSION,
+            'pending': [(version, description) for version, description, _ in self.migrations if version > current],
+        }
+    
+    def migrate(self) -> int:
+        """Применение всех неприменённых миграций под advisory-блокировкой
+        
+        Возвращает количество применённых миграций.
+        """
+        # Блокировка держится на отдельном соединении, чтобы не занимать слот пула
+        lock_conn = self.db_manager.open_dedicated_connection()
+        lock_conn.autocommit = True
+        try:
+            with lock_conn.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_KEY,))
+            
+            # Версию читаем под блокировкой: другой процесс мог уже выполнить миграции
+            self.ensure_version_table()
+            current = self.get_current_version()
+            applied = 0
+            for version, description, migration in self.migrations:
+                if version <= current:
+                    continue
+                logger.info(f"Применение миграции {version}: {description}")
+                started = time.monotonic()
+                migration()
+                self.db_manager.execute_update(
+                    "INSERT INTO schema_version (version, description) VALUES (%s, %s)",
+                    (version, description)
+                )
+                applied += 1
+                logger.info(f"Миграция {version} применена за {time.monotonic() - started:.1f} с")
+            return applied
+        finally:
+            # Закрытие соединения снимает advisory-блокировку
+            lock_conn.close()
+    
+    def ensure_schema(self, auto_migrate: bool = DB_AUTO_MIGRATE) -> None:
+        """Проверка версии схемы при запуске приложения
+        
+        Схема старше кода мигрируется (если разрешено), схема новее кода означает,
+        что запущена устаревшая версия приложения, и приводит к ошибке.
+        """
+        current = self.get_current_version()
+        if current > SCHEMA_VERSION:
+            raise SchemaVersionError(
+                f"Версия схемы БД ({current}) новее версии приложения ({SCHEMA_VERSION}). Обновите приложение."
+            )
+        if current < SCHEMA_VERSION:
+            if not auto_migrate:
+                raise SchemaVersionError(
+                    f"Версия схемы БД ({current}) устарела, ожидается {SCHEMA_VERSION}. "
+                    f"Выполните: python migrations.py migrate"
+                )
+            applied = self.migrate()
+            logger.info(f"Схема БД обновлена до версии {SCHEMA_VERSION} (применено миграций: {applied})")
+        else:
+            logger.info(f"Версия схемы БД актуальна: {current}")
+    
+    # Миграции
+    
+    def migration_1_base_schema(self) -> None:
+        """Базовая схема: справочник номеров и посетители"""
+        self.db_manager.create_tables()
+    
+    def migration_2_native_date(self) -> None:
+        """Перевод посетители.дата из VARCHAR в DATE без длительной блокировки таблицы
+        
+        Новая колонка заполняется пакетами по id, пока триггер синхронизирует
+        вставляемые строки; уникальный индекс строится CONCURRENTLY, а под
+        эксклюзивной блокировкой выполняется только переименование колонок.
+        """
+        column_type = self.db_manager.execute_query("""
+            SELECT data_type FROM information_schema.columns
+            WHERE table_schema = 'public' AND table_name = 'посетители' AND column_name = 'дата'
+        """)[0]['data_type']
+        
+        if column_type != 'date':
+            self._add_shadow_date_column()
+            self._backfill_shadow_date_column()
+            self._create_index_concurrently(
+                'посетители_номер_дата_фио_date_idx', '(номер, дата_date, ФИО)', unique=True
+            )
+            self._run_autocommit('ALTER TABLE посетители VALIDATE CONSTRAINT посетители_дата_date_not_null')
+            self._swap_date_columns()
+        
+        # Уникальный индекс (номер, дата, ФИО) уже покрывает поиск по номеру и диапазону дат,
+        # для дневной статистики (фильтр только по дате) нужен отдельный индекс
+        self._create_index_concurrently('посетители_дата_idx', '(дата)')
+    
+    def migration_3_meal_summary(self) -> None:
+        """Таблица питание_по_дням (дата, корпус, порции) с поддержкой триггерами
+        
+        Триггеры уровня оператора с переходными таблицами применяют к сводке
+        суммарные изменения всего оператора INSERT/UPDATE/DELETE по посетителям,
+        поэтому пакетная вставка регистрации обновляет одну строку на день и корпус.
+        """
+        with self.db_manager.get_cursor(commit=True) as cursor:
+            cursor.execute("SET LOCAL lock_timeout = %s", (DB_MIGRATION_LOCK_TIMEOUT,))
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS питание_по_дням (
+                    дата DATE NOT NULL,
+                    корпус VARCHAR(50) NOT NULL,
+                    записей INTEGER NOT NULL DEFAULT 0,
+                    зд INTEGER NOT NULL DEFAULT 0,
+                    зв INTEGER NOT NULL DEFAULT 0,
+                    од INTEGER NOT NULL DEFAULT 0,
+                    ов INTEGER NOT NULL DEFAULT 0,
+                    уд INTEGER NOT NULL DEFAULT 0,
+                    ув INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (дата, корпус)
+                )
+            """)
+            self._create_summary_function(cursor)
+            for event, referencing in (
+                ('INSERT', 'NEW TABLE AS new_rows'),
+                ('UPDATE', 'OLD TABLE AS old_rows NEW TABLE AS new_rows'),
+                ('DELETE', 'OLD TABLE AS old_rows'),
+            ):
+                trigger = f"питание_по_дням_{event.lower()}"
+                cursor.execute(f"DROP TRIGGER IF EXISTS {trigger} ON посетители")
+                cursor.execute(f"""
+                    CREATE TRIGGER {trigger}
+                    AFTER {event} ON посетители
+                    REFERENCING {referencing}
+                    FOR EACH STATEMENT EXECUTE FUNCTION питание_по_дням_apply()
+                """)
+            self._fill_meal_summary(cursor)
+    
+    def migration_4_search_indexes(self) -> None:
+        """Индексы поиска посетителей по ФИО и номеру
+        
+        С расширением pg_trgm строятся триграммные GIN-индексы (поиск подстроки).
+        Если расширение нельзя установить (нет прав или пакета на сервере), строятся
+        индексы lower(колонка) text_pattern_ops для поиска по началу значения.
+        """
+        try:
+            self._run_autocommit("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        except psycopg2.Error as e:
+            logger.warning(f"Расширение pg_trgm недоступно, поиск будет по началу значения: {e}")
+        
+        trigram = self.db_manager.has_trigram_search(refresh=True)
+        for column in ('ФИО', 'номер'):
+            index_name = f"посетители_{column.lower()}_{'trgm' if trigram else 'prefix'}_idx"
+            if trigram:
+                definition = f"USING gin ({column} gin_trgm_ops)"
+            else:
+                definition = f"(lower({column}) text_pattern_ops)"
+            self._create_index_concurrently(index_name, definition)
+    
+    def migration_5_summary_lock_order(self) -> None:
+        """Пересоздание функции триггеров сводки: строки питание_по_дням блокируются по порядку
+        
+        Без ORDER BY две параллельные регистрации в одном корпусе с пересекающимися
+        датами могли заблокировать строки сводки в разном порядке и попасть во взаимоблокировку.
+        """
+        with self.db_manager.get_cursor(commit=True) as cursor:
+            self._create_summary_function(cursor)
+    
+    def rebuild_meal_summary(self) -> int:
+        """Пересчет сводки питание_по_дням из таблицы посетители (восстановление после сбоев)
+        
+        Запись в посетители на время пересчета блокируется, чтобы не потерять изменения.
+        Возвращает количество строк сводки.
+        """
+        with self.db_manager.get_cursor(commit=True) as cursor:
+            # Блокировка до очистки: иначе изменения, зафиксированные между DELETE и
+            # пересчетом, попадут в сводку дважды
+            cursor.execute("LOCK TABLE посетители IN SHARE MODE")
+            cursor.execute("DELETE FROM питание_по_дням")
+            rows = self._fill_meal_summary(cursor)
+        logger.info(f"Сводка питания пересчитана: {rows} строк")
+        return rows
+    
+    @staticmethod
+    def _fill_meal_summary(cursor) -> int:
+        """Заполнение пустой сводки агрегатом по всем посетителям"""
+        cursor.execute("LOCK TABLE посетители IN SHARE MODE")
+        cursor.execute("""
+            INSERT INTO питание_по_дням (дата, корпус, записей, зд, зв, од, ов, уд, ув)
+            SELECT дата, split_part(номер, '/', 1), COUNT(*),
+                   SUM(COALESCE(зд, 0)), SUM(COALESCE(зв, 0)), SUM(COALESCE(од, 0)),
+                   SUM(COALESCE(ов, 0)), SUM(COALESCE(уд, 0)), SUM(COALESCE(ув, 0))
+            FROM посетители
+            GROUP BY дата, split_part(номер, '/', 1)
+            -- Строки сводки блокируются в порядке (дата, корпус): без взаимоблокировок параллельных регистраций
+            ORDER BY 1, 2
+            ON CONFLICT (дата, корпус) DO NOTHING
+        """)
+        return cursor.rowcount
+    
+    @classmethod
+    def _create_summary_function(cls, cursor) -> None:
+        """Функция триггеров, применяющая изменения посетителей к сводке питание_по_дням"""
+        cursor.execute(f"""
+            CREATE OR REPLACE FUNCTION питание_по_дням_apply() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    {cls._summary_delta_sql('old_rows', -1)};
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    {cls._summary_delta_sql('new_rows', 1)};
+                END IF;
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    -- Дни, где не осталось посетителей, удаляются из сводки
+                    DELETE FROM питание_по_дням
+                    WHERE записей = 0 AND (дата, корпус) IN (
+                        SELECT дата, split_part(номер, '/', 1) FROM old_rows
+                    );
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+        """)
+    
+    @staticmethod
+    def _summary_delta_sql(rows_table: str, sign: int) -> str:
+        """UPSERT, прибавляющий к сводке (sign=1) или вычитающий (sign=-1) строки переходной таблицы"""
+        meals = ('зд', 'зв', 'од', 'ов', 'уд', 'ув')
+        sums = ', '.join(f"{sign} * SUM(COALESCE({meal}, 0))" for meal in meals)
+        updates = ', '.join(f"{meal} = питание_по_дням.{meal} + EXCLUDED.{meal}" for meal in meals)
+        return f"""
+            INSERT INTO питание_по_дням (дата, корпус, записей, {', '.join(meals)})
+            SELECT дата, split_part(номер, '/', 1), {sign} * COUNT(*), {sums}
+            FROM {rows_table}
+            GROUP BY дата, split_part(номер, '/', 1)
+            -- Строки сводки блокируются в порядке (дата, корпус): без взаимоблокировок параллельных регистраций
+            ORDER BY 1, 2
+            ON CONFLICT (дата, корпус) DO UPDATE SET
+                записей = питание_по_дням.записей + EXCLUDED.записей, {updates}
+        """
+    
+    def _add_shadow_date_column(self) -> None:
+        """Добавление колонки дата_date и триггера, заполняющего её для новых строк"""
+        with self.db_manager.get_cursor(commit=True) as cursor:
+            cursor.execute("SET LOCAL lock_timeout = %s", (DB_MIGRATION_LOCK_TIMEOUT,))
+            cursor.execute("ALTER TABLE посетители ADD COLUMN IF NOT EXISTS дата_date DATE")
+            cursor.execute("""
+                CREATE OR REPLACE FUNCTION посетители_sync_дата_date() RETURNS trigger AS $$
+                BEGIN
+                    NEW.дата_date := NEW.дата::date;
+                    RETURN NEW;
+                END;
+                $$ LANGUAGE plpgsql
+            """)
+            cursor.execute("DROP TRIGGER IF EXISTS посетители_sync_дата_date ON посетители")
+            cursor.execute("""
+                CREATE TRIGGER посетители_sync_дата_date
+                BEFORE INSERT OR UPDATE OF дата ON посетители
+                FOR EACH ROW EXECUTE FUNCTION посетители_sync_дата_date()
+            """)
+            cursor.execute("""
+                DO $$
+                BEGIN
+                    IF NOT EXISTS (
+                        SELECT 1 FROM pg_constraint WHERE conname = 'посетители_дата_date_not_null'
+                    ) THEN
+                        ALTER TABLE посетители ADD CONSTRAINT посетители_дата_date_not_null
+                            CHECK (дата_date IS NOT NULL) NOT VALID;
+                    END IF;
+                END $$
+            """)
+    
+    def _backfill_shadow_date_column(self) -> None:
+        """Пакетное заполнение дата_date для существующих строк, каждый пакет в своей транзакции"""
+        bounds = self.db_manager.execute_query("SELECT MIN(id) AS min_id, MAX(id) AS max_id FROM посетители")[0]
+        if bounds['min_id'] is None:
+            return
+        
+        converted = 0
+        batch_start = bounds['min_id']
+        while batch_start <= bounds['max_id']:
+            batch_end = batch_start + self.batch_size
+            converted += self.db_manager.execute_update("""
+                UPDATE посетители SET дата_date = дата::date
+                WHERE id >= %s AND id < %s AND дата_date IS NULL
+            """, (batch_start, batch_end))
+            batch_start = batch_end
+            if DB_MIGRATION_BATCH_PAUSE:
+                time.sleep(DB_MIGRATION_BATCH_PAUSE)
+        logger.info(f"Преобразовано дат: {converted}")
+    
+    def _swap_date_columns(self) -> None:
+        """Короткая транзакция замены строковой колонки дата на дата_date
+        
+        Если таблицу не удалось заблокировать за lock_timeout, попытка повторяется,
+        чтобы не держать в очереди за собой запросы приложений.
+        """
+        for attempt in range(1, DB_MIGRATION_SWAP_ATTEMPTS + 1):
+            try:
+                with self.db_manager.get_cursor(commit=True) as cursor:
+                    cursor.execute("SET LOCAL lock_timeout = %s", (DB_MIGRATION_LOCK_TIMEOUT,))
+                    cursor.execute("LOCK TABLE посетители IN ACCESS EXCLUSIVE MODE")
+                    cursor.execute("DROP TRIGGER IF EXISTS посетители_sync_дата_date ON посетители")
+                    cursor.execute("DROP FUNCTION IF EXISTS посетители_sync_дата_date()")
+                    cursor.execute("ALTER TABLE посетители DROP COLUMN дата")
+                    cursor.execute("ALTER TABLE посетители RENAME COLUMN дата_date TO дата")
+                    # Проверенное ограничение CHECK позволяет выставить NOT NULL без повторного сканирования
+                    cursor.execute("ALTER TABLE посетители ALTER COLUMN дата SET NOT NULL")
+                    cursor.execute("ALTER TABLE посетители DROP CONSTRAINT посетители_дата_date_not_null")
+                    cursor.execute("""
+                        ALTER TABLE посетители ADD CONSTRAINT "посетители_номер_дата_ФИО_key"
+                        UNIQUE USING INDEX посетители_номер_дата_фио_date_idx
+                    """)
+                return
+            except psycopg2.errors.LockNotAvailable:
+                if attempt == DB_MIGRATION_SWAP_ATTEMPTS:
+                    raise
+                logger.warning(f"Таблица посетители занята, повтор замены колонки ({attempt}/{DB_MIGRATION_SWAP_ATTEMPTS})")
+                time.sleep(attempt)
+    
+    def _create_index_concurrently(self, index_name: str, definition: str, unique: bool = False) -> None:
+        """Построение индекса на посетители через CREATE INDEX CONCURRENTLY
+        
+        Прерванное построение (сбой, отмена, нарушение уникальности) оставляет индекс
+        с indisvalid = false: IF NOT EXISTS его пропустил бы, а планировщик не использует.
+        Такой индекс удаляется и строится заново.
+        """
+        state = self.db_manager.execute_query("""
+            SELECT i.indisvalid FROM pg_index i
+            JOIN pg_class c ON c.oid = i.indexrelid
+            WHERE c.relname = %s
+        """, (index_name,))
+        if state and not state[0]['indisvalid']:
+            logger.warning(f"Индекс {index_name} не достроен, построение повторяется")
+            self._run_autocommit(f"DROP INDEX CONCURRENTLY IF EXISTS {index_name}")
+        self._run_autocommit(
+            f"CREATE {'UNIQUE ' if unique else ''}INDEX CONCURRENTLY IF NOT EXISTS {index_name} "
+            f"ON посетители {definition}"
+        )
+    
+    def _run_autocommit(self, query: str) -> None:
+        """Выполнение команды вне транзакции (нужно для CREATE INDEX CONCURRENTLY)"""
+        with self.db_manager.get_connection() as conn:
+            conn.autocommit = True
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute(query)
+            finally:
+                conn.autocommit = False
+
+
+def main(argv: List[str]) -> int:
+    """Командная строка: python migrations.py [status|migrate|rebuild-summary]"""
+    from database import db_manager
+    
+    command = argv[1] if len(argv) > 1 else 'status'
+    manager = MigrationManager(db_manager)
+    
+    # Версию схемы не проверяем: её и приводит в порядок эта команда
+    db_manager.initialize(verify_schema=False)
+    if db_manager.demo_mode:
+        print("❌ Нет подключения к PostgreSQL")
+        return 1
+    
+    if command == 'migrate':
+        applied = manager.migrate()
+        print(f"✅ Применено миграций: {applied}")
+    elif command == 'rebuild-summary':
+        rows = manager.rebuild_meal_summary()
+        print(f"✅ Сводка питания пересчитана: {rows} строк")
+    elif command == 'status':
+        status = manager.get_status()
+        print(f"📋 Версия схемы БД: {status['current_version']} (ожидается {status['expected_version']})")
+        for version, description in status['pending']:
+            print(f"  ⏳ {version}: {description}")
+    else:
+        print(f"❓ Неизвестная команда: {command}. Используйте status, migrate или rebuild-summary")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
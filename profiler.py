@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Выборочное профилирование запросов Flask и обработчиков бота
+
+Включается переменной PROFILE_ENABLED=1 или через /api/profiling (только в процессе,
+обработавшем запрос). Результат - файлы свернутых стеков profiles/<цель>.<pid>.collapsed
+(строки "модуль.функция;...;модуль.функция число_снимков"), которые открываются в
+speedscope или превращаются в flame graph: flamegraph.pl app.main.index.123.collapsed > app.svg
+"""
+
+import atexit
+import functools
+import os
+import random
+import re
+import sys
+import threading
+import time
+import logging
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, Callable, Iterator, Tuple
+from config import PROFILE_ENABLED, PROFILE_SAMPLE_RATE, PROFILE_INTERVAL_MS, PROFILE_DIR, PROFILE_FLUSH_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+# Глубина стека в снимке (внешние кадры сервера и потоков отбрасываются)
+MAX_STACK_DEPTH = 64
+
+# Символы, недопустимые в имени файла профиля
+_UNSAFE_FILENAME_RE = re.compile(r'[^\w.-]')
+
+
+class SamplingProfiler:
+    """Профилировщик по снимкам стека для выбранной доли запросов
+    
+    Запрос (или обработчик бота) отбирается с вероятностью sample_rate; пока он выполняется,
+    фоновый поток каждые interval секунд снимает стек его потока через sys._current_frames()
+    и считает одинаковые стеки по цели (app.endpoint, bot.handler). В отличие от cProfile,
+    профилируемый код не замедляется: работа идет в потоке выборки, а неотобранные
+    запросы платят только за random(). Накопленные стеки переписываются в файлы раз
+    в flush_interval секунд, при выключении и при завершении процесса.
+    """
+    
+    def __init__(self, enabled: bool = PROFILE_ENABLED, sample_rate: float = PROFILE_SAMPLE_RATE,
+                 interval: float = PROFILE_INTERVAL_MS / 1000, output_dir: str = PROFILE_DIR,
+                 flush_interval: float = PROFILE_FLUSH_INTERVAL):
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.output_dir = output_dir
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        # Потоки, выполняющие отобранные запросы: id потока -> цель
+        self._active: Dict[int, str] = {}
+        self._stacks: Dict[str, Counter] = {}
+        self._frame_names: Dict[Any, str] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._last_flush = time.monotonic()
+        self.profiled_total = 0
+        self.samples_total = 0
+    
+    def set_sample_rate(self, sample_rate: float) -> None:
+        """Изменение доли профилируемых запросов (от 0 до 1)"""
+        if not 0 < sample_rate <= 1:
+            raise ValueError("Доля профилируемых запросов должна быть в интервале (0, 1]")
+        self.sample_rate = sample_rate
+    
+    def enable(self, sample_rate: Optional[float] = None) -> None:
+        """Включение профилирования"""
+        if sample_rate is not None:
+            self.set_sample_rate(sample_rate)
+        self.enabled = True
+        logger.info(f"Профилирование включено: доля запросов {self.sample_rate}, каталог {self.output_dir}")
+    
+    def disable(self) -> None:
+        """Выключение профилирования с записью накопленных стеков"""
+        self.enabled = False
+        self.flush()
+        logger.info("Профилирование выключено")
+    
+    def start(self, target: str) -> Optional[int]:
+        """Отбор запроса: id потока, если запрос профилируется, иначе None"""
+        if not self.enabled or random.random() >= self.sample_rate:
+            return None
+        thread_id = threading.get_ident()
+        with self._lock:
+            # Вложенный вызов (обработчик внутри обработчика) учитывается во внешней цели
+            if thread_id in self._active:
+                return None
+            self._active[thread_id] = target
+            self.profiled_total += 1
+        self._ensure_thread()
+        return thread_id
+    
+    def stop(self, token: Optional[int]) -> None:
+        """Окончание профилируемого запроса"""
+        if token is not None:
+            with self._lock:
+                self._active.pop(token, None)
+    
+    @contextmanager
+    def profile(self, target: str) -> Iterator[None]:
+        """Профилирование блока with (если он отобран)"""
+        token = self.start(target)
+        try:
+            yield
+        finally:
+            self.stop(token)
+    
+    def profiled(self, func: Callable) -> Callable:
+        """Декоратор обработчика бота: цель - bot.<имя функции>"""
+        target = f"bot.{func.__name__}"
+        
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with self.profile(target):
+                return func(*args, **kwargs)
+        return wrapper
+    
+    def get_status(self) -> Dict[str, Any]:
+        """Состояние профилировщика"""
+        with self._lock:
+            targets = {target: sum(stacks.values()) for target, stacks in self._stacks.items()}
+            active = len(self._active)
+        return {
+            'enabled': self.enabled,
+            'sample_rate': self.sample_rate,
+            'interval_ms': round(self.interval * 1000, 1),
+            'output_dir': os.path.abspath(self.output_dir),
+            'profiled_requests': self.profiled_total,
+            'active_requests': active,
+            'samples_total': self.samples_total,
+            'samples_by_target': targets,
+        }
+    
+    def flush(self) -> None:
+        """Запись накопленных стеков: по файлу на цель, содержимое - итог с запуска процесса"""
+        with self._lock:
+            snapshot = {target: dict(stacks) for target, stacks in self._stacks.items()}
+            self._last_flush = time.monotonic()
+        if not snapshot:
+            return
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            for target, stacks in snapshot.items():
+                path = os.path.join(
+                    self.output_dir, f"{_UNSAFE_FILENAME_RE.sub('_', target)}.{os.getpid()}.collapsed"
+                )
+                # Файл заменяется целиком, чтобы читатель не увидел недописанный профиль
+                with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                    for stack, count in sorted(stacks.items(), key=lambda item: -item[1]):
+                        f.write(f"{stack} {count}\n")
+                os.replace(path + '.tmp', path)
+        except OSError as e:
+            logger.error(f"Ошибка записи профилей в {self.output_dir}: {e}")
+    
+    def _ensure_thread(self) -> None:
+        """Запуск потока выборки при первом отобранном запросе"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='profiler-sampler', daemon=True)
+                self._thread.start()
+    
+    def _run(self) -> None:
+        """Цикл потока выборки: снимки стеков отобранных запросов, периодическая запись"""
+        while self.enabled:
+            time.sleep(self.interval)
+            with self._lock:
+                active = list(self._active.items())
+            if active:
+                frames = sys._current_frames()
+                samples = [(target, self._collapse(frames[thread_id]))
+                           for thread_id, target in active if thread_id in frames]
+                with self._lock:
+                    for target, stack in samples:
+                        self._stacks.setdefault(target, Counter())[stack] += 1
+                    self.samples_total += len(samples)
+            if time.monotonic() - self._last_flush >= self.flush_interval:
+                self.flush()
+    
+    def _collapse(self, frame) -> str:
+        """Стек потока в одну строку: внешний кадр первым, кадры через ';'"""
+        names = []
+        while frame is not None and len(names) < MAX_STACK_DEPTH:
+            names.append(self._frame_name(frame))
+            frame = frame.f_back
+        return ';'.join(reversed(names))
+    
+    def _frame_name(self, frame) -> str:
+        """Имя кадра модуль.функция (кэшируется по объекту кода)"""
+        code = frame.f_code
+        name = self._frame_names.get(code)
+        if name is None:
+            module = frame.f_globals.get('__name__', '?')
+            name = f"{module}.{getattr(code, 'co_qualname', code.co_name)}".replace(';', ':').replace(' ', '_')
+            self._frame_names[code] = name
+        return name
+
+
+def instrument_app(app, app_name: str) -> None:
+    """Профилирование доли запросов Flask-приложения (цель - app_name.endpoint)"""
+    from flask import g, request
+    
+    @app.before_request
+    def _profiler_start():
+        g.profile_token = profiler.start(f"{app_name}.{request.endpoint or 'not_found'}")
+    
+    @app.teardown_request
+    def _profiler_stop(exception=None):
+        profiler.stop(g.pop('profile_token', None))
+
+
+def parse_control(values) -> Tuple[Optional[bool], Optional[float]]:
+    """Параметры /api/profiling: enabled=1|0 и sample_rate (ValueError при неверных значениях)"""
+    enabled = values.get('enabled')
+    if enabled not in (None, '0', '1'):
+        raise ValueError("enabled должен быть 0 или 1")
+    sample_rate = values.get('sample_rate')
+    return (None if enabled is None else enabled == '1'), (None if sample_rate is None else float(sample_rate))
+
+
+# Создание глобального профилировщика
+profiler = SamplingProfiler()
+# Накопленные стеки записываются при штатном завершении процесса
+atexit.register(profiler.flush)
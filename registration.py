@@ -1,7 +1,10 @@
 import datetime
 from typing import Dict, List, Any, Optional
 from database import db_manager
-from sqlite_backup import sqlite_backup_manager
+from backup_scheduler import backup_scheduler
+from room_cache import room_cache
+from availability import availability_index
+from metrics import metrics
 import logging
 
 logger = logging.getLogger(__name__)
@@ -28,17 +31,7 @@ class RegistrationManager:
     def get_available_rooms(self) -> List[str]:
         """Получение списка доступных номеров"""
         try:
-            if db_manager.demo_mode:
-                return ["к1/1", "к1/2", "к2/1", "Б1/1", "Б1/2"]
-            
-            # Проверяем соединение и переподключаемся при необходимости
-            if not db_manager.is_connected():
-                logger.info("Соединение с БД потеряно, переподключаемся...")
-                db_manager.connect()
-            
-            # Получаем номера из справочника
-            rooms_data = db_manager.get_table_data("справочник номеров", 100)
-            return [room['номер'] for room in rooms_data]
+            return room_cache.get_rooms()
         except Exception as e:
             logger.error(f"Ошибка получения номеров: {e}")
             return []
@@ -46,16 +39,7 @@ class RegistrationManager:
     def get_available_buildings(self) -> List[str]:
         """Получение списка доступных корпусов"""
         try:
-            rooms = self.get_available_rooms()
-            buildings = set()
-            
-            for room in rooms:
-                # Извлекаем корпус из номера (часть до "/")
-                if '/' in room:
-                    building = room.split('/')[0]
-                    buildings.add(building)
-            
-            return sorted(list(buildings))
+            return room_cache.get_buildings()
         except Exception as e:
             logger.error(f"Ошибка получения корпусов: {e}")
             return []
@@ -63,14 +47,7 @@ class RegistrationManager:
     def get_rooms_in_building(self, building: str) -> List[str]:
         """Получение списка номеров в конкретном корпусе"""
         try:
-            rooms = self.get_available_rooms()
-            building_rooms = []
-            
-            for room in rooms:
-                if room.startswith(building + '/'):
-                    building_rooms.append(room)
-            
-            return sorted(building_rooms)
+            return room_cache.get_rooms_in_building(building)
         except Exception as e:
             logger.error(f"Ошибка получения номеров в корпусе {building}: {e}")
             return []
@@ -256,51 +233,57 @@ class RegistrationManager:
         start_date = user_state.registration_data.get('start_date')
         end_date = user_state.registration_data.get('end_date')
         
+        conflicts = []
         if room and start_date and end_date:
-            # Проверяем конфликты в базе данных
-            conflicts = db_manager.check_date_conflicts(
-                room, 
-                start_date.strftime('%Y-%m-%d'), 
-                end_date.strftime('%Y-%m-%d')
+            # Проверяем конфликты по индексу занятости
+            conflicts = availability_index.get_conflicts(room, start_date, end_date)
+        
+        return self._dates_checked(user_state, conflicts)
+    
+    def _dates_checked(self, user_state, conflicts: List[Dict[str, Any]]) -> tuple[str, str, Any]:
+        """Переход после проверки дат: возврат к вводу дат при конфликтах или к вводу питания"""
+        room = user_state.registration_data.get('room', '')
+        start_date = user_state.registration_data.get('start_date')
+        end_date = user_state.registration_data.get('end_date')
+        
+        if conflicts:
+            # Есть конфликты - показываем их и предлагаем изменить даты
+            conflict_text = "⚠️ <b>Обнаружены конфликты с существующими записями:</b>\n\n"
+            conflict_text += f"🏨 Номер: <b>{room}</b>\n"
+            conflict_text += f"📅 Период: <b>{start_date.strftime('%d.%m.%Y')} - {end_date.strftime('%d.%m.%Y')}</b>\n\n"
+            conflict_text += "📋 <b>Существующие записи в этом периоде:</b>\n"
+            
+            for conflict in conflicts:
+                # Проверяем, является ли дата строкой или объектом datetime
+                if isinstance(conflict['дата'], str):
+                    conflict_date = datetime.datetime.strptime(conflict['дата'], '%Y-%m-%d').strftime('%d.%m.%Y')
+                else:
+                    conflict_date = conflict['дата'].strftime('%d.%m.%Y')
+                conflict_text += f"• {conflict_date} - {conflict['ФИО']}\n"
+            
+            conflict_text += "\n❌ <b>Регистрация невозможна из-за пересечения дат.</b>\n"
+            conflict_text += "Пожалуйста, выберите другой период или номер."
+            
+            # Сохраняем состояние для возврата к вводу дат
+            user_state.registration_data['date_conflict'] = True
+            user_state.current_step = 'enter_dates'
+            
+            # Для веб-приложения возвращаем только текст
+            text = (
+                "📅 <b>Ввод дат размещения</b>\n\n"
+                "Введите дату начала размещения в формате ДД.ММ.ГГГГ\n"
+                "Например: 25.08.2024\n\n"
+                "⚠️ <b>Убедитесь, что выбранные даты не пересекаются с существующими записями.</b>"
             )
             
-            if conflicts:
-                # Есть конфликты - показываем их и предлагаем изменить даты
-                conflict_text = "⚠️ <b>Обнаружены конфликты с существующими записями:</b>\n\n"
-                conflict_text += f"🏨 Номер: <b>{room}</b>\n"
-                conflict_text += f"📅 Период: <b>{start_date.strftime('%d.%m.%Y')} - {end_date.strftime('%d.%m.%Y')}</b>\n\n"
-                conflict_text += "📋 <b>Существующие записи в этом периоде:</b>\n"
-                
-                for conflict in conflicts:
-                    # Проверяем, является ли дата строкой или объектом datetime
-                    if isinstance(conflict['дата'], str):
-                        conflict_date = datetime.datetime.strptime(conflict['дата'], '%Y-%m-%d').strftime('%d.%m.%Y')
-                    else:
-                        conflict_date = conflict['дата'].strftime('%d.%m.%Y')
-                    conflict_text += f"• {conflict_date} - {conflict['ФИО']}\n"
-                
-                conflict_text += "\n❌ <b>Регистрация невозможна из-за пересечения дат.</b>\n"
-                conflict_text += "Пожалуйста, выберите другой период или номер."
-                
-                # Сохраняем состояние для возврата к вводу дат
-                user_state.registration_data['date_conflict'] = True
-                user_state.current_step = 'enter_dates'
-                
-                # Для веб-приложения возвращаем только текст
-                text = (
-                    "📅 <b>Ввод дат размещения</b>\n\n"
-                    "Введите дату начала размещения в формате ДД.ММ.ГГГГ\n"
-                    "Например: 25.08.2024\n\n"
-                    "⚠️ <b>Убедитесь, что выбранные даты не пересекаются с существующими записями.</b>"
-                )
-                
-                return 'enter_dates', text, None
+            return 'enter_dates', text, None
         
         # Нет конфликтов - продолжаем регистрацию
         # Инициализируем данные для каждого дня
         user_state.registration_data['daily_meals'] = {}
         user_state.registration_data['current_day_index'] = 0
         user_state.current_step = 'enter_meals_for_day'
+        date_range = user_state.registration_data['date_range']
         
         # Для веб-приложения возвращаем только текст
         text = (
@@ -523,24 +506,28 @@ class RegistrationManager:
         try:
             # Сохраняем данные в базу
             success = self.save_registration_data(user_state.registration_data)
-            logger.info(f"Результат сохранения: {success}")
-            
-            if success:
-                # Для веб-приложения возвращаем только текст
-                text = (
-                    "📝 <b>Регистрация</b>\n"
-                    "📊 <b>Таблицы БД</b>\n"
-                    "❓ <b>Справка</b>"
-                )
-                
-                return 'success', text, None
-            else:
-                return 'error', "❌ Ошибка при сохранении данных. Попробуйте позже.", None
+            return self._saved(success)
                 
         except Exception as e:
             logger.error(f"Ошибка завершения регистрации: {e}")
             return 'error', "❌ Произошла ошибка при сохранении данных.", None
     
+    def _saved(self, success: bool) -> tuple[str, str, Any]:
+        """Ответ после сохранения регистрации"""
+        logger.info(f"Результат сохранения: {success}")
+        
+        if success:
+            # Для веб-приложения возвращаем только текст
+            text = (
+                "📝 <b>Регистрация</b>\n"
+                "📊 <b>Таблицы БД</b>\n"
+                "❓ <b>Справка</b>"
+            )
+            
+            return 'success', text, None
+        else:
+            return 'error', "❌ Ошибка при сохранении данных. Попробуйте позже.", None
+    
     def save_registration_data(self, data: Dict[str, Any]) -> bool:
         """Сохранение данных регистрации в базу и резервную копию"""
         try:
@@ -548,107 +535,83 @@ class RegistrationManager:
                 logger.info("Демо-режим: данные не сохраняются")
                 return True
             
-            # Получаем данные
-            room = data['room']
-            name = data['name']
-            date_range = data['date_range']
-            daily_meals = data['daily_meals']
-            
-            # Отладочная информация
-            logger.info(f"Сохранение данных для: комната={room}, имя={name}")
-            logger.info(f"Тип date_range: {type(date_range)}")
-            logger.info(f"Количество дат: {len(date_range)}")
-            logger.info(f"Первая дата: {date_range[0]} (тип: {type(date_range[0])})")
-            logger.info(f"Тип daily_meals: {type(daily_meals)}")
-            logger.info(f"Ключи daily_meals: {list(daily_meals.keys())}")
-            
-            saved_count = 0
-            skipped_count = 0
-            backup_records = []  # Список записей для резервного копирования
-            
-            # Создаем записи для каждой даты
-            for date in date_range:
-                logger.info(f"Обрабатываем дату: {date} (тип: {type(date)})")
-                try:
-                    date_key = date.strftime('%Y-%m-%d')
-                    logger.info(f"Создан ключ даты: {date_key}")
-                except AttributeError as e:
-                    logger.error(f"Ошибка при создании ключа даты: {e}")
-                    logger.error(f"Дата: {date}, тип: {type(date)}")
-                    raise e
-                
-                day_meals = daily_meals.get(date_key, {})
-                logger.info(f"Данные о питании для {date_key}: {day_meals}")
-                
-                record = {
-                    'номер': room,
-                    'дата': date_key,
-                    'ФИО': name,
-                    'зд': day_meals.get('зд', 0),
-                    'зв': day_meals.get('зв', 0),
-                    'од': day_meals.get('од', 0),
-                    'ов': day_meals.get('ов', 0),
-                    'уд': day_meals.get('уд', 0),
-                    'ув': day_meals.get('ув', 0)
-                }
-                
-                try:
-                    # Вставляем запись в таблицу
-                    result = db_manager.insert_record('посетители', record)
-                    if result > 0:  # Запись успешно вставлена
-                        saved_count += 1
-                        logger.info(f"Сохранена запись для {room}, {date_key}, {name}")
-                        # Добавляем запись в список для резервного копирования
-                        backup_records.append(record)
-                    else:
-                        logger.warning(f"Запись не была вставлена для {room}, {date_key}, {name}")
-                        
-                except Exception as insert_error:
-                    # Проверяем, является ли ошибка дублированием
-                    error_msg = str(insert_error).lower()
-                    if 'duplicate' in error_msg or 'unique' in error_msg or 'already exists' in error_msg:
-                        logger.warning(f"Запись уже существует для {room}, {date_key}, {name}")
-                        skipped_count += 1
-                    else:
-                        # Если это не ошибка дублирования, логируем и продолжаем
-                        logger.error(f"Ошибка вставки записи для {room}, {date_key}, {name}: {insert_error}")
-                        # Не прерываем процесс, продолжаем с другими записями
-            
-            # Резервное копирование SQLite3 (только для успешно сохраненных записей)
-            if backup_records:
-                try:
-                    backup_path = sqlite_backup_manager.create_backup()
-                    if backup_path:
-                        logger.info(f"Создана резервная копия: {backup_path}")
-                    else:
-                        logger.warning("Не удалось создать резервную копию")
-                except Exception as backup_error:
-                    logger.error(f"Ошибка резервного копирования: {backup_error}")
-                    # Не прерываем основной процесс из-за ошибки резервного копирования
+            records = self._visitor_records(data)
             
-            # Формируем итоговый результат
-            if saved_count > 0:
-                logger.info(f"Сохранено {saved_count} записей для клиента {name}")
-                if skipped_count > 0:
-                    logger.info(f"Пропущено {skipped_count} дублирующих записей")
-                return True
-            elif skipped_count > 0:
-                logger.warning(f"Все записи для клиента {name} уже существуют (пропущено {skipped_count})")
-                return True  # Считаем успехом, так как записи уже есть
-            else:
-                logger.error(f"Не удалось сохранить ни одной записи для клиента {name}")
-                return False
+            # Вставляем все дни одним запросом; дубликаты пропускаются базой данных
+            inserted_flags = db_manager.insert_visitor_records(records)
+            return self._records_saved(data, records, inserted_flags)
             
         except Exception as e:
             logger.error(f"Критическая ошибка сохранения данных регистрации: {e}")
             return False
     
+    def _visitor_records(self, data: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Записи таблицы посетители для всех дат проживания"""
+        # Получаем данные
+        room = data['room']
+        name = data['name']
+        date_range = data['date_range']
+        daily_meals = data['daily_meals']
+        
+        logger.info(f"Сохранение данных для: комната={room}, имя={name}, дней={len(date_range)}")
+        
+        # Формируем записи для всех дат проживания
+        records = []
+        for date in date_range:
+            date_key = date.strftime('%Y-%m-%d')
+            day_meals = daily_meals.get(date_key, {})
+            records.append({
+                'номер': room,
+                'дата': date_key,
+                'ФИО': name,
+                'зд': day_meals.get('зд', 0),
+                'зв': day_meals.get('зв', 0),
+                'од': day_meals.get('од', 0),
+                'ов': day_meals.get('ов', 0),
+                'уд': day_meals.get('уд', 0),
+                'ув': day_meals.get('ув', 0)
+            })
+        return records
+    
+    def _records_saved(self, data: Dict[str, Any], records: List[Dict[str, Any]],
+                       inserted_flags: List[bool]) -> bool:
+        """Итог вставки: журнал пропущенных дублей, запрос резервной копии и результат"""
+        room = data['room']
+        name = data['name']
+        saved_count = sum(inserted_flags)
+        skipped_count = len(records) - saved_count
+        
+        for record, inserted in zip(records, inserted_flags):
+            if not inserted:
+                logger.warning(f"Запись уже существует для {room}, {record['дата']}, {name}")
+        
+        # Резервное копирование SQLite3 (только если были сохранены новые записи) выполняется
+        # в фоне: пользователь не ждет копирования, пачка регистраций дает одну копию
+        if saved_count > 0:
+            backup_scheduler.request_backup(f"регистрация {room}")
+        
+        # Формируем итоговый результат
+        if saved_count > 0:
+            logger.info(f"Сохранено {saved_count} записей для клиента {name}")
+            if skipped_count > 0:
+                logger.info(f"Пропущено {skipped_count} дублирующих записей")
+            return True
+        elif skipped_count > 0:
+            logger.warning(f"Все записи для клиента {name} уже существуют (пропущено {skipped_count})")
+            return True  # Считаем успехом, так как записи уже есть
+        else:
+            logger.error(f"Не удалось сохранить ни одной записи для клиента {name}")
+            return False
+    
     def process_step(self, message, user_state) -> tuple[str, str, Any]:
         """Обработка текущего шага регистрации"""
         current_step = user_state.current_step
         
         if current_step in self.registration_steps:
-            return self.registration_steps[current_step](message, user_state)
+            with metrics.timer('bot_step_duration_seconds', step=current_step):
+                result = self.registration_steps[current_step](message, user_state)
+            metrics.inc('bot_step_results_total', step=current_step, result=result[0])
+            return result
         else:
             return 'error', "❌ Неизвестный шаг регистрации.", None
 
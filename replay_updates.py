@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Воспроизведение обновлений Telegram без сети для замера задержки и пропускной способности бота
+
+Обновления берутся из файла, записанного webhook (WEBHOOK_RECORD_PATH), или
+генерируются как диалоги регистрации. Запросы бота к Telegram API перехватываются
+(apihelper.CUSTOM_REQUEST_SENDER) и отвечают локально с заданной задержкой.
+
+Примеры:
+    python replay_updates.py --generate 200 --mode webhook
+    python replay_updates.py --generate 200 --output updates.jsonl
+    python replay_updates.py updates.jsonl --mode polling --poll-interval 1
+"""
+
+import argparse
+import datetime
+import json
+import os
+import random
+import collections
+import threading
+import time
+import logging
+from typing import List, Dict, Any, Optional
+
+# Токен нужен только для создания объекта бота: запросы в сеть не уходят
+os.environ.setdefault('BOT_TOKEN', '0:replay')
+
+from telebot import apihelper
+from config import WEBHOOK_PATH
+from webhook import create_webhook_blueprint, load_updates
+
+logger = logging.getLogger(__name__)
+
+
+class FakeTelegramApi:
+    """Локальная замена Telegram Bot API для apihelper.CUSTOM_REQUEST_SENDER"""
+    
+    def __init__(self, latency: float = 0.0, batches: List[List[Dict[str, Any]]] = None,
+                 poll_interval: float = 0.0, flood_limit: Optional[int] = None):
+        self.latency = latency
+        self.poll_interval = poll_interval
+        self.flood_limit = flood_limit
+        self._batches = list(batches or [])
+        self._lock = threading.Lock()
+        self._recent: 'collections.deque[float]' = collections.deque()
+        self.calls: Dict[str, int] = {}
+        self.flood_errors = 0
+        self.drained = threading.Event()
+        if not self._batches:
+            self.drained.set()
+    
+    def __call__(self, method, url, **kwargs):
+        api_method = url.rsplit('/', 1)[-1]
+        with self._lock:
+            self.calls[api_method] = self.calls.get(api_method, 0) + 1
+        
+        if api_method == 'getUpdates':
+            result = self._next_batch()
+        else:
+            if self.latency:
+                time.sleep(self.latency)
+            if self._flooded():
+                return _FakeResponse({
+                    'ok': False, 'error_code': 429, 'description': 'Too Many Requests: retry after 1',
+                    'parameters': {'retry_after': 1},
+                }, status_code=429)
+            result = self._result_for(api_method, kwargs.get('params') or {})
+        return _FakeResponse({'ok': True, 'result': result})
+    
+    def _flooded(self) -> bool:
+        """Имитация ограничения Telegram: больше flood_limit запросов за секунду получают 429"""
+        if not self.flood_limit:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            while self._recent and now - self._recent[0] > 1:
+                self._recent.popleft()
+            if len(self._recent) >= self.flood_limit:
+                self.flood_errors += 1
+                return True
+            self._recent.append(now)
+            return False
+    
+    def _next_batch(self) -> List[Dict[str, Any]]:
+        """Очередная пачка для getUpdates; пустой ответ - когда обновления закончились"""
+        if self.poll_interval:
+            time.sleep(self.poll_interval)
+        with self._lock:
+            if self._batches:
+                return self._batches.pop(0)
+        self.drained.set()
+        time.sleep(0.05)
+        return []
+    
+    @staticmethod
+    def _result_for(api_method: str, params: Dict[str, Any]) -> Any:
+        """Минимальный ответ, который telebot умеет разобрать"""
+        if api_method in ('sendMessage', 'editMessageText'):
+            return {
+                'message_id': 1,
+                'date': int(time.time()),
+                'chat': {'id': int(params.get('chat_id', 0)), 'type': 'private'},
+                'text': params.get('text', ''),
+            }
+        return True
+
+
+class _FakeResponse:
+    """Ответ в том виде, в каком его ожидает apihelper._check_result"""
+    
+    def __init__(self, payload: Dict[str, Any], status_code: int = 200):
+        self.status_code = status_code
+        self.reason = 'OK' if status_code == 200 else 'Too Many Requests'
+        self.text = json.dumps(payload, ensure_ascii=False)
+        self._payload = payload
+    
+    def json(self) -> Dict[str, Any]:
+        return self._payload
+
+
+def generate_updates(users: int, seed: int = 1, confirm: bool = False) -> List[Dict[str, Any]]:
+    """Диалоги регистрации для users пользователей, перемешанные между собой
+    
+    Сообщения одного пользователя идут в исходном порядке; регистрация
+    завершается отменой, чтобы прогон не записывал данные в БД, или
+    подтверждением (confirm=True, для прогонов на отдельной базе).
+    """
+    from registration import registration_manager
+    
+    rng = random.Random(seed)
+    buildings = registration_manager.get_available_buildings() or ['к1']
+    rooms = {building: registration_manager.get_rooms_in_building(building) or [f'{building}/1']
+             for building in buildings}
+    
+    conversations = []
+    for index in range(users):
+        building = rng.choice(buildings)
+        start = datetime.date.today() + datetime.timedelta(days=rng.randint(30, 300))
+        # Дата окончания позже даты начала, питание вводится за каждый день включительно
+        days = rng.randint(2, 4)
+        texts = [
+            '/start', '📝 Регистрация', building, rng.choice(rooms[building]), f'Гость Тестовый {index}',
+            start.strftime('%d.%m.%Y'), (start + datetime.timedelta(days=days - 1)).strftime('%d.%m.%Y'),
+            '✅ Подтвердить',
+        ]
+        texts += [' '.join(str(rng.randint(0, 2)) for _ in range(6)) for _ in range(days)]
+        texts.append('✅ Подтвердить регистрацию' if confirm else '❌ Отмена')
+        conversations.append([(1_000_000 + index, text) for text in texts])
+    
+    # Чередование диалогов, как при одновременной работе пользователей
+    updates = []
+    while conversations:
+        conversation = rng.choice(conversations)
+        user_id, text = conversation.pop(0)
+        if not conversation:
+            conversations.remove(conversation)
+        update_id = len(updates) + 1
+        message = {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'Гость'},
+            'text': text,
+        }
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text)}]
+        updates.append({'update_id': update_id, 'message': message})
+    return updates
+
+
+def replay_webhook(dispatcher, updates: List[Dict[str, Any]]) -> Dict[str, int]:
+    """Отправка обновлений в webhook через тестовый клиент Flask"""
+    from flask import Flask
+    
+    app = Flask(__name__)
+    app.register_blueprint(create_webhook_blueprint(dispatcher, secret='', record_path=''))
+    statuses: Dict[str, int] = {}
+    with app.test_client() as client:
+        for update in updates:
+            response = client.post(WEBHOOK_PATH, data=json.dumps(update, ensure_ascii=False),
+                                   content_type='application/json')
+            statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+    return statuses
+
+
+def wait_idle(dispatcher, expected: int, timeout: float) -> bool:
+    """Ожидание, пока диспетчер обработает expected обновлений"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        processed = sum(worker.processed for worker in dispatcher.workers)
+        if processed >= expected:
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Воспроизведение обновлений Telegram без сети')
+    parser.add_argument('path', nargs='?', help='Файл с обновлениями (JSON lines или JSON-массив)')
+    parser.add_argument('--generate', type=int, metavar='N', help='Сгенерировать диалоги для N пользователей')
+    parser.add_argument('--output', help='Сохранить сгенерированные обновления в файл и выйти')
+    parser.add_argument('--seed', type=int, default=1, help='Начальное значение генератора')
+    parser.add_argument('--mode', choices=('webhook', 'polling'), default='webhook', help='Путь доставки обновлений')
+    parser.add_argument('--batch', type=int, default=100, help='Обновлений в одном ответе getUpdates (polling)')
+    parser.add_argument('--poll-interval', type=float, default=0.0,
+                        help='Пауза перед ответом getUpdates, с (1 - как прежний bot.polling(interval=1))')
+    parser.add_argument('--api-latency', type=float, default=0.0, help='Задержка ответа Telegram API, с')
+    parser.add_argument('--flood-limit', type=int, help='Имитировать 429 при превышении N запросов к API в секунду')
+    parser.add_argument('--send-rate', type=float, help='Лимит очереди отправки, сообщений в секунду на бота')
+    parser.add_argument('--chat-rate', type=float, help='Лимит очереди отправки, сообщений в секунду на чат')
+    parser.add_argument('--timeout', type=float, default=300, help='Максимальное время прогона, с')
+    parser.add_argument('--json', action='store_true', help='Вывести результат в JSON')
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.WARNING)
+    
+    if args.generate:
+        updates = generate_updates(args.generate, args.seed)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                for update in updates:
+                    f.write(json.dumps(update, ensure_ascii=False) + '\n')
+            print(f"Записано обновлений: {len(updates)} -> {args.output}")
+            return
+    elif args.path:
+        updates = load_updates(args.path)
+    else:
+        parser.error('Укажите файл с обновлениями или --generate N')
+    
+    batches = [updates[i:i + args.batch] for i in range(0, len(updates), args.batch)] \
+        if args.mode == 'polling' else []
+    api = FakeTelegramApi(args.api_latency, batches, args.poll_interval, args.flood_limit)
+    apihelper.CUSTOM_REQUEST_SENDER = api
+    
+    import bot
+    from send_queue import SendQueue
+    dispatcher = bot.dispatcher
+    if args.send_rate or args.chat_rate:
+        # Обработчики берут очередь из глобальной переменной модуля bot
+        limits = {'global_rate': args.send_rate, 'chat_rate': args.chat_rate}
+        bot.outbox = SendQueue(bot.bot, **{name: value for name, value in limits.items() if value})
+    outbox = bot.outbox
+    
+    started = time.monotonic()
+    statuses: Dict[str, int] = {}
+    if args.mode == 'webhook':
+        dispatcher.start()
+        statuses = replay_webhook(dispatcher, updates)
+        accepted = statuses.get('200', 0)
+    else:
+        poller = threading.Thread(target=dispatcher.run_polling, kwargs={'poll_timeout': 0}, daemon=True)
+        poller.start()
+        api.drained.wait(args.timeout)
+        accepted = len(updates)
+    completed = wait_idle(dispatcher, accepted, max(args.timeout - (time.monotonic() - started), 0))
+    processed_in = time.monotonic() - started
+    # Ответы еще могут ждать в очереди отправки
+    completed = outbox.wait_idle(max(args.timeout - (time.monotonic() - started), 0)) and completed
+    elapsed = time.monotonic() - started
+    dispatcher.stop()
+    outbox.stop(timeout=1)
+    
+    metrics = dispatcher.get_metrics()
+    send_metrics = outbox.get_metrics()
+    result = {
+        'mode': args.mode,
+        'updates': len(updates),
+        'accepted': accepted,
+        'completed': completed,
+        'processing_seconds': round(processed_in, 3),
+        'elapsed_seconds': round(elapsed, 3),
+        'updates_per_second': round(accepted / processed_in, 1) if processed_in else None,
+        'latency_ms': metrics['latency_ms'],
+        'rejected': metrics['rejected'],
+        'send_queue': send_metrics,
+        'http_statuses': statuses,
+        'api_calls': api.calls,
+        'simulated_429': api.flood_errors,
+    }
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+        return
+    
+    print(f"Режим: {result['mode']}, обновлений: {result['updates']}, принято: {accepted}")
+    print(f"Обработка: {result['processing_seconds']} с, {result['updates_per_second']} обновлений/с; "
+          f"с отправкой ответов: {result['elapsed_seconds']} с")
+    latency = result['latency_ms']
+    print(f"Задержка обработки, мс: p50={latency['p50']} p95={latency['p95']} p99={latency['p99']}")
+    send_latency = send_metrics['queue_latency_ms']
+    print(f"Ожидание в очереди отправки, мс: p50={send_latency['p50']} p95={send_latency['p95']} "
+          f"p99={send_latency['p99']}; повторов после 429: {send_metrics['rate_limited']}")
+    print(f"Отклонено очередью: {result['rejected']}, запросов к API: {sum(api.calls.values())}")
+    if not completed:
+        print("⚠️ Не все обновления обработаны за отведенное время")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+import logging
+from typing import Dict, List, Any, Optional
+from config import ROOM_CACHE_TTL
+from database import db_manager
+
+logger = logging.getLogger(__name__)
+
+# Номера, которые показываются в демо-режиме без подключения к БД
+DEMO_ROOMS = ["к1/1", "к1/2", "к2/1", "Б1/1", "Б1/2"]
+
+
+class RoomDirectoryCache:
+    """Кэш справочника номеров с готовым индексом корпус -> номера
+    
+    Справочник перечитывается по истечении TTL или сразу после изменения таблицы
+    "справочник номеров" через DatabaseManager (в том числе в других процессах,
+    если включены оповещения LISTEN/NOTIFY).
+    """
+    
+    def __init__(self, db_manager, ttl: float = ROOM_CACHE_TTL):
+        self.db_manager = db_manager
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._rooms: List[str] = []
+        self._buildings: Dict[str, List[str]] = {}
+        self._loaded_at: Optional[float] = None
+        self._generation = 0
+        self.db_manager.add_change_listener("справочник номеров", self._on_table_changed)
+    
+    def get_rooms(self) -> List[str]:
+        """Список всех номеров"""
+        self._ensure_loaded()
+        return list(self._rooms)
+    
+    def get_buildings(self) -> List[str]:
+        """Отсортированный список корпусов"""
+        self._ensure_loaded()
+        return list(self._buildings)
+    
+    def get_rooms_in_building(self, building: str) -> List[str]:
+        """Отсортированный список номеров корпуса"""
+        self._ensure_loaded()
+        return list(self._buildings.get(building, []))
+    
+    def is_fresh(self) -> bool:
+        """Справочник загружен и не устарел: запросы не обращаются к БД"""
+        loaded_at = self._loaded_at
+        return loaded_at is not None and time.monotonic() - loaded_at < self.ttl
+    
+    def preload(self) -> None:
+        """Загрузка справочника заранее, если кэш пуст или устарел"""
+        self._ensure_loaded()
+    
+    def invalidate(self) -> None:
+        """Сброс кэша: следующий запрос перечитает справочник"""
+        self._generation += 1
+        self._loaded_at = None
+        logger.info("Кэш справочника номеров сброшен")
+    
+    def _on_table_changed(self, table_name: str, rows: Optional[List[Dict[str, Any]]]) -> None:
+        """Обработчик изменений таблицы справочника"""
+        self.invalidate()
+    
+    def _ensure_loaded(self) -> None:
+        """Загрузка справочника, если кэш пуст или устарел"""
+        loaded_at = self._loaded_at
+        if loaded_at is not None and time.monotonic() - loaded_at < self.ttl:
+            return
+        
+        with self._lock:
+            # Справочник мог загрузить другой поток, пока мы ждали блокировку
+            if self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl:
+                return
+            generation = self._generation
+            try:
+                if self.db_manager.demo_mode:
+                    rooms = list(DEMO_ROOMS)
+                else:
+                    rows = self.db_manager.statements.query('room_directory')
+                    rooms = [row['номер'] for row in rows]
+            except Exception as e:
+                if self._rooms:
+                    # Лучше отдать устаревший справочник, чем сломать страницу регистрации
+                    logger.error(f"Ошибка обновления кэша номеров, используется прежний: {e}")
+                    self._loaded_at = time.monotonic()
+                    return
+                raise
+            
+            buildings: Dict[str, List[str]] = {}
+            for room in rooms:
+                # Корпус - часть номера до "/"
+                if '/' in room:
+                    buildings.setdefault(room.split('/')[0], []).append(room)
+            
+            self._rooms = rooms
+            self._buildings = {building: sorted(buildings[building]) for building in sorted(buildings)}
+            # Если справочник изменился во время загрузки, данные сразу считаются устаревшими
+            self._loaded_at = time.monotonic() if generation == self._generation else None
+            logger.info(f"Кэш справочника номеров загружен: {len(rooms)} номеров, {len(buildings)} корпусов")
+
+
+# Создание глобального экземпляра кэша справочника номеров
+room_cache = RoomDirectoryCache(db_manager)
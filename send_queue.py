@@ -0,0 +1,404 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import collections
+import heapq
+import itertools
+import threading
+import time
+import logging
+from concurrent.futures import Future
+from typing import Dict, List, Any, Optional, Callable, Iterable, Tuple
+import requests
+from telebot.apihelper import ApiTelegramException
+from config import (
+    SEND_GLOBAL_RATE, SEND_CHAT_RATE, SEND_CHAT_BURST, SEND_GROUP_PER_MINUTE, SEND_WORKERS,
+    SEND_MAX_RETRIES, SEND_QUEUE_SIZE
+)
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты отправки: ответы на нажатия кнопок, затем ответы пользователю, затем массовые уведомления
+PRIORITY_CALLBACK = -1
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+PRIORITY_NAMES = {PRIORITY_CALLBACK: 'callback', PRIORITY_INTERACTIVE: 'interactive', PRIORITY_BULK: 'bulk'}
+
+# Сколько последних задержек в очереди хранить для перцентилей
+LATENCY_WINDOW = 1000
+
+# Предельная пауза перед повтором после сетевой ошибки (секунды)
+MAX_RETRY_PAUSE = 30
+
+
+class SendQueueFull(Exception):
+    """Очередь отправки заполнена, массовое сообщение не принято"""
+
+
+class TokenBucket:
+    """Ведро токенов: rate сообщений в секунду, до capacity подряд"""
+    
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+    
+    def delay(self, now: float) -> float:
+        """Сколько секунд ждать до появления токена"""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+    
+    def reserve(self, now: float) -> float:
+        """Резервирование токена (возможно, в долг); возвращает время ожидания до него"""
+        wait = self.delay(now)
+        self.tokens -= 1
+        return wait
+    
+    def pause(self, now: float, seconds: float) -> None:
+        """Запрет выдачи токенов на seconds секунд (повторные паузы не складываются)"""
+        self._refill(now)
+        self.tokens = min(self.tokens, 1 - seconds * self.rate)
+    
+    def is_full(self, now: float) -> bool:
+        """Ведро полное - его можно удалить без потери ограничения"""
+        self._refill(now)
+        return self.tokens >= self.capacity
+    
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+class _SendJob:
+    """Вызов Telegram API, ожидающий отправки"""
+    __slots__ = ('func', 'args', 'kwargs', 'priority', 'seq', 'enqueued_at', 'attempts', 'future')
+    
+    def __init__(self, func: Callable, args: tuple, kwargs: Dict[str, Any], priority: int, seq: int):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.priority = priority
+        self.seq = seq
+        self.enqueued_at = time.monotonic()
+        self.attempts = 0
+        self.future: Future = Future()
+
+
+class SendQueue:
+    """Очередь исходящих сообщений бота с ограничением скорости
+    
+    Обработчики ставят вызов API в очередь и сразу возвращаются. Потоки отправки
+    соблюдают ограничения Telegram: не больше global_rate сообщений в секунду на
+    бота и chat_rate в секунду на личный чат (group_per_minute в минуту на группу).
+    Сообщения одного чата уходят строго по порядку, из готовых к отправке чатов
+    первым обслуживается чат с более приоритетным сообщением. Ответ 429 не теряет
+    сообщение: чат приостанавливается на retry_after секунд, и попытка повторяется.
+    """
+    
+    def __init__(self, bot, global_rate: float = SEND_GLOBAL_RATE, chat_rate: float = SEND_CHAT_RATE,
+                 chat_burst: int = SEND_CHAT_BURST, group_per_minute: float = SEND_GROUP_PER_MINUTE,
+                 workers: int = SEND_WORKERS, max_retries: int = SEND_MAX_RETRIES,
+                 max_size: int = SEND_QUEUE_SIZE):
+        self.bot = bot
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_per_minute / 60
+        self.workers = workers
+        self.max_retries = max_retries
+        self.max_size = max_size
+        self._global_bucket = TokenBucket(global_rate, global_rate)
+        self._chat_buckets: Dict[int, TokenBucket] = {}
+        self._condition = threading.Condition()
+        self._threads = []
+        self._stopping = False
+        self._seq = itertools.count()
+        # Очередь сообщений каждого чата и расписание чатов: готовые (по приоритету) и отложенные (по времени)
+        self._chats: Dict[int, 'collections.deque[_SendJob]'] = {}
+        self._ready = []
+        self._delayed = []
+        self._scheduled = set()
+        self._in_flight = set()
+        self._pending = 0
+        self._pending_by_priority = collections.Counter()
+        self._last_prune = time.monotonic()
+        
+        self._latencies: 'collections.deque[float]' = collections.deque(maxlen=LATENCY_WINDOW)
+        self.submitted_total = 0
+        self.sent_total = 0
+        self.failed_total = 0
+        self.retried_total = 0
+        self.rate_limited_total = 0
+        self.rejected_total = 0
+    
+    def submit(self, chat_id: int, func: Callable, *args, priority: int = PRIORITY_INTERACTIVE, **kwargs) -> Future:
+        """Постановка вызова func(*args, **kwargs) в очередь чата chat_id
+        
+        Возвращает Future с результатом вызова. Массовые сообщения (PRIORITY_BULK)
+        при заполненной очереди отклоняются исключением SendQueueFull; ответы
+        пользователям принимаются всегда - их поток ограничен очередями диспетчера.
+        """
+        with self._condition:
+            if priority == PRIORITY_BULK and self._pending >= self.max_size:
+                self.rejected_total += 1
+                raise SendQueueFull(f"Очередь отправки заполнена ({self._pending} сообщений)")
+            job = _SendJob(func, args, kwargs, priority, next(self._seq))
+            self._chats.setdefault(chat_id, collections.deque()).append(job)
+            self._pending += 1
+            self._pending_by_priority[priority] += 1
+            self.submitted_total += 1
+            if chat_id not in self._scheduled and chat_id not in self._in_flight:
+                self._schedule(chat_id, time.monotonic())
+            self._ensure_threads()
+            self._condition.notify()
+        return job.future
+    
+    def reply_to(self, message, text: str, **kwargs) -> Future:
+        """Ответ на сообщение пользователя через очередь"""
+        return self.submit(message.chat.id, self.bot.reply_to, message, text, **kwargs)
+    
+    def send_message(self, chat_id: int, text: str, priority: int = PRIORITY_INTERACTIVE, **kwargs) -> Future:
+        """Отправка сообщения в чат через очередь"""
+        return self.submit(chat_id, self.bot.send_message, chat_id, text, priority=priority, **kwargs)
+    
+    def edit_message_text(self, text: str, chat_id: int, message_id: int, **kwargs) -> Future:
+        """Изменение сообщения через очередь"""
+        return self.submit(chat_id, self.bot.edit_message_text, text, chat_id, message_id, **kwargs)
+    
+    def answer_callback_query(self, call, text: str = None, **kwargs) -> Future:
+        """Ответ на нажатие кнопки с наивысшим приоритетом
+        
+        Ответ не является сообщением в чат: он ставится в собственную очередь (по id
+        нажатия) и расходует только общий лимит бота, поэтому индикатор загрузки на
+        кнопке не ждет сообщений шага, уже стоящих в очереди чата.
+        """
+        return self.submit(('callback', call.id), self.bot.answer_callback_query, call.id, text,
+                           priority=PRIORITY_CALLBACK, **kwargs)
+    
+    def broadcast(self, chat_ids: Iterable[int], text: str, **kwargs) -> int:
+        """Массовое уведомление с низким приоритетом; возвращает число принятых сообщений"""
+        accepted = 0
+        for chat_id in chat_ids:
+            try:
+                self.send_message(chat_id, text, priority=PRIORITY_BULK, **kwargs)
+                accepted += 1
+            except SendQueueFull:
+                logger.warning(f"Очередь отправки заполнена, уведомление не поставлено для {chat_id}")
+                break
+        return accepted
+    
+    def pending(self) -> int:
+        """Число сообщений, ожидающих отправки"""
+        with self._condition:
+            return self._pending
+    
+    def wait_idle(self, timeout: Optional[float] = None) -> bool:
+        """Ожидание отправки всех принятых сообщений"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while self._pending:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+            return True
+    
+    def stop(self, timeout: float = 10) -> None:
+        """Отправка оставшихся сообщений (не дольше timeout секунд) и остановка потоков"""
+        if not self.wait_idle(timeout):
+            logger.warning(f"Не отправлено сообщений при остановке: {self.pending()}")
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        self._stopping = False
+    
+    def get_metrics(self) -> Dict[str, Any]:
+        """Показатели очереди: глубина, задержка до отправки, повторы и ошибки"""
+        with self._condition:
+            latencies = sorted(self._latencies)
+            metrics = {
+                'pending': self._pending,
+                'pending_by_priority': {
+                    PRIORITY_NAMES.get(priority, str(priority)): count
+                    for priority, count in sorted(self._pending_by_priority.items()) if count
+                },
+                'chats_waiting': len(self._scheduled),
+                'submitted': self.submitted_total,
+                'sent': self.sent_total,
+                'failed': self.failed_total,
+                'retried': self.retried_total,
+                'rate_limited': self.rate_limited_total,
+                'rejected': self.rejected_total,
+            }
+        
+        def percentile(fraction: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return round(latencies[min(int(len(latencies) * fraction), len(latencies) - 1)] * 1000, 1)
+        
+        # Задержка от постановки в очередь до начала успешной отправки
+        metrics['queue_latency_ms'] = {'p50': percentile(0.5), 'p95': percentile(0.95), 'p99': percentile(0.99)}
+        return metrics
+    
+    def collect_metrics(self) -> List[Tuple[str, str, str, Dict[str, Any], Any]]:
+        """Глубина очереди и итоги отправки для /metrics"""
+        with self._condition:
+            samples = [
+                ('bot_send_pending', 'gauge', 'Сообщения, ожидающие отправки', {'priority': name},
+                 self._pending_by_priority.get(priority, 0))
+                for priority, name in PRIORITY_NAMES.items()
+            ]
+            samples += [
+                ('bot_send_chats_waiting', 'gauge', 'Чаты с сообщениями в очереди', {}, len(self._scheduled)),
+                ('bot_send_submitted_total', 'counter', 'Сообщения, поставленные в очередь', {}, self.submitted_total),
+                ('bot_send_sent_total', 'counter', 'Отправленные сообщения', {}, self.sent_total),
+                ('bot_send_failed_total', 'counter', 'Сообщения, не отправленные после повторов', {}, self.failed_total),
+                ('bot_send_retried_total', 'counter', 'Повторы отправки', {}, self.retried_total),
+                ('bot_send_rate_limited_total', 'counter', 'Ответы 429 от Telegram', {}, self.rate_limited_total),
+                ('bot_send_rejected_total', 'counter', 'Массовые сообщения, отклоненные переполненной очередью', {},
+                 self.rejected_total),
+            ]
+        return samples
+    
+    def _ensure_threads(self) -> None:
+        """Запуск потоков отправки при первом сообщении (под блокировкой)"""
+        self._threads = [thread for thread in self._threads if thread.is_alive()]
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._run, name=f'bot-sender-{len(self._threads)}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+    
+    def _chat_bucket(self, chat_id: int) -> Optional[TokenBucket]:
+        """Ведро токенов чата (у групп - отрицательный id - свой лимит; у ответов на нажатия ведра нет)"""
+        if isinstance(chat_id, tuple):
+            return None
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if chat_id < 0:
+                bucket = TokenBucket(self.group_rate, 1)
+            else:
+                bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            self._chat_buckets[chat_id] = bucket
+        return bucket
+    
+    def _schedule(self, chat_id: int, now: float, not_before: float = 0.0) -> None:
+        """Постановка чата в расписание по его первому сообщению (под блокировкой)"""
+        jobs = self._chats.get(chat_id)
+        if not jobs:
+            self._chats.pop(chat_id, None)
+            return
+        head = jobs[0]
+        bucket = self._chat_bucket(chat_id)
+        ready_at = max(not_before, now + (bucket.delay(now) if bucket else 0.0))
+        if ready_at <= now:
+            heapq.heappush(self._ready, (head.priority, head.seq, chat_id))
+        else:
+            heapq.heappush(self._delayed, (ready_at, head.priority, head.seq, chat_id))
+        self._scheduled.add(chat_id)
+    
+    def _next_chat(self) -> Optional[int]:
+        """Ожидание чата, готового к отправке (под блокировкой); None - остановка"""
+        while True:
+            now = time.monotonic()
+            while self._delayed and self._delayed[0][0] <= now:
+                _, priority, seq, chat_id = heapq.heappop(self._delayed)
+                heapq.heappush(self._ready, (priority, seq, chat_id))
+            if self._ready:
+                _, _, chat_id = heapq.heappop(self._ready)
+                self._scheduled.discard(chat_id)
+                return chat_id
+            if self._stopping:
+                return None
+            if now - self._last_prune > 60:
+                self._prune_buckets(now)
+            timeout = self._delayed[0][0] - now if self._delayed else None
+            self._condition.wait(timeout)
+    
+    def _prune_buckets(self, now: float) -> None:
+        """Удаление полных ведер неактивных чатов (под блокировкой)"""
+        self._last_prune = now
+        for chat_id in [chat_id for chat_id, bucket in self._chat_buckets.items()
+                        if chat_id not in self._chats and bucket.is_full(now)]:
+            del self._chat_buckets[chat_id]
+    
+    def _run(self) -> None:
+        """Цикл потока отправки"""
+        while True:
+            with self._condition:
+                chat_id = self._next_chat()
+                if chat_id is None:
+                    return
+                job = self._chats[chat_id].popleft()
+                self._in_flight.add(chat_id)
+                now = time.monotonic()
+                bucket = self._chat_bucket(chat_id)
+                if bucket:
+                    bucket.reserve(now)
+                wait = self._global_bucket.reserve(now)
+            
+            if wait:
+                time.sleep(wait)
+            started = time.monotonic()
+            job.attempts += 1
+            retry_after = None
+            rate_limited = False
+            try:
+                result = job.func(*job.args, **job.kwargs)
+            except ApiTelegramException as e:
+                if e.error_code == 429 and job.attempts <= self.max_retries:
+                    retry_after = float((e.result_json.get('parameters') or {}).get('retry_after', 1))
+                    rate_limited = True
+                    logger.warning(f"Ограничение Telegram для чата {chat_id}, повтор через {retry_after} с")
+                else:
+                    self._finish(chat_id, job, error=e)
+                    continue
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if job.attempts <= self.max_retries:
+                    retry_after = min(2 ** (job.attempts - 1), MAX_RETRY_PAUSE)
+                    logger.warning(f"Ошибка сети при отправке в чат {chat_id}: {e}. Повтор через {retry_after} с")
+                else:
+                    self._finish(chat_id, job, error=e)
+                    continue
+            except Exception as e:
+                self._finish(chat_id, job, error=e)
+                continue
+            
+            if retry_after is not None:
+                with self._condition:
+                    self.retried_total += 1
+                    now = time.monotonic()
+                    if rate_limited:
+                        self.rate_limited_total += 1
+                        # 429 означает и превышение общего лимита бота: пауза для всех чатов
+                        self._global_bucket.pause(now, retry_after)
+                    self._chats.setdefault(chat_id, collections.deque()).appendleft(job)
+                    self._in_flight.discard(chat_id)
+                    self._schedule(chat_id, now, now + retry_after)
+                    self._condition.notify()
+                continue
+            
+            self._finish(chat_id, job, result=result, started=started)
+    
+    def _finish(self, chat_id: int, job: _SendJob, result: Any = None, error: Exception = None,
+                started: float = None) -> None:
+        """Завершение сообщения и постановка следующего сообщения чата в расписание"""
+        with self._condition:
+            self._pending -= 1
+            self._pending_by_priority[job.priority] -= 1
+            if error is None:
+                self.sent_total += 1
+                self._latencies.append(started - job.enqueued_at)
+            else:
+                self.failed_total += 1
+            self._in_flight.discard(chat_id)
+            self._schedule(chat_id, time.monotonic())
+            self._condition.notify_all()
+        
+        if error is None:
+            job.future.set_result(result)
+        else:
+            logger.error(f"Не удалось отправить сообщение в чат {chat_id}: {error}")
+            job.future.set_exception(error)
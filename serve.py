@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Рабочий запуск Flask-приложений через WSGI-сервер
+
+    python serve.py app      # основное приложение (порт 5000)
+    python serve.py admin    # административное приложение (порт 5000)
+    python serve.py client   # клиентское приложение (порт 8080)
+
+По умолчанию используется gunicorn (настройки в gunicorn_conf.py): несколько процессов
+с потоками в каждом. На Windows, где gunicorn не работает, - waitress: один процесс
+с WSGI_THREADS потоками. Адрес, число процессов и потоков задаются переменными WSGI_*.
+"""
+
+import argparse
+import importlib
+import logging
+import os
+import sys
+from config import WSGI_SERVER, WSGI_BIND, WSGI_THREADS, WSGI_TIMEOUT, print_config_status
+
+logger = logging.getLogger(__name__)
+
+# Приложение -> (модуль с create_app(), порт по умолчанию)
+APPS = {
+    'app': ('app', 5000),
+    'admin': ('admin_app', 5000),
+    'client': ('client_app', 8080),
+}
+
+
+def run_gunicorn(name: str, bind: str) -> None:
+    """Замена текущего процесса мастером gunicorn"""
+    module = APPS[name][0]
+    config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gunicorn_conf.py')
+    # gunicorn_conf.py читает адрес и имя приложения из окружения
+    os.environ['WSGI_BIND'] = bind
+    os.environ['WSGI_APP'] = name
+    os.execvp(sys.executable, [
+        sys.executable, '-m', 'gunicorn', '-c', config_path, f'{module}:create_app()'
+    ])
+
+
+def run_waitress(name: str, bind: str) -> None:
+    """Многопоточный сервер waitress в текущем процессе"""
+    from waitress import serve
+    
+    application = importlib.import_module(APPS[name][0]).create_app()
+    host, port = bind.rsplit(':', 1)
+    logger.info(f"waitress: {name} на {bind}, потоков: {WSGI_THREADS}")
+    serve(application, host=host, port=int(port), threads=WSGI_THREADS, channel_timeout=WSGI_TIMEOUT)
+
+
+def main():
+    """Разбор аргументов и запуск выбранного сервера"""
+    parser = argparse.ArgumentParser(description='Рабочий запуск Flask-приложения')
+    parser.add_argument('app', choices=sorted(APPS), help='приложение')
+    parser.add_argument('--server', choices=['gunicorn', 'waitress'], default=WSGI_SERVER,
+                        help='WSGI-сервер (по умолчанию WSGI_SERVER)')
+    parser.add_argument('--bind', default=WSGI_BIND, help='адрес host:port (по умолчанию WSGI_BIND)')
+    args = parser.parse_args()
+    
+    print_config_status()
+    logging.basicConfig(level=logging.INFO)
+    bind = args.bind or f'0.0.0.0:{APPS[args.app][1]}'
+    if args.server == 'gunicorn':
+        run_gunicorn(args.app, bind)
+    else:
+        run_waitress(args.app, bind)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,28 +1,53 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import csv
 import os
 import shutil
 import sqlite3
+import time
+from urllib.parse import quote
 from typing import Dict, List, Any, Optional
 from datetime import datetime
 import logging
+from config import SQLITE_BACKUP_PAGES, SQLITE_BACKUP_STEP_PAUSE
+from metrics import metrics
 
 logger = logging.getLogger(__name__)
 
+# Первые 16 байт любого файла базы данных SQLite 3
+SQLITE_HEADER = b'SQLite format 3\x00'
+
+# Сколько раз постраничное копирование может начаться заново из-за записи в источник
+MAX_BACKUP_RESTARTS = 3
+
+
+class BackupRestartLimit(Exception):
+    """Постраничное копирование слишком часто перезапускается из-за записи в источник"""
+
 
 class SQLiteBackupManager:
     """Менеджер для резервного копирования данных SQLite3"""
     
-    def __init__(self, db_path: str = "visitors.db", backup_dir: str = "backups"):
+    def __init__(self, db_path: str = "visitors.db", backup_dir: str = "backups",
+                 pages_per_step: int = SQLITE_BACKUP_PAGES, step_pause: float = SQLITE_BACKUP_STEP_PAUSE):
         self.db_path = db_path
         self.backup_dir = backup_dir
-        
-        # Создаем директорию для резервных копий, если её нет
+        self.pages_per_step = pages_per_step
+        self.step_pause = step_pause
+        # Показатели последнего копирования и накопленные итоги
+        self.last_backup_stats: Optional[Dict[str, Any]] = None
+        self.total_backups = 0
+        self.total_backup_bytes = 0
+        self.total_backup_seconds = 0.0
+    
+    def _ensure_backup_dir(self) -> None:
+        """Создание директории для резервных копий перед первой записью"""
         if not os.path.exists(self.backup_dir):
-            os.makedirs(self.backup_dir)
+            os.makedirs(self.backup_dir, exist_ok=True)
             logger.info(f"Создана директория для резервных копий: {self.backup_dir}")
     
+    @metrics.timed('backup_operation_duration_seconds', operation='create')
     def create_backup(self) -> str:
         """Создание резервной копии базы данных"""
         try:
@@ -34,11 +59,29 @@ class SQLiteBackupManager:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             backup_filename = f"visitors_backup_{timestamp}.db"
             backup_path = os.path.join(self.backup_dir, backup_filename)
+            self._ensure_backup_dir()
+            
+            # Копия пишется во временный файл, чтобы незавершенная копия не попала в список
+            temp_path = backup_path + '.tmp'
+            started = time.monotonic()
+            if self.is_sqlite_database(self.db_path):
+                stats = self._online_backup(temp_path)
+            else:
+                logger.warning(f"{self.db_path} не является базой SQLite, выполняется копирование файла")
+                shutil.copy2(self.db_path, temp_path)
+                stats = {'method': 'copy', 'pages': None, 'steps': 1}
+            os.replace(temp_path, backup_path)
             
-            # Копируем файл базы данных
-            shutil.copy2(self.db_path, backup_path)
+            stats['duration'] = time.monotonic() - started
+            stats['bytes'] = os.path.getsize(backup_path)
+            stats['mb_per_sec'] = round(stats['bytes'] / (1024 * 1024) / max(stats['duration'], 1e-6), 2)
+            stats['path'] = backup_path
+            self._record_stats(stats)
             
-            logger.info(f"Создана резервная копия: {backup_path}")
+            logger.info(
+                f"Создана резервная копия: {backup_path} ({stats['method']}, {stats['bytes']} байт "
+                f"за {stats['duration'] * 1000:.0f} мс, {stats['mb_per_sec']} МБ/с)"
+            )
             
             # Очищаем старые резервные копии, оставляя только 3 последние
             self.cleanup_old_backups(keep_count=3)
@@ -47,8 +90,83 @@ class SQLiteBackupManager:
             
         except Exception as e:
             logger.error(f"Ошибка создания резервной копии: {e}")
+            if 'temp_path' in locals() and os.path.exists(temp_path):
+                os.remove(temp_path)
             return None
     
+    @staticmethod
+    def is_sqlite_database(path: str) -> bool:
+        """Проверка заголовка файла: является ли он базой данных SQLite 3"""
+        try:
+            with open(path, 'rb') as f:
+                return f.read(len(SQLITE_HEADER)) == SQLITE_HEADER
+        except OSError:
+            return False
+    
+    def _online_backup(self, target_path: str) -> Dict[str, Any]:
+        """Согласованная копия через sqlite3 backup API
+        
+        Копируется pages_per_step страниц за шаг, между шагами - пауза step_pause,
+        во время которой пишущие соединения получают доступ к базе. Если источник
+        изменится во время копирования, SQLite сам начнет копирование заново,
+        поэтому результат - снимок на момент завершения. При постоянной записи
+        после MAX_BACKUP_RESTARTS перезапусков копия снимается за один шаг.
+        """
+        progress = {'steps': 0, 'pages': 0, 'restarts': 0, 'remaining': None}
+        
+        def on_step(status, remaining, total):
+            progress['steps'] += 1
+            progress['pages'] = total
+            if progress['remaining'] is not None and remaining > progress['remaining']:
+                progress['restarts'] += 1
+                if progress['restarts'] > MAX_BACKUP_RESTARTS:
+                    raise BackupRestartLimit()
+            progress['remaining'] = remaining
+            if remaining and self.step_pause:
+                time.sleep(self.step_pause)
+        
+        source = sqlite3.connect(f"file:{quote(os.path.abspath(self.db_path))}?mode=ro", uri=True)
+        target = sqlite3.connect(target_path)
+        method = 'sqlite_backup'
+        try:
+            try:
+                source.backup(target, pages=self.pages_per_step, progress=on_step)
+            except BackupRestartLimit:
+                logger.warning("База SQLite изменяется во время копирования, копия снимается за один шаг")
+                method = 'sqlite_backup_single_step'
+                progress['steps'] += 1
+                source.backup(target, pages=-1)
+        finally:
+            target.close()
+            source.close()
+        return {
+            'method': method,
+            'pages': progress['pages'],
+            'steps': progress['steps'],
+            'restarts': progress['restarts'],
+        }
+    
+    def _record_stats(self, stats: Dict[str, Any]) -> None:
+        """Сохранение показателей копирования"""
+        stats['finished_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        self.last_backup_stats = stats
+        self.total_backups += 1
+        self.total_backup_bytes += stats['bytes']
+        self.total_backup_seconds += stats['duration']
+    
+    def get_backup_metrics(self) -> Dict[str, Any]:
+        """Показатели производительности резервного копирования"""
+        return {
+            'last_backup': self.last_backup_stats,
+            'total_backups': self.total_backups,
+            'total_bytes': self.total_backup_bytes,
+            'total_seconds': round(self.total_backup_seconds, 3),
+            'avg_mb_per_sec': round(
+                self.total_backup_bytes / (1024 * 1024) / self.total_backup_seconds, 2
+            ) if self.total_backup_seconds else None,
+        }
+    
+    @metrics.timed('backup_operation_duration_seconds', operation='restore')
     def restore_backup(self, backup_path: str) -> bool:
         """Восстановление базы данных из резервной копии"""
         try:
@@ -150,7 +268,8 @@ class SQLiteBackupManager:
                 'total_size_mb': total_size_mb,
                 'backup_dir': self.backup_dir,
                 'latest_backup': backups[0] if backups else None,
-                'backups': backups[:5]  # Последние 5 копий
+                'backups': backups[:5],  # Последние 5 копий
+                'metrics': self.get_backup_metrics()
             }
             
         except Exception as e:
@@ -162,22 +281,24 @@ class SQLiteBackupManager:
                 'error': str(e)
             }
     
+    @metrics.timed('backup_operation_duration_seconds', operation='export_csv')
     def export_to_csv(self, table_name: str, csv_path: str = None) -> str:
         """Экспорт таблицы в CSV файл"""
         try:
             if not csv_path:
                 timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
                 csv_path = os.path.join(self.backup_dir, f"{table_name}_export_{timestamp}.csv")
+                self._ensure_backup_dir()
             
             # Подключаемся к базе данных
             conn = sqlite3.connect(self.db_path)
             cursor = conn.cursor()
             
-            # Получаем данные из таблицы
-            cursor.execute(f"SELECT * FROM {table_name}")
-            rows = cursor.fetchall()
+            # Получаем данные из таблицы (имя в кавычках: таблицы могут содержать пробелы)
+            cursor.execute('SELECT * FROM "{}"'.format(table_name.replace('"', '""')))
+            first_row = cursor.fetchone()
             
-            if not rows:
+            if first_row is None:
                 logger.warning(f"Таблица {table_name} пуста")
                 conn.close()
                 return None
@@ -185,14 +306,12 @@ class SQLiteBackupManager:
             # Получаем названия колонок
             columns = [description[0] for description in cursor.description]
             
-            # Записываем в CSV
-            with open(csv_path, 'w', encoding='utf-8') as f:
-                # Записываем заголовки
-                f.write(','.join(columns) + '\n')
-                
-                # Записываем данные
-                for row in rows:
-                    f.write(','.join(str(value) for value in row) + '\n')
+            # Записываем в CSV по RFC 4180, строки читаются курсором по одной
+            with open(csv_path, 'w', encoding='utf-8', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(columns)
+                writer.writerow(first_row)
+                writer.writerows(cursor)
             
             conn.close()
             logger.info(f"Таблица {table_name} экспортирована в {csv_path}")
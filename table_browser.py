@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import logging
+from typing import Dict, Any, Optional
+from config import BOT_TABLE_PAGE_SIZE
+from database import db_manager, SEARCH_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+
+class TableBrowser:
+    """Постраничный просмотр таблиц в боте
+    
+    Курсоры открытых страниц хранятся в состоянии пользователя (table_browse), а
+    кнопки передают только направление: в callback_data помещается 64 байта,
+    а курсор с ФИО длиннее. Возврат назад берет курсор из стека, а не OFFSET.
+    """
+    
+    def __init__(self, db_manager, page_size: int = BOT_TABLE_PAGE_SIZE):
+        self.db_manager = db_manager
+        self.page_size = page_size
+    
+    def open(self, user_state, table_name: str, search: Optional[str] = None) -> Dict[str, Any]:
+        """Первая страница таблицы (или результатов поиска)"""
+        user_state.current_table = table_name
+        user_state.table_browse = {'search': search, 'cursors': [None], 'next': None}
+        return self._load(user_state)
+    
+    def next_page(self, user_state) -> Optional[Dict[str, Any]]:
+        """Следующая страница; None, если просмотр не открыт или страница последняя"""
+        browse = user_state.table_browse
+        if not user_state.current_table or not browse.get('next'):
+            return None
+        browse['cursors'].append(browse['next'])
+        return self._load(user_state)
+    
+    def previous_page(self, user_state) -> Optional[Dict[str, Any]]:
+        """Предыдущая страница; None, если просмотр не открыт или страница первая"""
+        browse = user_state.table_browse
+        if not user_state.current_table or len(browse.get('cursors', [])) < 2:
+            return None
+        browse['cursors'].pop()
+        return self._load(user_state)
+    
+    def reset_search(self, user_state) -> Optional[Dict[str, Any]]:
+        """Первая страница таблицы без поиска"""
+        if not user_state.current_table:
+            return None
+        return self.open(user_state, user_state.current_table)
+    
+    def close(self, user_state) -> None:
+        """Завершение просмотра (выход в главное меню)"""
+        user_state.current_table = None
+        user_state.table_browse = {}
+    
+    def _load(self, user_state) -> Dict[str, Any]:
+        """Чтение текущей страницы и запоминание курсора следующей"""
+        browse = user_state.table_browse
+        page = self.db_manager.get_table_page(
+            user_state.current_table, self.page_size, browse['cursors'][-1], browse['search']
+        )
+        browse['next'] = page['next_cursor']
+        page['number'] = len(browse['cursors'])
+        page['offset'] = (page['number'] - 1) * self.page_size
+        page['searchable'] = user_state.current_table in SEARCH_COLUMNS
+        return page
+
+
+# Создание глобального экземпляра просмотра таблиц
+table_browser = TableBrowser(db_manager)
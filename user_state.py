@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import atexit
+import datetime
+import json
+import sqlite3
+import threading
+import time
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional, Tuple
+from config import (
+    USER_STATE_BACKEND, USER_STATE_DB_PATH, USER_STATE_MAX_USERS, USER_STATE_TTL, USER_STATE_FLUSH_INTERVAL
+)
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def _encode_value(value: Any) -> Any:
+    """Преобразование дат в JSON-совместимый вид: {"$d": "ГГГГ-ММ-ДД"}"""
+    if isinstance(value, datetime.date):
+        return {'$d': value.isoformat()}
+    raise TypeError(f"Значение типа {type(value).__name__} не сериализуется")
+
+
+def _decode_object(obj: Dict[str, Any]) -> Any:
+    """Обратное преобразование дат при чтении JSON"""
+    if len(obj) == 1 and '$d' in obj:
+        return datetime.date.fromisoformat(obj['$d'])
+    return obj
+
+
+class UserState:
+    """Состояние диалога пользователя с ботом"""
+    __slots__ = ('current_state', 'registration_data', 'current_table', 'table_browse', 'current_step', 'updated_at')
+    
+    def __init__(self):
+        self.current_state = None
+        self.registration_data = {}
+        self.current_table = None
+        # Просмотр таблицы current_table: строка поиска и курсоры открытых страниц
+        self.table_browse = {}
+        self.current_step = None
+        self.updated_at = time.time()
+    
+    def is_empty(self) -> bool:
+        """Пользователь не находится ни в каком диалоге"""
+        return self.current_state is None and self.current_step is None and not self.registration_data \
+            and self.current_table is None and not self.table_browse
+    
+    def dumps(self) -> str:
+        """Сериализация в компактный JSON (даты регистрации и daily_meals сохраняются)"""
+        return json.dumps(
+            [self.current_state, self.current_step, self.current_table, self.registration_data, self.table_browse],
+            default=_encode_value, ensure_ascii=False, separators=(',', ':')
+        )
+    
+    @classmethod
+    def loads(cls, data: str, updated_at: Optional[float] = None) -> 'UserState':
+        """Восстановление состояния из JSON"""
+        state = cls()
+        values = json.loads(data, object_hook=_decode_object)
+        state.current_state, state.current_step, state.current_table, state.registration_data = values[:4]
+        # Состояния, сохраненные до появления просмотра таблиц, содержат четыре поля
+        if len(values) > 4:
+            state.table_browse = values[4]
+        if updated_at is not None:
+            state.updated_at = updated_at
+        return state
+
+
+class MemoryStateStore:
+    """Хранилище состояний в памяти с вытеснением по LRU и TTL
+    
+    Порядок OrderedDict совпадает с порядком последнего обращения, поэтому
+    устаревшие состояния всегда находятся в начале и удаляются за O(1) на запись.
+    """
+    
+    def __init__(self, max_users: int = USER_STATE_MAX_USERS, ttl: float = USER_STATE_TTL):
+        self.max_users = max_users
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._states: 'OrderedDict[int, UserState]' = OrderedDict()
+        self.evicted_total = 0
+        self.expired_total = 0
+    
+    def get(self, user_id: int) -> UserState:
+        """Состояние пользователя (новое, если его нет или оно устарело)"""
+        with self._lock:
+            state = self._lookup(user_id)
+            if state is None:
+                state = self._load(user_id) or UserState()
+                self._put(user_id, state)
+            return state
+    
+    def save(self, user_id: int, state: UserState) -> None:
+        """Сохранение состояния после его изменения"""
+        state.updated_at = time.time()
+        with self._lock:
+            self._put(user_id, state)
+    
+    def delete(self, user_id: int) -> None:
+        """Удаление состояния пользователя"""
+        with self._lock:
+            self._states.pop(user_id, None)
+    
+    def close(self) -> None:
+        """Завершение работы хранилища"""
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Показатели хранилища"""
+        with self._lock:
+            return {
+                'backend': 'memory',
+                'users': len(self._states),
+                'max_users': self.max_users,
+                'evicted_total': self.evicted_total,
+                'expired_total': self.expired_total,
+            }
+    
+    def collect_metrics(self) -> List[Tuple[str, str, str, Dict[str, Any], Any]]:
+        """Показатели хранилища для /metrics (счетчики записи - только у sqlite)"""
+        stats = self.get_stats()
+        labels = {'backend': stats['backend']}
+        return [
+            ('user_state_users', 'gauge', 'Состояния диалогов в памяти', labels, stats['users']),
+            ('user_state_evicted_total', 'counter', 'Состояния, вытесненные по лимиту', labels, stats['evicted_total']),
+            ('user_state_expired_total', 'counter', 'Состояния, удаленные по сроку', labels, stats['expired_total']),
+            ('user_state_pending_writes', 'gauge', 'Состояния, ожидающие записи на диск', labels,
+             stats.get('pending_writes')),
+            ('user_state_flushes_total', 'counter', 'Записи пачек состояний на диск', labels, stats.get('flushes_total')),
+            ('user_state_written_total', 'counter', 'Записанные на диск состояния', labels, stats.get('written_total')),
+        ]
+    
+    def __len__(self) -> int:
+        return len(self._states)
+    
+    def _lookup(self, user_id: int) -> Optional[UserState]:
+        """Поиск в памяти с отметкой обращения (вызывается под блокировкой)"""
+        state = self._states.get(user_id)
+        if state is None:
+            return None
+        if time.time() - state.updated_at > self.ttl:
+            del self._states[user_id]
+            self.expired_total += 1
+            return None
+        self._states.move_to_end(user_id)
+        return state
+    
+    def _load(self, user_id: int) -> Optional[UserState]:
+        """Загрузка состояния из постоянного хранилища (у хранилища в памяти его нет)"""
+        return None
+    
+    def _put(self, user_id: int, state: UserState) -> None:
+        """Помещение в память с вытеснением устаревших и лишних состояний (под блокировкой)"""
+        self._states[user_id] = state
+        self._states.move_to_end(user_id)
+        
+        deadline = time.time() - self.ttl
+        while self._states:
+            oldest_id, oldest = next(iter(self._states.items()))
+            if oldest.updated_at >= deadline:
+                break
+            del self._states[oldest_id]
+            self.expired_total += 1
+        while len(self._states) > self.max_users:
+            self._states.popitem(last=False)
+            self.evicted_total += 1
+
+
+class SQLiteStateStore(MemoryStateStore):
+    """Хранилище состояний в SQLite (WAL) с кэшем последних пользователей в памяти
+    
+    Изменения копятся в памяти и записываются фоновым потоком одной транзакцией
+    раз в flush_interval секунд, поэтому ответ пользователю не ждет записи на диск.
+    Состояние, вытесненное из кэша, читается из файла при следующем обращении.
+    """
+    
+    def __init__(self, db_path: str = USER_STATE_DB_PATH, max_users: int = USER_STATE_MAX_USERS,
+                 ttl: float = USER_STATE_TTL, flush_interval: float = USER_STATE_FLUSH_INTERVAL):
+        super().__init__(max_users, ttl)
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self._db_lock = threading.Lock()
+        # Ожидающие записи снимки состояний: (JSON, updated_at) или None - удалить из файла
+        self._pending: Dict[int, Optional[Tuple[str, float]]] = {}
+        self._closed = threading.Event()
+        self.flushes_total = 0
+        self.written_total = 0
+        
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS user_states (
+                user_id INTEGER PRIMARY KEY,
+                data TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self._purge_expired()
+        
+        self._thread = threading.Thread(target=self._flush_loop, name='user-state-flush', daemon=True)
+        self._thread.start()
+    
+    def save(self, user_id: int, state: UserState) -> None:
+        """Сохранение состояния: в памяти сразу, на диске - со следующей пачкой
+        
+        Снимок JSON снимается здесь, в потоке обработчика пользователя: фоновая запись
+        не читает состояние, которое обработчик может менять в этот момент.
+        """
+        super().save(user_id, state)
+        # Пустое состояние (диалог завершен) на диске не храним
+        snapshot = None if state.is_empty() else (state.dumps(), state.updated_at)
+        with self._lock:
+            self._pending[user_id] = snapshot
+    
+    def delete(self, user_id: int) -> None:
+        """Удаление состояния пользователя из памяти и файла"""
+        super().delete(user_id)
+        with self._lock:
+            self._pending[user_id] = None
+    
+    def flush(self) -> int:
+        """Запись накопленных изменений одной транзакцией; возвращает число записанных состояний"""
+        with self._lock:
+            if not self._pending:
+                return 0
+            pending, self._pending = self._pending, {}
+        upserts = [(user_id, *snapshot) for user_id, snapshot in pending.items() if snapshot is not None]
+        deletes = [(user_id,) for user_id, snapshot in pending.items() if snapshot is None]
+        
+        with self._db_lock:
+            try:
+                self._conn.execute("BEGIN")
+                if upserts:
+                    self._conn.executemany("""
+                        INSERT INTO user_states (user_id, data, updated_at) VALUES (?, ?, ?)
+                        ON CONFLICT(user_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at
+                    """, upserts)
+                if deletes:
+                    self._conn.executemany("DELETE FROM user_states WHERE user_id = ?", deletes)
+                self._conn.execute("COMMIT")
+            except Exception as e:
+                self._conn.execute("ROLLBACK")
+                logger.error(f"Ошибка записи состояний пользователей: {e}")
+                # Неудачная пачка вернется в очередь, если её не перекрыли более новые изменения
+                with self._lock:
+                    for user_id, snapshot in pending.items():
+                        self._pending.setdefault(user_id, snapshot)
+                return 0
+        
+        self.flushes_total += 1
+        self.written_total += len(pending)
+        return len(pending)
+    
+    def close(self) -> None:
+        """Запись оставшихся изменений и закрытие файла"""
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        self._thread.join(self.flush_interval + 5)
+        self.flush()
+        with self._db_lock:
+            self._conn.close()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Показатели хранилища"""
+        stats = super().get_stats()
+        with self._lock:
+            pending = len(self._pending)
+        stats.update({
+            'backend': 'sqlite',
+            'db_path': self.db_path,
+            'pending_writes': pending,
+            'flushes_total': self.flushes_total,
+            'written_total': self.written_total,
+        })
+        return stats
+    
+    def _load(self, user_id: int) -> Optional[UserState]:
+        """Чтение состояния из файла (вызывается под блокировкой памяти)"""
+        if user_id in self._pending:
+            # Изменение еще не записано на диск - на диске устаревшая версия
+            snapshot = self._pending[user_id]
+            return None if snapshot is None else UserState.loads(*snapshot)
+        with self._db_lock:
+            row = self._conn.execute(
+                "SELECT data, updated_at FROM user_states WHERE user_id = ? AND updated_at >= ?",
+                (user_id, time.time() - self.ttl)
+            ).fetchone()
+        if row is None:
+            return None
+        try:
+            return UserState.loads(row[0], row[1])
+        except (ValueError, TypeError) as e:
+            logger.error(f"Повреждено сохраненное состояние пользователя {user_id}: {e}")
+            return None
+    
+    def _purge_expired(self) -> None:
+        """Удаление из файла состояний старше TTL"""
+        with self._db_lock:
+            deleted = self._conn.execute(
+                "DELETE FROM user_states WHERE updated_at < ?", (time.time() - self.ttl,)
+            ).rowcount
+        if deleted:
+            logger.info(f"Удалено устаревших состояний пользователей: {deleted}")
+    
+    def _flush_loop(self) -> None:
+        """Фоновая запись изменений; раз в час удаляются устаревшие состояния"""
+        last_purge = time.monotonic()
+        while not self._closed.wait(self.flush_interval):
+            try:
+                self.flush()
+                if time.monotonic() - last_purge > 3600:
+                    self._purge_expired()
+                    last_purge = time.monotonic()
+            except Exception as e:
+                logger.error(f"Ошибка фоновой записи состояний пользователей: {e}")
+
+
+def create_user_state_store(backend: str = USER_STATE_BACKEND):
+    """Создание хранилища состояний по имени бэкенда (memory или sqlite)"""
+    if backend == 'sqlite':
+        try:
+            return SQLiteStateStore()
+        except sqlite3.Error as e:
+            logger.error(f"Не удалось открыть {USER_STATE_DB_PATH}, состояния хранятся только в памяти: {e}")
+    elif backend != 'memory':
+        logger.warning(f"Неизвестное хранилище состояний {backend}, используется memory")
+    return MemoryStateStore()
+
+
+# Создание глобального хранилища состояний пользователей
+user_state_store = create_user_state_store()
+metrics.register_collector(user_state_store.collect_metrics)
+atexit.register(user_state_store.close)
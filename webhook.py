@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import hmac
+import json
+import threading
+import logging
+from flask import Blueprint, Flask, request, jsonify
+from telebot import types
+from config import (
+    WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_MAX_CONNECTIONS,
+    WEBHOOK_SUBMIT_TIMEOUT, WEBHOOK_RECORD_PATH
+)
+from metrics import instrument_app
+
+logger = logging.getLogger(__name__)
+
+
+class UpdateRecorder:
+    """Запись полученных обновлений в файл JSON lines для воспроизведения (replay_updates.py)"""
+    
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+    
+    def record(self, payload: str) -> None:
+        """Добавление обновления в файл одной строкой"""
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(payload.replace('\n', ' ') + '\n')
+
+
+def create_webhook_blueprint(dispatcher, path: str = WEBHOOK_PATH, secret: str = WEBHOOK_SECRET,
+                             submit_timeout: float = WEBHOOK_SUBMIT_TIMEOUT,
+                             record_path: str = WEBHOOK_RECORD_PATH) -> Blueprint:
+    """Blueprint с точкой приема обновлений Telegram
+    
+    Обновление сразу передается в очередь диспетчера, и Telegram получает ответ,
+    не дожидаясь обработки. Если очередь пользователя заполнена дольше submit_timeout,
+    возвращается 503 с Retry-After: Telegram повторит доставку позже, а сервер не
+    накапливает неограниченную очередь. Blueprint можно подключить к любому
+    Flask-приложению (app.register_blueprint), при подключении запускается и диспетчер.
+    """
+    blueprint = Blueprint('telegram_webhook', __name__)
+    recorder = UpdateRecorder(record_path) if record_path else None
+    # Потоки-обработчики запускаются один раз, при подключении blueprint к приложению
+    blueprint.record_once(lambda state: dispatcher.start())
+    
+    @blueprint.route(path, methods=['POST'])
+    def telegram_webhook():
+        """Прием одного обновления от Telegram"""
+        if secret and not hmac.compare_digest(
+            request.headers.get('X-Telegram-Bot-Api-Secret-Token', ''), secret
+        ):
+            return jsonify({'ok': False, 'error': 'forbidden'}), 403
+        
+        payload = request.get_data(as_text=True)
+        try:
+            update = types.Update.de_json(payload)
+        except (ValueError, KeyError, TypeError) as e:
+            logger.error(f"Некорректное обновление от Telegram: {e}")
+            return jsonify({'ok': False, 'error': 'bad update'}), 400
+        
+        if recorder:
+            recorder.record(payload)
+        
+        if not dispatcher.submit(update, timeout=submit_timeout):
+            logger.warning(f"Очередь обработки заполнена, обновление {update.update_id} отклонено")
+            return jsonify({'ok': False, 'error': 'busy'}), 503, {'Retry-After': '1'}
+        return jsonify({'ok': True})
+    
+    @blueprint.route(path + '/status', methods=['GET'])
+    def telegram_webhook_status():
+        """Состояние очередей обработки обновлений"""
+        return jsonify(dispatcher.get_metrics())
+    
+    return blueprint
+
+
+def set_webhook(bot, url: str = WEBHOOK_URL, path: str = WEBHOOK_PATH, secret: str = WEBHOOK_SECRET) -> bool:
+    """Регистрация адреса webhook в Telegram"""
+    if not url:
+        raise ValueError("Для режима webhook задайте WEBHOOK_URL (внешний https-адрес бота)")
+    return bot.set_webhook(
+        url=url.rstrip('/') + path,
+        secret_token=secret or None,
+        max_connections=WEBHOOK_MAX_CONNECTIONS,
+        drop_pending_updates=False,
+    )
+
+
+def run_webhook_server(bot, dispatcher, host: str = WEBHOOK_HOST, port: int = WEBHOOK_PORT) -> None:
+    """Отдельный HTTP-сервер приема обновлений (если бот не подключен к Flask-приложению)"""
+    app = Flask(__name__)
+    instrument_app(app, 'webhook')
+    app.register_blueprint(create_webhook_blueprint(dispatcher))
+    set_webhook(bot)
+    logger.info(f"Webhook бота слушает {host}:{port}{WEBHOOK_PATH}")
+    app.run(host=host, port=port, threaded=True)
+
+
+def load_updates(path: str) -> list:
+    """Чтение записанных обновлений: JSON lines или JSON-массив"""
+    with open(path, encoding='utf-8') as f:
+        content = f.read().strip()
+    if content.startswith('['):
+        return json.loads(content)
+    return [json.loads(line) for line in content.splitlines() if line.strip()]